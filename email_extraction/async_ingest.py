@@ -0,0 +1,133 @@
+"""
+Asyncio bulk ingestion with AsyncOpenSearch.
+
+Documents are read, decoded and packed into bulk chunks in a helper thread,
+so the JSON work overlaps with network I/O on the event loop. A bounded queue
+hands the chunks to N sender tasks that share one pooled AsyncOpenSearch
+client; when every sender is busy the reader waits, so memory stays flat.
+Chunk limits, the latency-adaptive byte cap and the retry of rejected items
+are the same as in bulk_ingest.py.
+
+Needs the async extra of opensearch-py: pip install "opensearch-py[async]"
+"""
+
+import asyncio
+
+from opensearchpy import AsyncOpenSearch
+from opensearchpy.exceptions import TransportError
+
+from bulk_ingest import BulkIngester, pack_chunks
+
+# Bulk requests in flight
+CONCURRENCY = 8
+
+
+def make_client(hosts, concurrency=CONCURRENCY, **kwargs):
+    """
+    AsyncOpenSearch client with one pooled connection per sender.
+
+    Args:
+        hosts: Hosts list as for OpenSearch(hosts=...)
+        concurrency: Bulk requests in flight
+        **kwargs: Further client options (use_ssl, http_auth, ...)
+    """
+    return AsyncOpenSearch(hosts=hosts, http_compress=True, maxsize=concurrency, **kwargs)
+
+
+class AsyncBulkIngester(BulkIngester):
+    """
+    BulkIngester running its requests as asyncio tasks.
+
+    Args:
+        client: AsyncOpenSearch client
+        concurrency: Bulk requests in flight
+        **limits: Chunk, retry and timeout options of BulkIngester
+    """
+
+    def __init__(self, client, concurrency=CONCURRENCY, **limits):
+        super().__init__(client, workers=concurrency, **limits)
+
+    async def send(self, chunk):
+        """
+        Send one chunk, retrying rejected items with exponential backoff.
+
+        Returns:
+            Tuple of (indexed count, list of failed items)
+        """
+        steps = self._send_steps(chunk)
+        try:
+            kind, arg = next(steps)
+            while True:
+                if kind == "sleep":
+                    await asyncio.sleep(arg)
+                    kind, arg = steps.send(None)
+                    continue
+                try:
+                    response = await self.client.bulk(body=arg, request_timeout=self.request_timeout)
+                except TransportError as e:
+                    kind, arg = steps.throw(e)
+                else:
+                    kind, arg = steps.send(response)
+        except StopIteration as finished:
+            return finished.value
+
+    async def bulk(self, actions):
+        """
+        Index a stream of actions with `workers` requests in flight.
+
+        If the reader or a sender fails, the other tasks are cancelled and the
+        error is raised, so nothing is left waiting on the queue.
+
+        Args:
+            actions: Iterable of helpers.bulk-style action dicts; it is consumed
+                in a helper thread, so it may read and decode files
+
+        Returns:
+            Tuple of (success count, list of failed items)
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=self.workers)
+        chunks = pack_chunks(actions, self.max_docs, self.chunk_size)
+
+        async def produce():
+            while True:
+                chunk = await loop.run_in_executor(None, next, chunks, None)
+                if chunk is None:
+                    break
+                await queue.put(chunk)
+            for _ in range(self.workers):
+                await queue.put(None)
+
+        async def consume():
+            while True:
+                chunk = await queue.get()
+                if chunk is None:
+                    return
+                ok, errors = await self.send(chunk)
+                self.success += ok
+                self.errors += errors
+
+        tasks = [asyncio.ensure_future(produce())] + [asyncio.ensure_future(consume())
+                                                      for _ in range(self.workers)]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        return self.success, self.errors
+
+
+async def ingest(client, actions, concurrency=CONCURRENCY, **limits):
+    """
+    Index actions with an AsyncBulkIngester and close the client afterwards.
+
+    Returns:
+        Tuple of (success count, list of failed items, stats dict)
+    """
+    ingester = AsyncBulkIngester(client, concurrency, **limits)
+    try:
+        success, errors = await ingester.bulk(actions)
+    finally:
+        await client.close()
+    return success, errors, ingester.stats()
@@ -0,0 +1,148 @@
+"""
+Single-pass, chunked digest engine for MIME attachments.
+
+Instead of materializing the decoded payload with get_payload(decode=True)
+and hashing it once per algorithm, the encoded payload is decoded
+(base64 / quoted-printable / 7bit / 8bit) in chunks and every requested
+digest is fed from the same memoryview of each chunk. For large payloads the
+digests are updated on threads; hashlib releases the GIL while hashing.
+"""
+
+import binascii
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_ALGORITHMS = ("md5", "sha256")
+
+# Encoded characters decoded per step
+CHUNK_SIZE = 1024 * 1024
+
+# Payloads at least this large (encoded) update their digests in parallel threads
+THREAD_THRESHOLD = 4 * 1024 * 1024
+DIGEST_THREADS = 4
+
+_B64_ALPHABET = b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/"
+_B64_JUNK = bytes(b for b in range(256) if b not in _B64_ALPHABET)
+
+_pool = None
+
+
+def _thread_pool():
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=DIGEST_THREADS, thread_name_prefix="digest")
+    return _pool
+
+
+def _to_bytes(text):
+    # same conversion email.message uses before decoding a payload
+    try:
+        return text.encode("ascii", "surrogateescape")
+    except UnicodeError:
+        return text.encode("raw-unicode-escape")
+
+
+def _iter_encoded_chunks(payload, chunk_size, split_on_newline=False):
+    start = 0
+    end = len(payload)
+    while start < end:
+        stop = min(start + chunk_size, end)
+        if split_on_newline and stop < end:
+            # quoted-printable soft breaks ("=\n") must not be split from their line
+            nl = payload.rfind("\n", start, stop)
+            if nl < start:
+                nl = payload.find("\n", stop)  # line longer than a chunk
+            stop = nl + 1 if nl >= 0 else end
+        yield _to_bytes(payload[start:stop])
+        start = stop
+
+
+def _iter_base64(payload, chunk_size):
+    carry = b""
+    for chunk in _iter_encoded_chunks(payload, chunk_size):
+        data = carry + chunk.translate(None, _B64_JUNK)
+        usable = len(data) - len(data) % 4
+        carry = data[usable:]
+        if usable:
+            yield binascii.a2b_base64(data[:usable])
+    if len(carry) > 1:
+        # missing padding at the very end, tolerated like email.message does
+        yield binascii.a2b_base64(carry + b"=" * (4 - len(carry)))
+
+
+def _iter_quoted_printable(payload, chunk_size):
+    for chunk in _iter_encoded_chunks(payload, chunk_size, split_on_newline=True):
+        yield binascii.a2b_qp(chunk)
+
+
+def iter_decoded_chunks(part, chunk_size=CHUNK_SIZE):
+    """
+    Decode a non-multipart MIME part's payload in chunks.
+
+    Args:
+        part: email.message.Message (non-multipart)
+        chunk_size: Encoded characters per chunk
+
+    Yields:
+        Decoded byte chunks, in order
+    """
+    payload = part.get_payload()
+    if isinstance(payload, bytes):
+        yield payload
+        return
+    if not isinstance(payload, str):
+        return
+
+    cte = str(part.get("content-transfer-encoding", "")).strip().lower()
+    if cte == "base64":
+        yield from _iter_base64(payload, chunk_size)
+    elif cte == "quoted-printable":
+        yield from _iter_quoted_printable(payload, chunk_size)
+    elif cte in ("", "7bit", "8bit", "binary"):
+        yield from _iter_encoded_chunks(payload, chunk_size)
+    else:
+        # x-uuencode and friends: rare, let the email package handle them
+        data = part.get_payload(decode=True)
+        if data:
+            yield data
+
+
+def digest_part(part, algorithms=DEFAULT_ALGORITHMS, chunk_size=CHUNK_SIZE, sink=None):
+    """
+    Compute the decoded size and all requested digests of a MIME part in one pass.
+
+    Args:
+        part: email.message.Message (non-multipart)
+        algorithms: hashlib algorithm names, e.g. ("md5", "sha1", "sha256")
+        chunk_size: Encoded characters decoded per step
+        sink: Optional binary file the decoded chunks are also written to
+
+    Returns:
+        Tuple of (size, {algorithm: hexdigest}); digests are empty for an empty payload
+    """
+    hashes = [hashlib.new(name) for name in algorithms]
+    payload = part.get_payload()
+    threaded = len(hashes) > 1 and isinstance(payload, (str, bytes)) and len(payload) >= THREAD_THRESHOLD
+    pool = _thread_pool() if threaded else None
+
+    size = 0
+    for chunk in iter_decoded_chunks(part, chunk_size):
+        if not chunk:
+            continue
+        view = memoryview(chunk)
+        size += len(view)
+        if pool is None:
+            for h in hashes:
+                h.update(view)
+            if sink is not None:
+                sink.write(view)
+        else:
+            futures = [pool.submit(h.update, view) for h in hashes]
+            if sink is not None:
+                sink.write(view)
+            for future in futures:
+                future.result()
+
+    if not size:
+        return 0, {}
+    return size, {name: h.hexdigest() for name, h in zip(algorithms, hashes)}
@@ -0,0 +1,124 @@
+"""
+Content-addressed on-disk store for attachment payloads.
+
+Every decoded payload is kept once under its SHA-256 (<root>/ab/<sha256>), no
+matter how many emails carry it. A small JSON index in the store root records,
+per digest, where the payload was first seen and how many times it occurred,
+so a campaign mailing the same PDF thousands of times costs one file on disk
+and one analysis.
+"""
+
+import json
+import os
+import tempfile
+
+from attachment_digest import digest_part, iter_decoded_chunks
+
+# Digest the store is keyed by
+STORE_DIGEST = "sha256"
+
+INDEX_FILE = "index.json"
+
+
+def blob_path(root, sha256):
+    """Path of the stored payload for a SHA-256 hex digest."""
+    return os.path.join(root, sha256[:2], sha256)
+
+
+def store_part(root, part, algorithms):
+    """
+    Decode, hash and store a MIME part's payload.
+
+    The payload is hashed first; only a digest that is not stored yet is
+    decoded a second time into a temporary file in the store and moved into
+    place under its SHA-256, so repeated attachments cost no disk writes.
+    Safe to call from several worker processes at once.
+
+    Args:
+        root: Store directory
+        part: email.message.Message (non-multipart)
+        algorithms: hashlib algorithm names to compute (sha256 is always added)
+
+    Returns:
+        Tuple of (size, {algorithm: hexdigest}, stored path relative to root or None)
+    """
+    if STORE_DIGEST not in algorithms:
+        algorithms = tuple(algorithms) + (STORE_DIGEST,)
+
+    size, digests = digest_part(part, algorithms)
+    if not size:
+        return 0, {}, None
+
+    path = blob_path(root, digests[STORE_DIGEST])
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=".incoming-", dir=root)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in iter_decoded_chunks(part):
+                    f.write(chunk)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    return size, digests, os.path.relpath(path, root)
+
+
+class AttachmentStore:
+    """
+    Occurrence index of a content-addressed attachment store.
+
+    Payload files are written by store_part() (possibly in worker processes);
+    the index is maintained by the single process that collects the email
+    records, via add_email() and save().
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.index_path = os.path.join(root, INDEX_FILE)
+        self.index = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path, encoding="utf-8") as f:
+                self.index = json.load(f)
+
+    def add_email(self, record):
+        """
+        Count the attachments of an email record in the index.
+
+        Args:
+            record: Email record from email_parsing
+
+        Returns:
+            List of SHA-256 digests seen for the first time (the ones that still need analysis)
+        """
+        new = []
+        for att in record.get("attachments", []):
+            sha256 = att.get(STORE_DIGEST)
+            if not sha256:
+                continue
+            entry = self.index.get(sha256)
+            if entry is None:
+                entry = self.index[sha256] = {
+                    "path": att.get("store_path"),
+                    "size": att.get("size"),
+                    "content_type": att.get("content_type"),
+                    "filename": att.get("filename"),
+                    "first_seen": record.get("capture_time") or record.get("date"),
+                    "first_message_id": record.get("message_id"),
+                    "count": 0,
+                }
+                new.append(sha256)
+            entry["count"] += 1
+        return new
+
+    def save(self):
+        """Write the index atomically."""
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.index, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.index_path)
+
+    def stats(self):
+        """Tuple of (unique payloads, total occurrences)."""
+        return len(self.index), sum(entry["count"] for entry in self.index.values())
@@ -270,7 +270,7 @@ for idx, row in df.iterrows():
         # Add action for bulk import
         action = {
             "index": {
-                "_index": "email-traffic",
+                "_index": "email-traffic-load",  # new generation (create_index.py)
                 "_id": f"record_{idx}"
             }
         }
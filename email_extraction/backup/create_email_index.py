@@ -1,11 +1,13 @@
 import requests
 import json
 
+from index_alias import create_generation, load_alias
+
 print("📦 Creating email content index in OpenSearch...")
 
 # OpenSearch connection
 OPENSEARCH_HOST = "http://localhost:9200"
-INDEX_NAME = "email-content"
+INDEX_NAME = "email-content"  # read alias; each run creates a new email-content-<timestamp> generation
 
 # Index mapping for email content
 index_mapping = {
@@ -100,25 +102,11 @@ index_mapping = {
 }
 
 try:
-    # Delete index if exists
-    response = requests.delete(f"{OPENSEARCH_HOST}/{INDEX_NAME}")
-    if response.status_code in [200, 404]:
-        print("✓ Cleaned existing index")
-    
-    # Create index
-    response = requests.put(
-        f"{OPENSEARCH_HOST}/{INDEX_NAME}",
-        headers={"Content-Type": "application/json"},
-        json=index_mapping,
-        timeout=30
-    )
-    
-    if response.status_code in [200, 201]:
-        print(f"✅ Index '{INDEX_NAME}' created successfully!")
-        print(f"   Response: {response.json()}")
-    else:
-        print(f"❌ Failed to create index: {response.status_code}")
-        print(f"   Error: {response.text}")
+    # New generation, written through the load alias; the read alias keeps
+    # serving the previous generation until the import publishes this one
+    index = create_generation(requests, OPENSEARCH_HOST, INDEX_NAME, index_mapping)
+    print(f"✅ Index '{index}' created successfully!")
+    print(f"   Load into '{load_alias(INDEX_NAME)}'; '{INDEX_NAME}' moves to it after the import")
         
 except Exception as e:
     print(f"❌ Error: {e}")
\ No newline at end of file
@@ -4,11 +4,29 @@ import os
 import time
 from datetime import datetime
 
+from index_alias import bulk_load_settings, load_alias, publish
+
 print("Importing data to OpenSearch...")
 
 OPENSEARCH_HOST = "http://localhost:9200"
 BULK_FILE = "bulk_import.json"
-INDEX_NAME = "email-traffic"
+INDEX_NAME = "email-traffic"  # read alias
+LOAD_ALIAS = load_alias(INDEX_NAME)  # generation created by create_index.py
+
+# Bulk-load mode (index_alias.bulk_load_settings): asynchronous translog fsync,
+# and force-merge to this many segments after the import (None = off)
+ASYNC_TRANSLOG = False
+FORCE_MERGE_SEGMENTS = None
+
+# Failed documents the new generation may have and still be published; above
+# this the read alias stays on the previous generation and the script exits 1
+MAX_FAILED_DOCS = 0
+
+# Documents rejected or lost in failed requests
+failed_docs = 0
+
+# One keep-alive connection pool for every request instead of a new connection each time
+session = requests.Session()
 
 # Check if file exists
 if not os.path.exists(BULK_FILE):
@@ -69,13 +87,14 @@ def import_in_chunks(file_path, chunk_size=10000):
 
 def import_chunk(chunk_lines, chunk_number):
     """Import a chunk of data"""
+    global failed_docs
     try:
         print(f"  Importing chunk {chunk_number} ({len(chunk_lines)//2} documents)...")
         
         # Create bulk data for this chunk
         bulk_data = '\n'.join(chunk_lines) + '\n'
         
-        response = requests.post(
+        response = session.post(
             f"{OPENSEARCH_HOST}/_bulk",
             headers={"Content-Type": "application/x-ndjson"},
             data=bulk_data,
@@ -86,55 +105,87 @@ def import_chunk(chunk_lines, chunk_number):
             result = response.json()
             if result.get('errors'):
                 errors = sum(1 for item in result.get('items', []) if 'error' in item.get('index', {}))
+                failed_docs += errors
                 if errors:
                     print(f"    ⚠️  Chunk {chunk_number} had {errors} errors")
             return len(result.get('items', []))
         else:
+            failed_docs += len(chunk_lines) // 2
             print(f"    ❌ Error in chunk {chunk_number}: {response.status_code}")
             return 0
             
     except Exception as e:
+        failed_docs += len(chunk_lines) // 2
         print(f"    ❌ Exception in chunk {chunk_number}: {e}")
         return 0
 
-try:
-    # Try importing in chunks
-    total_imported = import_in_chunks('bulk_import_fixed.json', chunk_size=5000)
+# Bulk-load mode: refresh and replicas off while importing, restored afterwards
+with bulk_load_settings(session, OPENSEARCH_HOST, LOAD_ALIAS, async_translog=ASYNC_TRANSLOG,
+                        force_merge_segments=FORCE_MERGE_SEGMENTS):
+    try:
+        # Try importing in chunks
+        total_imported = import_in_chunks('bulk_import_fixed.json', chunk_size=5000)
     
-    if total_imported > 0:
-        print(f"\n✅ Successfully imported {total_imported} documents!")
-    else:
-        print("\n⚠️  No documents were imported")
+        if total_imported > 0:
+            print(f"\n✅ Successfully imported {total_imported} documents!")
+        else:
+            print("\n⚠️  No documents were imported")
         
-except Exception as e:
-    print(f"\n❌ Error during import: {e}")
+    except Exception as e:
+        print(f"\n❌ Error during import: {e}")
     
-    # Try alternative method
-    print("\nTrying alternative import method...")
-    try:
-        # Read the entire file and send
-        with open('bulk_import_fixed.json', 'r', encoding='utf-8') as f:
-            bulk_data = f.read()
+        # Try alternative method
+        print("\nTrying alternative import method...")
+        failed_docs = 0  # everything is sent again
+        try:
+            # Read the entire file and send
+            with open('bulk_import_fixed.json', 'r', encoding='utf-8') as f:
+                bulk_data = f.read()
         
-        # Ensure it ends with newline
-        if not bulk_data.endswith('\n'):
-            bulk_data += '\n'
+            # Ensure it ends with newline
+            if not bulk_data.endswith('\n'):
+                bulk_data += '\n'
         
-        response = requests.post(
-            f"{OPENSEARCH_HOST}/_bulk",
-            headers={"Content-Type": "application/x-ndjson"},
-            data=bulk_data,
-            timeout=600  # 10 minutes timeout
-        )
+            response = session.post(
+                f"{OPENSEARCH_HOST}/_bulk",
+                headers={"Content-Type": "application/x-ndjson"},
+                data=bulk_data,
+                timeout=600  # 10 minutes timeout
+            )
         
-        if response.status_code == 200:
-            result = response.json()
-            print(f"✅ Imported {len(result.get('items', []))} documents")
-        else:
-            print(f"❌ Failed: {response.status_code} - {response.text[:200]}")
+            if response.status_code == 200:
+                result = response.json()
+                failed_docs = sum(1 for item in result.get('items', []) if 'error' in item.get('index', {}))
+                print(f"✅ Imported {len(result.get('items', []))} documents ({failed_docs} errors)")
+            else:
+                failed_docs = bulk_data.count('\n') // 2
+                print(f"❌ Failed: {response.status_code} - {response.text[:200]}")
             
-    except Exception as e2:
-        print(f"❌ Alternative method also failed: {e2}")
+        except Exception as e2:
+            failed_docs = max(failed_docs, 1)
+            print(f"❌ Alternative method also failed: {e2}")
+
+# Put the new generation live: warm it up, then move the read alias to it
+print("\n" + "="*50)
+print("🔀 Publishing new index generation...")
+published = False
+try:
+    session.post(f"{OPENSEARCH_HOST}/{LOAD_ALIAS}/_refresh", timeout=300)
+    response = session.get(f"{OPENSEARCH_HOST}/{LOAD_ALIAS}/_count", timeout=10)
+    if failed_docs > MAX_FAILED_DOCS:
+        print(f"❌ {failed_docs} documents failed (limit {MAX_FAILED_DOCS}); "
+              f"generation left unpublished, '{INDEX_NAME}' unchanged")
+    elif response.status_code == 200 and response.json().get('count', 0) > 0:
+        index, deleted = publish(session, OPENSEARCH_HOST, INDEX_NAME)
+        print(f"✅ '{INDEX_NAME}' -> '{index}'")
+        if deleted:
+            print(f"   Deleted old generations: {', '.join(deleted)}")
+        published = True
+    else:
+        print(f"⚠️  Nothing loaded into '{LOAD_ALIAS}'; '{INDEX_NAME}' unchanged")
+        published = True
+except Exception as e:
+    print(f"❌ Publish error: {e}")
 
 # Verify import
 print("\n" + "="*50)
@@ -144,14 +195,14 @@ try:
     time.sleep(2)
     
     # Get index count
-    response = requests.get(f"{OPENSEARCH_HOST}/{INDEX_NAME}/_count", timeout=10)
+    response = session.get(f"{OPENSEARCH_HOST}/{INDEX_NAME}/_count", timeout=10)
     if response.status_code == 200:
         count = response.json().get('count', 0)
         print(f"✅ Documents in index: {count}")
         
         # Get SMTP command distribution
         print("\n📊 Sample statistics:")
-        response = requests.post(
+        response = session.post(
             f"{OPENSEARCH_HOST}/{INDEX_NAME}/_search",
             json={
                 "size": 0,
@@ -191,4 +242,7 @@ print("2. Click 'Stack Management' -> 'Index Patterns'")
 print("3. Create index pattern: email-traffic")
 print("4. Time field: timestamp")
 print("5. Click 'Discover' to view data")
-print("6. Click 'Visualize' to create charts")
\ No newline at end of file
+print("6. Click 'Visualize' to create charts")
+
+if not published:
+    exit(1)
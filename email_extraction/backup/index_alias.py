@@ -0,0 +1,160 @@
+"""
+Timestamped index generations behind a read alias, over the REST API.
+
+create_index.py / create_email_index.py create a new generation
+(<alias>-<YYYYmmddHHMMSS>) and point a load alias (<alias>-load) at it; the
+import scripts write through the load alias while dashboards keep reading the
+previous generation through the read alias. After the import, publish()
+refreshes and warms up the new generation, moves the read alias to it in one
+atomic _aliases request and deletes the generations beyond RETENTION.
+Published generations are also kept behind <alias>-published; unpublished
+generations of failed imports do not count toward RETENTION and are deleted
+once a newer generation is live.
+
+bulk_load_settings() turns refresh and replicas off while the import runs and
+restores them afterwards, whether the import succeeded or not.
+"""
+
+import re
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# Generations kept, the live one included
+RETENTION = 2
+
+WARM_UP_QUERIES = [
+    {"query": {"match_all": {}}, "size": 10},
+    {"query": {"match_all": {}}, "size": 0, "track_total_hits": True},
+]
+
+# Index settings during an import: no periodic refresh, no replicas
+LOAD_SETTINGS = {"index.refresh_interval": "-1", "index.number_of_replicas": "0"}
+
+# Optional: fsync the translog in the background instead of on every request
+ASYNC_TRANSLOG_SETTINGS = {"index.translog.durability": "async"}
+
+
+def load_alias(alias):
+    return f"{alias}-load"
+
+
+def published_alias(alias):
+    return f"{alias}-published"
+
+
+def aliased_indices(http, host, alias):
+    """Indices an alias points to (empty if the alias does not exist)."""
+    response = http.get(f"{host}/_alias/{alias}", timeout=30)
+    if response.status_code == 404:
+        return []
+    response.raise_for_status()
+    return sorted(response.json())
+
+
+def generations(http, host, alias):
+    """Existing generations of alias, oldest first."""
+    pattern = re.compile(re.escape(alias) + r"-\d{14}$")
+    response = http.get(f"{host}/{alias}-*", params={"allow_no_indices": "true"}, timeout=30)
+    response.raise_for_status()
+    return sorted(name for name in response.json() if pattern.match(name))
+
+
+def create_generation(http, host, alias, body):
+    """
+    Create a new generation and move the load alias to it.
+
+    Args:
+        http: requests module or Session
+        host: OpenSearch URL, e.g. "http://localhost:9200"
+        alias: Read alias, e.g. "email-traffic"
+        body: Index settings and mappings
+
+    Returns:
+        Name of the created index
+    """
+    index = f"{alias}-{datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S')}"
+    response = http.put(f"{host}/{index}", json=body, timeout=30)
+    response.raise_for_status()
+
+    writer = load_alias(alias)
+    actions = [{"remove": {"index": old, "alias": writer}} for old in aliased_indices(http, host, writer)]
+    actions.append({"add": {"index": index, "alias": writer}})
+    response = http.post(f"{host}/_aliases", json={"actions": actions}, timeout=30)
+    response.raise_for_status()
+    return index
+
+
+def publish(http, host, alias, retention=RETENTION, queries=WARM_UP_QUERIES):
+    """
+    Put the generation behind the load alias live.
+
+    The generation is refreshed and warmed up, then one atomic _aliases
+    request moves the read alias to it, drops the load alias and removes a
+    legacy concrete index named like the read alias. Finally the oldest
+    published generations beyond retention, and unpublished ones older than
+    the new one, are deleted.
+
+    Returns:
+        Tuple of (published index, deleted index names)
+    """
+    writer = load_alias(alias)
+    loaded = aliased_indices(http, host, writer)
+    if len(loaded) != 1:
+        raise RuntimeError(f"Alias '{writer}' should point to one index, found {loaded}")
+    index = loaded[0]
+
+    http.post(f"{host}/{index}/_refresh", timeout=300).raise_for_status()
+    for query in queries:
+        http.post(f"{host}/{index}/_search", json=query, timeout=300).raise_for_status()
+
+    live = aliased_indices(http, host, alias)
+    actions = [{"remove": {"index": old, "alias": alias}} for old in live if old != index]
+    if not live and http.head(f"{host}/{alias}", timeout=30).status_code == 200:
+        actions.append({"remove_index": {"index": alias}})
+    actions.append({"remove": {"index": index, "alias": writer}})
+    actions.append({"add": {"index": index, "alias": alias}})
+    actions.append({"add": {"index": index, "alias": published_alias(alias)}})
+    http.post(f"{host}/_aliases", json={"actions": actions}, timeout=30).raise_for_status()
+
+    published = set(aliased_indices(http, host, published_alias(alias))) | {index}
+    older = [name for name in generations(http, host, alias) if name <= index]
+    kept = set([name for name in older if name in published][-max(retention, 1):]) | {index}
+    deleted = [name for name in older if name not in kept]
+    for name in deleted:
+        http.delete(f"{host}/{name}", timeout=60).raise_for_status()
+    return index, deleted
+
+
+@contextmanager
+def bulk_load_settings(http, host, index, async_translog=False, force_merge_segments=None):
+    """
+    Apply LOAD_SETTINGS to an index (or alias) for the duration of an import.
+
+    On success the index is refreshed and optionally force-merged; the
+    original settings are restored in every case (settings that were not set
+    are reset to the defaults).
+
+    Args:
+        http: requests module or Session
+        host: OpenSearch URL
+        index: Index or alias being loaded
+        async_translog: Also apply ASYNC_TRANSLOG_SETTINGS
+        force_merge_segments: Merge down to this many segments per shard
+            after the import (None = no force-merge)
+    """
+    overrides = dict(LOAD_SETTINGS, **(ASYNC_TRANSLOG_SETTINGS if async_translog else {}))
+    response = http.get(f"{host}/{index}/_settings/{','.join(overrides)}",
+                        params={"flat_settings": "true"}, timeout=30)
+    response.raise_for_status()
+    original = {name: {key: body["settings"].get(key) for key in overrides}
+                for name, body in response.json().items()}
+    http.put(f"{host}/{index}/_settings", json=overrides, timeout=30).raise_for_status()
+    try:
+        yield original
+        http.post(f"{host}/{index}/_refresh", timeout=300).raise_for_status()
+        if force_merge_segments:
+            http.post(f"{host}/{index}/_forcemerge", params={"max_num_segments": force_merge_segments},
+                      timeout=3600).raise_for_status()
+    finally:
+        for name, settings in original.items():
+            http.put(f"{host}/{name}/_settings", json=settings, timeout=30).raise_for_status()
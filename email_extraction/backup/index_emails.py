@@ -4,6 +4,8 @@ from datetime import datetime
 import os
 from email.utils import parsedate_to_datetime
 
+from index_alias import bulk_load_settings, load_alias, publish
+
 print("📤 Indexing emails to OpenSearch...")
 
 # Load parsed emails
@@ -20,100 +22,142 @@ print(f"Loaded {len(emails)} emails for indexing")
 
 # OpenSearch configuration
 OPENSEARCH_HOST = "http://localhost:9200"
-INDEX_NAME = "email-content"
+INDEX_NAME = "email-content"  # read alias
+LOAD_ALIAS = load_alias(INDEX_NAME)  # generation created by create_email_index.py
 BATCH_SIZE = 100  # Index in batches
 
+# Bulk-load mode (index_alias.bulk_load_settings): asynchronous translog fsync,
+# and force-merge to this many segments after the import (None = off)
+ASYNC_TRANSLOG = False
+FORCE_MERGE_SEGMENTS = None
+
+# Failed documents the new generation may have and still be published; above
+# this the read alias stays on the previous generation and the script exits 1
+MAX_FAILED_DOCS = 0
+
+# One keep-alive connection pool for every request instead of a new connection each time
+session = requests.Session()
+
 # Prepare bulk data
 bulk_data = []
 indexed_count = 0
+failed_docs = 0
 
-for i, email in enumerate(emails):
-    # Add analysis fields
-    email['has_attachments'] = len(email['attachments']) > 0
-    email['attachment_count'] = len(email['attachments'])
-    email['body_length'] = len(str(email['body']))
-    email['parsed_at'] = datetime.now().isoformat()
+# Bulk-load mode: refresh and replicas off while importing, restored afterwards
+with bulk_load_settings(session, OPENSEARCH_HOST, LOAD_ALIAS, async_translog=ASYNC_TRANSLOG,
+                        force_merge_segments=FORCE_MERGE_SEGMENTS):
+    for i, email in enumerate(emails):
+        # Add analysis fields
+        email['has_attachments'] = len(email['attachments']) > 0
+        email['attachment_count'] = len(email['attachments'])
+        email['body_length'] = len(str(email['body']))
+        email['parsed_at'] = datetime.now().isoformat()
     
-    # Clean up body if it's empty dict
-    if not email['body']:
-        email['body'] = {'text': ''}
+        # Clean up body if it's empty dict
+        if not email['body']:
+            email['body'] = {'text': ''}
     
-    # Create document ID
-    doc_id = email.get('email_hash', f"email_{i}")
+        # Create document ID
+        doc_id = email.get('email_hash', f"email_{i}")
 
-    # Normalize metadata.date to ISO-8601 or null so OpenSearch can parse it
-    try:
-        date_val = email.get('metadata', {}).get('date', '')
-        if date_val:
-            try:
-                dt = parsedate_to_datetime(date_val)
-                # convert to ISO format with offset if available
-                email['metadata']['date'] = dt.isoformat()
-            except Exception:
+        # Normalize metadata.date to ISO-8601 or null so OpenSearch can parse it
+        try:
+            date_val = email.get('metadata', {}).get('date', '')
+            if date_val:
+                try:
+                    dt = parsedate_to_datetime(date_val)
+                    # convert to ISO format with offset if available
+                    email['metadata']['date'] = dt.isoformat()
+                except Exception:
+                    email['metadata']['date'] = None
+            else:
                 email['metadata']['date'] = None
-        else:
-            email['metadata']['date'] = None
-    except Exception:
-        email.setdefault('metadata', {})['date'] = None
+        except Exception:
+            email.setdefault('metadata', {})['date'] = None
     
-    # Add to bulk data
-    bulk_data.append(json.dumps({"index": {"_index": INDEX_NAME, "_id": doc_id}}))
-    bulk_data.append(json.dumps(email, ensure_ascii=False))
+        # Add to bulk data
+        bulk_data.append(json.dumps({"index": {"_index": LOAD_ALIAS, "_id": doc_id}}))
+        bulk_data.append(json.dumps(email, ensure_ascii=False))
     
-    # Send batch
-    if len(bulk_data) >= BATCH_SIZE * 2 or i == len(emails) - 1:
-        try:
-            bulk_payload = '\n'.join(bulk_data) + '\n'
+        # Send batch
+        if len(bulk_data) >= BATCH_SIZE * 2 or i == len(emails) - 1:
+            try:
+                bulk_payload = '\n'.join(bulk_data) + '\n'
             
-            response = requests.post(
-                f"{OPENSEARCH_HOST}/_bulk",
-                headers={"Content-Type": "application/x-ndjson"},
-                data=bulk_payload.encode('utf-8'),
-                timeout=60
-            )
+                response = session.post(
+                    f"{OPENSEARCH_HOST}/_bulk",
+                    headers={"Content-Type": "application/x-ndjson"},
+                    data=bulk_payload.encode('utf-8'),
+                    timeout=60
+                )
             
-            if response.status_code == 200:
-                result = response.json()
-                if result.get('errors'):
-                    items = result.get('items', [])
-                    # collect items that contain errors
-                    error_items = [item for item in items if 'error' in item.get('index', {})]
-                    error_count = len(error_items)
-                    if error_count:
-                        print(f"⚠️  Batch {i//BATCH_SIZE + 1} had {error_count} errors")
-                        print("Sample errors (up to 5):")
-                        for ei in error_items[:5]:
-                            try:
-                                print(json.dumps(ei, ensure_ascii=False))
-                            except Exception:
-                                print(str(ei))
-                        # show a snippet of the raw response to aid debugging
-                        print("Response snippet:", response.text[:1000])
+                if response.status_code == 200:
+                    result = response.json()
+                    if result.get('errors'):
+                        items = result.get('items', [])
+                        # collect items that contain errors
+                        error_items = [item for item in items if 'error' in item.get('index', {})]
+                        error_count = len(error_items)
+                        failed_docs += error_count
+                        if error_count:
+                            print(f"⚠️  Batch {i//BATCH_SIZE + 1} had {error_count} errors")
+                            print("Sample errors (up to 5):")
+                            for ei in error_items[:5]:
+                                try:
+                                    print(json.dumps(ei, ensure_ascii=False))
+                                except Exception:
+                                    print(str(ei))
+                            # show a snippet of the raw response to aid debugging
+                            print("Response snippet:", response.text[:1000])
+                    else:
+                        indexed_count += len(bulk_data) // 2
+                        print(f"✅ Batch {i//BATCH_SIZE + 1}: Indexed {len(bulk_data)//2} emails")
                 else:
-                    indexed_count += len(bulk_data) // 2
-                    print(f"✅ Batch {i//BATCH_SIZE + 1}: Indexed {len(bulk_data)//2} emails")
-            else:
-                print(f"❌ Batch {i//BATCH_SIZE + 1} failed: {response.status_code}")
-                print(f"   Error: {response.text[:200]}")
+                    failed_docs += len(bulk_data) // 2
+                    print(f"❌ Batch {i//BATCH_SIZE + 1} failed: {response.status_code}")
+                    print(f"   Error: {response.text[:200]}")
         
-        except Exception as e:
-            print(f"❌ Error in batch {i//BATCH_SIZE + 1}: {e}")
+            except Exception as e:
+                failed_docs += len(bulk_data) // 2
+                print(f"❌ Error in batch {i//BATCH_SIZE + 1}: {e}")
         
-        bulk_data = []
+            bulk_data = []
 
 print(f"\n🎉 Indexing complete!")
 print(f"Total emails indexed: {indexed_count}")
+print(f"Failed emails: {failed_docs}")
+
+# Put the new generation live: warm it up, then move the read alias to it
+print("\n🔀 Publishing new index generation...")
+published = False
+try:
+    session.post(f"{OPENSEARCH_HOST}/{LOAD_ALIAS}/_refresh", timeout=300)
+    response = session.get(f"{OPENSEARCH_HOST}/{LOAD_ALIAS}/_count", timeout=10)
+    if failed_docs > MAX_FAILED_DOCS:
+        print(f"❌ {failed_docs} documents failed (limit {MAX_FAILED_DOCS}); "
+              f"generation left unpublished, '{INDEX_NAME}' unchanged")
+    elif response.status_code == 200 and response.json().get('count', 0) > 0:
+        index, deleted = publish(session, OPENSEARCH_HOST, INDEX_NAME)
+        print(f"✅ '{INDEX_NAME}' -> '{index}'")
+        if deleted:
+            print(f"   Deleted old generations: {', '.join(deleted)}")
+        published = True
+    else:
+        print(f"⚠️  Nothing loaded into '{LOAD_ALIAS}'; '{INDEX_NAME}' unchanged")
+        published = True
+except Exception as e:
+    print(f"❌ Publish error: {e}")
 
 # Verify indexing
 print(f"\n🔍 Verifying index...")
 try:
-    response = requests.get(f"{OPENSEARCH_HOST}/{INDEX_NAME}/_count", timeout=10)
+    response = session.get(f"{OPENSEARCH_HOST}/{INDEX_NAME}/_count", timeout=10)
     if response.status_code == 200:
         count = response.json().get('count', 0)
         print(f"✅ Documents in index: {count}")
         
         # Get sample data
-        response = requests.get(
+        response = session.get(
             f"{OPENSEARCH_HOST}/{INDEX_NAME}/_search?size=1",
             timeout=10
         )
@@ -131,4 +175,7 @@ except Exception as e:
     print(f"❌ Verification error: {e}")
 
 print(f"\nAccess OpenSearch: http://localhost:5601")
-print(f"Index: {INDEX_NAME}")
\ No newline at end of file
+print(f"Index: {INDEX_NAME}")
+
+if not published:
+    exit(1)
\ No newline at end of file
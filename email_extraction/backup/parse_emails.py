@@ -117,20 +117,22 @@ def parse_email_file(eml_path, file_id):
                 
                 # Attachments
                 elif part.get_filename():
+                    # Decode once; size and hashes all come from the same bytes
+                    try:
+                        content = part.get_payload(decode=True) or b''
+                    except:
+                        content = b''
+                    
                     attachment = {
                         'filename': part.get_filename(),
                         'content_type': content_type,
-                        'size': len(part.get_payload(decode=True)) if part.get_payload() else 0
+                        'size': len(content)
                     }
                     
                     # Calculate hash
-                    try:
-                        content = part.get_payload(decode=True)
-                        if content:
-                            attachment['md5'] = hashlib.md5(content).hexdigest()
-                            attachment['sha256'] = hashlib.sha256(content).hexdigest()
-                    except:
-                        pass
+                    if content:
+                        attachment['md5'] = hashlib.md5(content).hexdigest()
+                        attachment['sha256'] = hashlib.sha256(content).hexdigest()
                     
                     email_data['attachments'].append(attachment)
         else:
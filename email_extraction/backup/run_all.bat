@@ -42,7 +42,7 @@ echo Steps to create visualizations:
 echo   1. Click "Analytics" -> "Visualize"
 echo   2. Click "Create visualization"
 echo   3. Select chart type (Pie, Line, etc.)
-echo   4. Select index pattern: email-traffic*
+echo   4. Select index pattern: email-traffic
 echo   5. Configure as shown below
 echo.
 echo Press any key to continue...
@@ -0,0 +1,90 @@
+"""
+Benchmark html_text.html_to_text against the BeautifulSoup get_text() path
+build_final_json_1.py used before.
+
+Uses the HTML bodies from EMAILS_JSON when it exists, otherwise a synthetic
+spam-like corpus. BeautifulSoup (pip install beautifulsoup4) is only needed
+for the comparison column.
+"""
+
+import os
+import time
+
+from html_text import html_to_text
+from record_io import iter_records
+
+EMAILS_JSON = r"D:\Opensearch\Open-Search-Data-Intelligence\email_extraction\emails.ndjson"
+
+# Synthetic corpus size when EMAILS_JSON is not available
+SYNTHETIC_BODIES = 2000
+
+ROUNDS = 3
+
+# Bodies that once broke the extractor; always part of the corpus and checked
+# for non-empty output
+EDGE_CASES = [
+    # </head> omitted (allowed by HTML, common in mail bodies)
+    "<html><head><title>Hi</title><body><p>Pay now &amp; win</p></body></html>",
+]
+
+
+def synthetic_bodies(n):
+    row = "<tr><td style='color:red'>Offer &amp; discount &#8364;%d</td><td><a href='#'>click</a></td></tr>"
+    for i in range(n):
+        yield (
+            "<html><head><style>td {font: 12px}</style><script>var x = 1;</script></head>"
+            f"<body><div><p>Dear customer {i},</p><table>"
+            + "".join(row % j for j in range(50 + i % 200))
+            + "</table><br/>Unsubscribe</div></body></html>"
+        )
+
+
+def load_bodies():
+    if os.path.exists(EMAILS_JSON):
+        bodies = [e["body_html"] for e in iter_records(EMAILS_JSON) if e.get("body_html")]
+        if bodies:
+            return bodies + EDGE_CASES, EMAILS_JSON
+    return list(synthetic_bodies(SYNTHETIC_BODIES)) + EDGE_CASES, "synthetic"
+
+
+def soup_to_text(html):
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(html, "html.parser").get_text()
+
+
+def best_time(convert, bodies):
+    best = None
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        for body in bodies:
+            convert(body)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    bodies, source = load_bodies()
+    total_mb = sum(len(b) for b in bodies) / 1e6
+    print(f"{len(bodies)} HTML bodies, {total_mb:.1f} MB ({source}), best of {ROUNDS}")
+
+    for body in EDGE_CASES:
+        if not html_to_text(body):
+            print(f"  WARNING: no text extracted from edge case {body[:60]!r}")
+
+    engines = [("html_text", html_to_text)]
+    try:
+        import bs4  # noqa: F401
+        engines.append(("BeautifulSoup", soup_to_text))
+    except ImportError:
+        print("BeautifulSoup not installed; skipping the comparison")
+
+    baseline = None
+    for name, convert in engines:
+        elapsed = best_time(convert, bodies)
+        baseline = baseline or elapsed
+        print(f"  {name:<14} {elapsed:8.3f} s  {total_mb / elapsed:7.1f} MB/s  x{elapsed / baseline:.2f}")
+
+
+if __name__ == "__main__":
+    main()
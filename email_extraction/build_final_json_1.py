@@ -1,50 +1,130 @@
-import json
-import ipaddress
-from bs4 import BeautifulSoup
 import re
 
+from cgnat_index import load_or_build as load_cgnat_index
+from email_parsing import parse_parallel
+from flow_join import FlowIndex
+from geoip_index import load_or_build as load_geoip_index
+from html_text import html_to_text
+from ip_enrichment import IpClassifier
+from radius_index import load_or_build as load_radius_index
+from record_io import iter_records, write_records
+
 BASE = r"D:\Opensearch\Open-Search-Data-Intelligence\email_extraction"
-EMAILS_JSON = f"{BASE}\\emails.json"
-NETWORK_JSON = f"{BASE}\\network_flows.json"
-OUT_JSON = f"{BASE}\\final_emails.json"
+EMAILS_JSON = f"{BASE}\\emails.ndjson"
+NETWORK_JSON = f"{BASE}\\network_flows.ndjson"
+# NDJSON; end in .gz to compress, or in .json for a pretty-printed array (export only)
+OUT_JSON = f"{BASE}\\final_emails.ndjson"
+
+# CGNAT translation logs (CSV, .gz allowed; columns in cgnat_index.COLUMNS)
+# used to fill correlation.cgnat. Empty = no CGNAT correlation. They are
+# compiled into CGNAT_INDEX on first use (and again when the set of logs changes).
+CGNAT_LOGS = []
+CGNAT_INDEX = f"{BASE}\\cgnat_translations.idx"
+
+# RADIUS accounting files (FreeRADIUS detail or CSV, .gz allowed) used to fill
+# correlation.radius. They are compiled into RADIUS_INDEX on first use (and
+# whenever the set of files changes); later runs just memory-map the index.
+RADIUS_LOGS = []
+RADIUS_INDEX = f"{BASE}\\radius_sessions.idx"
+
+# Our own address ranges, tagged as network.*.category ("customer" / "mx");
+# RFC 1918, 100.64/10 (cgnat) and other special ranges are built in.
+CUSTOMER_RANGES = []
+MX_RANGES = []
+
+# Local IP range -> ASN / country tables (iptoasn.com ip2asn-v4.tsv, or CSV with
+# the columns in geoip_index.COLUMNS; .gz allowed) used to fill network.*.asn,
+# as_org and country. Compiled into GEOIP_INDEX like the RADIUS index.
+# Empty = no GeoIP enrichment.
+GEOIP_RANGES = []
+GEOIP_INDEX = f"{BASE}\\geoip_ranges.idx"
+
+# Documents are GeoIP-annotated in batches of this many (one vectorized
+# binary search per batch when numpy is installed)
+GEOIP_BATCH = 4096
+
+# HTML bodies are converted to text in this many worker processes
+# (1 = in this process; html_text.py is fast enough for most captures)
+HTML_WORKERS = 1
 
 HTML_TAG_RE = re.compile(r"<[^>]+>")
 
-def html_to_text(html):
-    soup = BeautifulSoup(html, "html.parser")
-    return soup.get_text()
-
 def looks_like_html(text):
-    if not text:
+    if not text or "<" not in text:
         return False
     return bool(HTML_TAG_RE.search(text))
 
-def is_private(ip):
-    try:
-        return ipaddress.ip_address(ip).is_private
-    except Exception:
-        return None
-
-emails = json.load(open(EMAILS_JSON, encoding="utf-8"))
-flows = json.load(open(NETWORK_JSON, encoding="utf-8"))
-
-OUT = []
+def with_text_body(email):
+    """
+    Fill body_text from HTML where the extractor could not provide plain text.
 
-for i, email in enumerate(emails):
-    net = flows[i] if i < len(flows) else {}
+    Args:
+        email: emails.ndjson record
 
+    Returns:
+        The record, or a copy with body_text replaced
+    """
     body_text = email.get("body_text")
     body_html = email.get("body_html")
 
     # CASE 1: body_text exists but is actually HTML garbage
     if body_text and looks_like_html(body_text):
-        body_text = html_to_text(body_text)
+        return dict(email, body_text=html_to_text(body_text))
 
     # CASE 2: body_text missing but body_html exists
-    elif not body_text and body_html:
-        body_text = html_to_text(body_html)
-
-    OUT.append({
+    if not body_text and body_html:
+        return dict(email, body_text=html_to_text(body_html))
+
+    return email
+
+def endpoint(classifier, ip, port):
+    category, private = classifier.classify(ip)
+    return {
+        "ip": ip,
+        "port": port,
+        "is_private": private,
+        "category": category,
+        "asn": None,
+        "as_org": None,
+        "country": None
+    }
+
+def annotate_geo(documents, geo):
+    """
+    Fill network.source/destination asn, as_org and country for a batch of documents.
+
+    Args:
+        documents: List of final documents (updated in place)
+        geo: geoip_index.GeoIndex
+    """
+    endpoints = [doc["network"][side] for doc in documents for side in ("source", "destination")]
+    for ep, match in zip(endpoints, geo.lookup_many([ep["ip"] for ep in endpoints])):
+        if match is not None:
+            ep.update(match)
+
+def build_document(email, net, classifier, cgnat=None, radius=None):
+    """
+    Build one final_emails record from an email and its network flow.
+
+    Args:
+        email: emails.ndjson record, after with_text_body()
+        net: network_flows.ndjson record ({} if none)
+        classifier: ip_enrichment.IpClassifier
+        cgnat: Optional cgnat_index.CgnatIndex
+        radius: Optional radius_index.RadiusIndex
+
+    Returns:
+        Final document dict
+    """
+    cgnat_match = {"matched": False}
+    if cgnat is not None and net:
+        cgnat_match = cgnat.correlate(net)
+
+    radius_match = {"session_found": False}
+    if radius is not None and net:
+        radius_match = radius.correlate(net, cgnat_match)
+
+    return {
         "timestamp": email.get("date"),
 
         "email": {
@@ -58,22 +138,14 @@ for i, email in enumerate(emails):
             "message_id": email.get("message_id"),
             "subject": email.get("subject"),
             "content_type": "multipart",
-            "body_text": body_text,
-            "body_html": body_html
+            "body_text": email.get("body_text"),
+            "body_html": email.get("body_html")
         },
 
         "network": {
             "protocol": net.get("protocol"),
-            "source": {
-                "ip": net.get("src_ip"),
-                "port": net.get("src_port"),
-                "is_private": is_private(net.get("src_ip"))
-            },
-            "destination": {
-                "ip": net.get("dst_ip"),
-                "port": net.get("dst_port"),
-                "is_private": is_private(net.get("dst_ip"))
-            }
+            "source": endpoint(classifier, net.get("src_ip"), net.get("src_port")),
+            "destination": endpoint(classifier, net.get("dst_ip"), net.get("dst_port"))
         },
 
         # ✅ SMTP command lines / request/response fields
@@ -94,12 +166,79 @@ for i, email in enumerate(emails):
         "attachments": email.get("attachments", []),
 
         "correlation": {
-            "cgnat": {"matched": False},
-            "radius": {"session_found": False}
+            "cgnat": cgnat_match,
+            "radius": radius_match
         }
-    })
-
-with open(OUT_JSON, "w", encoding="utf-8") as f:
-    json.dump(OUT, f, indent=2, ensure_ascii=False)
-
-print(f"Final dataset ready → {OUT_JSON}")
+    }
+
+def iter_documents(emails, flows, classifier=None, cgnat=None, radius=None, html_workers=1, geo=None):
+    """
+    Join every email to the flow of its SMTP session and yield the final documents.
+
+    Flows are indexed once (flow_join.FlowIndex); emails are streamed.
+
+    Args:
+        emails: Iterable of email records
+        flows: Iterable of flow records
+        classifier: ip_enrichment.IpClassifier (defaults to the built-in ranges)
+        cgnat: Optional cgnat_index.CgnatIndex for correlation.cgnat
+        radius: Optional radius_index.RadiusIndex for correlation.radius
+        html_workers: Processes converting HTML bodies (order is preserved)
+        geo: Optional geoip_index.GeoIndex for network.*.asn / country
+
+    Yields:
+        Final document dicts
+    """
+    index = FlowIndex(flows)
+    classifier = classifier or IpClassifier()
+    if html_workers == 1:
+        emails = map(with_text_body, emails)
+    else:
+        emails = parse_parallel(with_text_body, emails, workers=html_workers)
+    batch = []
+    for email in emails:
+        net = index.match(email) or {}
+        document = build_document(email, net, classifier, cgnat, radius)
+        if geo is None:
+            yield document
+            continue
+        batch.append(document)
+        if len(batch) >= GEOIP_BATCH:
+            annotate_geo(batch, geo)
+            yield from batch
+            batch = []
+    if batch:
+        annotate_geo(batch, geo)
+        yield from batch
+
+def main():
+    classifier = IpClassifier({"customer": CUSTOMER_RANGES, "mx": MX_RANGES})
+
+    cgnat = None
+    if CGNAT_LOGS:
+        cgnat = load_cgnat_index(CGNAT_LOGS, CGNAT_INDEX)
+        print(f"Loaded {len(cgnat)} CGNAT translations from {CGNAT_INDEX}")
+
+    radius = None
+    if RADIUS_LOGS:
+        radius = load_radius_index(RADIUS_LOGS, RADIUS_INDEX)
+        print(f"Loaded {len(radius)} RADIUS sessions from {RADIUS_INDEX}")
+
+    geo = None
+    if GEOIP_RANGES:
+        geo = load_geoip_index(GEOIP_RANGES, GEOIP_INDEX)
+        print(f"Loaded {len(geo)} GeoIP ranges from {GEOIP_INDEX}")
+
+    documents = iter_documents(iter_records(EMAILS_JSON), iter_records(NETWORK_JSON),
+                               classifier, cgnat, radius, HTML_WORKERS, geo)
+    count = write_records(OUT_JSON, documents)
+    if cgnat is not None:
+        cgnat.close()
+    if radius is not None:
+        radius.close()
+    if geo is not None:
+        geo.close()
+    print(f"Final dataset ready → {OUT_JSON} ({count} documents)")
+
+if __name__ == "__main__":
+    main()
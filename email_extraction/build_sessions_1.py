@@ -0,0 +1,25 @@
+"""
+Build one document per SMTP conversation from the per-frame network flows.
+
+Reads network_flows.ndjson (from extract_network_1.py, extract_all_1.py or
+extract_sharded_1.py) and writes smtp_sessions.ndjson: timings, byte counts,
+envelope sender/recipients and reply codes per session, typically 10-50x fewer
+documents than frames.
+"""
+
+from record_io import iter_records, write_records
+from smtp_sessions import iter_sessions
+
+BASE = r"D:\Opensearch\Open-Search-Data-Intelligence\email_extraction"
+NETWORK_JSON = f"{BASE}\\network_flows.ndjson"
+# NDJSON; end in .gz to compress, or in .json for a pretty-printed array (export only)
+OUT_JSON = f"{BASE}\\smtp_sessions.ndjson"
+
+
+def main():
+    count = write_records(OUT_JSON, iter_sessions(iter_records(NETWORK_JSON)))
+    print(f"Built {count} SMTP sessions → {OUT_JSON}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,373 @@
+"""
+Parallel, size-aware bulk indexing for OpenSearch.
+
+Actions are serialized once and packed into _bulk requests capped by both
+document count and request bytes (emails with big HTML bodies vary wildly in
+size). Several worker threads keep requests in flight, and the reader only
+runs a bounded number of chunks ahead of them, so memory stays flat. Items the
+cluster rejects with 429 (or 502/503/504) are retried with exponential
+backoff and jitter instead of being dropped. Observed bulk latency is fed
+back into the byte cap: it shrinks when requests get slow or rejected and
+grows again while the cluster keeps up.
+
+bulk_load_settings() relaxes the target index for the duration of a load (no
+periodic refresh, no replicas, optionally asynchronous translog fsync) and
+restores its own settings afterwards, whether the load succeeded or not.
+"""
+
+import json
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+
+from opensearchpy.exceptions import ConnectionError as OpenSearchConnectionError, TransportError
+
+# Concurrent bulk requests
+WORKERS = 4
+
+# Chunk limits: documents per request, and request size (adaptive between MIN and MAX)
+MAX_CHUNK_DOCS = 2000
+MAX_CHUNK_BYTES = 16 * 1024 * 1024
+MIN_CHUNK_BYTES = 512 * 1024
+
+# Bulk latency (seconds) the byte cap is steered towards
+TARGET_LATENCY = 2.0
+
+# Retries of rejected items / failed requests, with exponential backoff (seconds)
+MAX_RETRIES = 8
+INITIAL_BACKOFF = 0.5
+MAX_BACKOFF = 60.0
+RETRY_STATUSES = {429, 502, 503, 504}
+
+REQUEST_TIMEOUT = 120
+
+# Index settings during a bulk load: no periodic refresh, no replicas (they
+# are rebuilt once from the finished segments instead of indexing every
+# document twice)
+LOAD_SETTINGS = {"index.refresh_interval": "-1", "index.number_of_replicas": "0"}
+
+# Optional: fsync the translog in the background instead of on every bulk
+# request (a node crash may lose the last few seconds of the load)
+ASYNC_TRANSLOG_SETTINGS = {"index.translog.durability": "async"}
+
+FORCE_MERGE_TIMEOUT = 3600
+
+
+def serialize_action(action):
+    """
+    Serialize a helpers.bulk-style action into its _bulk lines.
+
+    Args:
+        action: Dict with _index, optional _id and _op_type ("index" by
+            default; "create", "update" or "delete") and _source (for
+            "update", the update body, e.g. {"doc": ..., "doc_as_upsert": True})
+
+    Returns:
+        Tuple of (ndjson bytes, metadata dict {op_type: {_index, _id}})
+    """
+    op_type = action.get("_op_type", "index")
+    meta = {"_index": action["_index"]}
+    if action.get("_id") is not None:
+        meta["_id"] = action["_id"]
+    lines = json.dumps({op_type: meta}, ensure_ascii=False) + "\n"
+    if op_type != "delete":
+        lines += json.dumps(action["_source"], ensure_ascii=False) + "\n"
+    return lines.encode("utf-8"), {op_type: meta}
+
+
+class AdaptiveChunkSize:
+    """
+    Request byte cap steered by observed bulk latency (thread-safe).
+
+    Rejections or latency above the target halve the cap; latency well under
+    the target grows it by a quarter, within [min_bytes, max_bytes].
+    """
+
+    def __init__(self, max_bytes=MAX_CHUNK_BYTES, min_bytes=MIN_CHUNK_BYTES, target_latency=TARGET_LATENCY):
+        self.max_bytes = max_bytes
+        self.min_bytes = min(min_bytes, max_bytes)
+        self.target_latency = target_latency
+        self.limit = max_bytes
+        self._lock = threading.Lock()
+
+    def observe(self, latency, rejected=False):
+        with self._lock:
+            if rejected or latency > self.target_latency:
+                self.limit = max(self.min_bytes, self.limit // 2)
+            elif latency < self.target_latency / 2:
+                self.limit = min(self.max_bytes, int(self.limit * 1.25))
+
+
+def backoff_delay(attempt, initial=INITIAL_BACKOFF, maximum=MAX_BACKOFF):
+    """Retry delay (seconds) for a 0-based attempt: exponential, capped, with jitter."""
+    return min(maximum, initial * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+
+def pack_chunks(actions, max_docs, chunk_size):
+    """
+    Serialize actions and pack them into chunks under the current limits.
+
+    Args:
+        actions: Iterable of action dicts (see serialize_action())
+        max_docs: Documents per chunk
+        chunk_size: AdaptiveChunkSize whose current limit caps the chunk bytes
+
+    Yields:
+        Lists of (ndjson bytes, metadata) entries
+    """
+    chunk = []
+    size = 0
+    for action in actions:
+        entry = serialize_action(action)
+        if chunk and (len(chunk) >= max_docs or size + len(entry[0]) > chunk_size.limit):
+            yield chunk
+            chunk = []
+            size = 0
+        chunk.append(entry)
+        size += len(entry[0])
+    if chunk:
+        yield chunk
+
+
+def failed_item(entry, status, error):
+    """Failure report for an entry whose whole request failed, shaped like a bulk response item."""
+    (op_type, meta), = entry[1].items()
+    return {op_type: dict(meta, status=status, error=error)}
+
+
+def is_retryable(error):
+    """True for request errors worth retrying (connection problems, 429, 502-504)."""
+    return isinstance(error, OpenSearchConnectionError) or error.status_code in RETRY_STATUSES
+
+
+def split_response(pending, response, can_retry, skip_statuses=()):
+    """
+    Sort the items of a bulk response.
+
+    Args:
+        pending: Entries sent, in request order
+        response: Bulk response body
+        can_retry: Whether rejected items may still be retried
+        skip_statuses: Statuses that are expected outcomes rather than
+            failures, e.g. 409 for "create" of a document that already exists
+
+    Returns:
+        Tuple of (indexed count, skipped count, entries to retry, failed items)
+    """
+    ok = 0
+    skipped = 0
+    retry = []
+    errors = []
+    for entry, item in zip(pending, response["items"]):
+        (op_type, result), = item.items()
+        status = result.get("status", 500)
+        if status < 300:
+            ok += 1
+        elif status in skip_statuses:
+            skipped += 1
+        elif status in RETRY_STATUSES and can_retry:
+            retry.append(entry)
+        else:
+            errors.append(item)
+    return ok, skipped, retry, errors
+
+
+class BulkIngester:
+    """
+    Concurrent bulk indexer with backpressure and retry.
+
+    Args:
+        client: opensearchpy.OpenSearch client (shared by the worker threads)
+        workers: Concurrent bulk requests
+        max_docs: Documents per request
+        max_bytes: Largest request size
+        min_bytes: Smallest request size the adaptive cap may shrink to
+        target_latency: Bulk latency (seconds) the request size is steered towards
+        max_retries: Retries per chunk before items are reported as failed
+        initial_backoff: First retry delay (seconds), doubled on every retry
+        max_backoff: Retry delay ceiling (seconds)
+        request_timeout: Timeout of one bulk request (seconds)
+        skip_statuses: Item statuses counted as skipped instead of failed
+            (e.g. {409} when creating documents that may already exist)
+    """
+
+    def __init__(self, client, workers=WORKERS, max_docs=MAX_CHUNK_DOCS, max_bytes=MAX_CHUNK_BYTES,
+                 min_bytes=MIN_CHUNK_BYTES, target_latency=TARGET_LATENCY, max_retries=MAX_RETRIES,
+                 initial_backoff=INITIAL_BACKOFF, max_backoff=MAX_BACKOFF, request_timeout=REQUEST_TIMEOUT,
+                 skip_statuses=()):
+        self.client = client
+        self.workers = workers
+        self.max_docs = max_docs
+        self.chunk_size = AdaptiveChunkSize(max_bytes, min_bytes, target_latency)
+        self.max_retries = max_retries
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.request_timeout = request_timeout
+        self.skip_statuses = frozenset(skip_statuses)
+
+        self.success = 0
+        self.skipped = 0
+        self.errors = []
+        self.requests = 0
+        self.retries = 0
+        self.busy_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def _send_steps(self, chunk):
+        """
+        Send/retry loop of one chunk, with the I/O left to the caller.
+
+        Shared by send() here and in AsyncBulkIngester, which only differ in
+        how they make a request and wait. Yields ("bulk", body) for a request,
+        expecting its response to be sent in (or its TransportError thrown
+        in), and ("sleep", seconds) for a backoff.
+
+        Returns:
+            Tuple of (indexed count, list of failed items)
+        """
+        pending = chunk
+        ok = 0
+        errors = []
+        attempt = 0
+        while pending:
+            start = time.monotonic()
+            try:
+                response = yield "bulk", b"".join(e[0] for e in pending)
+            except TransportError as e:
+                self._record(time.monotonic() - start, rejected=True)
+                if is_retryable(e) and attempt < self.max_retries:
+                    self._record_retry(len(pending))
+                    yield "sleep", backoff_delay(attempt, self.initial_backoff, self.max_backoff)
+                    attempt += 1
+                    continue
+                errors += [failed_item(entry, e.status_code, str(e)) for entry in pending]
+                break
+
+            latency = time.monotonic() - start
+            done, skipped, retry, failed = split_response(pending, response, attempt < self.max_retries,
+                                                          self.skip_statuses)
+            ok += done
+            self._record_skipped(skipped)
+            errors += failed
+            self._record(latency, rejected=bool(retry))
+            if retry:
+                self._record_retry(len(retry))
+                yield "sleep", backoff_delay(attempt, self.initial_backoff, self.max_backoff)
+                attempt += 1
+            pending = retry
+        return ok, errors
+
+    def send(self, chunk):
+        """
+        Send one chunk, retrying rejected items with exponential backoff.
+
+        Returns:
+            Tuple of (indexed count, list of failed items)
+        """
+        steps = self._send_steps(chunk)
+        try:
+            kind, arg = next(steps)
+            while True:
+                if kind == "sleep":
+                    time.sleep(arg)
+                    kind, arg = steps.send(None)
+                    continue
+                try:
+                    response = self.client.bulk(body=arg, request_timeout=self.request_timeout)
+                except TransportError as e:
+                    kind, arg = steps.throw(e)
+                else:
+                    kind, arg = steps.send(response)
+        except StopIteration as finished:
+            return finished.value
+
+    def _record(self, latency, rejected):
+        self.chunk_size.observe(latency, rejected)
+        with self._lock:
+            self.requests += 1
+            self.busy_seconds += latency
+
+    def _record_skipped(self, items):
+        with self._lock:
+            self.skipped += items
+
+    def _record_retry(self, items):
+        with self._lock:
+            self.retries += items
+
+    def _collect(self, futures):
+        for future in futures:
+            ok, errors = future.result()
+            self.success += ok
+            self.errors += errors
+
+    def bulk(self, actions):
+        """
+        Index a stream of actions.
+
+        At most 2 * workers chunks are in flight; the reader blocks until one
+        completes, whichever it is, so a slow request never stalls the others.
+
+        Args:
+            actions: Iterable of helpers.bulk-style action dicts
+
+        Returns:
+            Tuple of (success count, list of failed items), like helpers.bulk
+        """
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            in_flight = set()
+            for chunk in pack_chunks(actions, self.max_docs, self.chunk_size):
+                if len(in_flight) >= 2 * self.workers:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    self._collect(done)
+                in_flight.add(pool.submit(self.send, chunk))
+            done, _ = wait(in_flight)
+            self._collect(done)
+        return self.success, self.errors
+
+    def stats(self):
+        """Request count, skipped and retried items, mean latency and the final byte cap."""
+        return {
+            "requests": self.requests,
+            "skipped_items": self.skipped,
+            "retried_items": self.retries,
+            "mean_latency": round(self.busy_seconds / self.requests, 3) if self.requests else None,
+            "chunk_bytes": self.chunk_size.limit,
+        }
+
+
+@contextmanager
+def bulk_load_settings(client, index, async_translog=False, force_merge_segments=None):
+    """
+    Apply LOAD_SETTINGS to an index for the duration of a bulk load.
+
+    On success the index is refreshed and optionally force-merged. The
+    original settings are restored in every case, also when the load raises
+    or is interrupted; settings that were not set on the index are reset to
+    the cluster defaults.
+
+    Args:
+        client: opensearchpy.OpenSearch client
+        index: Index (or alias) being loaded
+        async_translog: Also apply ASYNC_TRANSLOG_SETTINGS
+        force_merge_segments: Merge down to this many segments per shard
+            after the load (None = no force-merge)
+
+    Yields:
+        Dict of the original settings by index name
+    """
+    overrides = dict(LOAD_SETTINGS, **(ASYNC_TRANSLOG_SETTINGS if async_translog else {}))
+    current = client.indices.get_settings(index=index, name=",".join(overrides), flat_settings=True)
+    original = {name: {key: body["settings"].get(key) for key in overrides} for name, body in current.items()}
+    client.indices.put_settings(index=index, body=overrides)
+    try:
+        yield original
+        client.indices.refresh(index=index)
+        if force_merge_segments:
+            client.indices.forcemerge(index=index, max_num_segments=force_merge_segments,
+                                      request_timeout=FORCE_MERGE_TIMEOUT)
+    finally:
+        for name, settings in original.items():
+            client.indices.put_settings(index=name, body=settings)
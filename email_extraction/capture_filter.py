@@ -0,0 +1,201 @@
+"""
+Extraction filters pushed down into the capture readers.
+
+A CaptureFilter describes the slice of a capture an investigation needs: a
+time range, hosts (IPs or CIDRs), ports and envelope addresses (MAIL FROM /
+RCPT TO). It is compiled into a tshark display filter, so tshark drops the
+other frames before any field is printed or object exported, or into a
+predicate the native reader applies to TCP segments before reassembly.
+
+Envelope addresses are a property of an SMTP session rather than of a frame,
+so they take a cheap first pass: the sessions whose MAIL FROM / RCPT TO
+mention an address are found first (tcp.stream numbers for tshark, connection
+4-tuples for the native reader), and the real pass is restricted to those.
+"""
+
+import ipaddress
+from functools import lru_cache
+
+from cgnat_index import to_epoch
+from flow_records import DISPLAY_FILTER, tshark_fields_args
+from pcap_reader import connection_key, iter_tcp_segments
+
+# Display filter that matches no frame (frame numbers start at 1)
+MATCH_NOTHING = "frame.number == 0"
+
+ENVELOPE_VERBS = (b"mail from", b"rcpt to")
+
+
+def _time_bound(value):
+    """Epoch seconds of a start/end bound (see cgnat_index.to_epoch()); an unparseable bound is an error."""
+    t = to_epoch(value)
+    if t is None and value not in (None, ""):
+        raise ValueError(f"Invalid time bound: {value!r}")
+    return t
+
+
+def _quote(value):
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+class CaptureFilter:
+    """
+    Time range, host, port and envelope address filter for extraction.
+
+    Every criterion left empty matches everything; the criteria that are set
+    must all match.
+
+    Args:
+        start: Earliest frame time (epoch seconds, datetime or ISO 8601 string)
+        end: Latest frame time
+        hosts: IPs or CIDRs; a frame matches if its source or destination is in one
+        ports: TCP ports; a frame matches if its source or destination port is one
+        addresses: Envelope addresses or fragments (e.g. "@example.com"),
+            matched case-insensitively against MAIL FROM / RCPT TO
+    """
+
+    def __init__(self, start=None, end=None, hosts=(), ports=(), addresses=()):
+        self.start = _time_bound(start)
+        self.end = _time_bound(end)
+        self.networks = [ipaddress.ip_network(h.strip(), strict=False) for h in hosts]
+        self.ports = sorted({int(p) for p in ports})
+        self.addresses = [a.strip().lower() for a in addresses if a.strip()]
+        self._host_match = lru_cache(maxsize=65536)(self._in_networks)
+
+    def __repr__(self):
+        # stable; used in manifest stage keys
+        return (f"CaptureFilter(start={self.start!r}, end={self.end!r}, "
+                f"hosts={[str(n) for n in self.networks]!r}, ports={self.ports!r}, "
+                f"addresses={self.addresses!r})")
+
+    def __bool__(self):
+        return bool(self.start is not None or self.end is not None
+                    or self.networks or self.ports or self.addresses)
+
+    # -----------------------------------------------------------------------
+    # tshark
+    # -----------------------------------------------------------------------
+
+    def _clauses(self):
+        clauses = []
+        if self.start is not None:
+            clauses.append(f"frame.time_epoch >= {self.start:.6f}")
+        if self.end is not None:
+            clauses.append(f"frame.time_epoch <= {self.end:.6f}")
+        if self.networks:
+            clauses.append("(" + " || ".join(
+                f"{'ip' if net.version == 4 else 'ipv6'}.addr == {net}" for net in self.networks
+            ) + ")")
+        if self.ports:
+            clauses.append("tcp.port in {" + " ".join(map(str, self.ports)) + "}")
+        return clauses
+
+    def envelope_display_filter(self, base=DISPLAY_FILTER):
+        """Display filter of the first pass: frames whose MAIL FROM / RCPT TO mention an address."""
+        mentions = " || ".join(f"lower(smtp.req.parameter) contains {_quote(a)}" for a in self.addresses)
+        return " && ".join([f"({base})"] + self._clauses() + [f"({mentions})"])
+
+    def display_filter(self, base=DISPLAY_FILTER, streams=None):
+        """
+        Compile the filter into a tshark display filter.
+
+        Args:
+            base: Filter the criteria are added to (None = criteria only)
+            streams: tcp.stream numbers from the envelope pass (None = no restriction)
+
+        Returns:
+            Display filter string, or base unchanged when nothing is filtered
+        """
+        clauses = self._clauses()
+        if streams is not None:
+            if not streams:
+                return MATCH_NOTHING
+            clauses.append("tcp.stream in {" + " ".join(map(str, sorted(streams))) + "}")
+        if not clauses:
+            return base
+        if base:
+            clauses.insert(0, f"({base})")
+        return " && ".join(clauses)
+
+    def tshark_display_filter(self, iter_lines, base=DISPLAY_FILTER):
+        """
+        Display filter for a capture, running the envelope pass if addresses are set.
+
+        Args:
+            iter_lines: Callable running tshark with the given arguments (everything
+                but the binary and -r) and returning its output lines, e.g.
+                TsharkCache(...).iter_lines bound to the capture
+            base: Filter the criteria are added to (None = criteria only)
+
+        Returns:
+            Display filter string
+        """
+        streams = None
+        if self.addresses:
+            args = tshark_fields_args(["tcp.stream"], display_filter=self.envelope_display_filter())
+            streams = {int(line) for line in iter_lines(args) if line.strip().isdigit()}
+        return self.display_filter(base, streams)
+
+    # -----------------------------------------------------------------------
+    # Native reader
+    # -----------------------------------------------------------------------
+
+    def _in_networks(self, ip):
+        addr = ipaddress.ip_address(ip)
+        return any(addr in net for net in self.networks)
+
+    def _endpoint_match(self, seg):
+        if self.ports and seg.src_port not in self.ports and seg.dst_port not in self.ports:
+            return False
+        if self.networks:
+            return self._host_match(seg.src_ip) or self._host_match(seg.dst_ip)
+        return True
+
+    def _envelope_connections(self, path):
+        found = set()
+        for seg in iter_tcp_segments(path):
+            if not seg.payload or not self._endpoint_match(seg):
+                continue
+            payload = seg.payload.lower()
+            if any(verb in payload for verb in ENVELOPE_VERBS) and any(
+                a.encode("utf-8") in payload for a in self.addresses
+            ):
+                found.add(connection_key(seg))
+        return found
+
+    def segment_prefilter(self, path):
+        """
+        Predicate over TcpSegments for pcap_reader's prefilter argument.
+
+        Hosts and ports are checked per segment (they match both directions of
+        a connection alike). The time range admits connections whose first
+        segment falls inside it, then follows them to their end, so a message
+        is never cut in half. Envelope addresses take one extra pass over path.
+
+        Args:
+            path: Capture file the predicate will be used on
+
+        Returns:
+            Callable(seg) -> bool, or None when nothing is filtered
+        """
+        if not self:
+            return None
+        allowed = self._envelope_connections(path) if self.addresses else None
+        admitted = set()
+        start = float("-inf") if self.start is None else self.start
+        end = float("inf") if self.end is None else self.end
+
+        def prefilter(seg):
+            if not self._endpoint_match(seg):
+                return False
+            key = connection_key(seg)
+            if allowed is not None and key not in allowed:
+                return False
+            if key in admitted:
+                return True
+            if start <= seg.timestamp <= end:
+                admitted.add(key)
+                return True
+            return False
+
+        return prefilter
@@ -0,0 +1,373 @@
+"""
+CGNAT translation lookup for correlating flows to subscribers.
+
+Local CGNAT log files (CSV, optionally gzip-compressed) describe which
+subscriber held which public IP and port block, from which private address,
+and when. They are loaded into two compact interval indexes held in parallel
+arrays: one keyed by public IP + port block, one by private IP, and sorted
+once (by numpy when it is installed, without a Python object per row). A
+lookup of (ip, port, time) is a few bisects. With an index path the sorted
+columns are written to a memory-mapped file (column_index.py), so later runs
+open it instantly until the set of log files changes.
+"""
+
+import csv
+import ipaddress
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+
+from column_index import ColumnFile, StringTable, build_if_stale, write_columns
+from ip_enrichment import default_classifier
+from record_io import open_text
+
+try:
+    import numpy as np
+except ImportError:  # build() falls back to a Python sort
+    np = None
+
+MAGIC = b"CGNIDX01"
+
+# CSV column names (override to match the CGNAT platform's export)
+COLUMNS = {
+    "start": "start",
+    "end": "end",
+    "private_ip": "private_ip",
+    "private_port": "private_port",
+    "public_ip": "public_ip",
+    "port_start": "public_port_start",
+    "port_end": "public_port_end",
+    "public_port": "public_port",  # used when the log has one port per row instead of a block
+    "subscriber": "subscriber_id",
+}
+
+# Open-ended translations (no end time) are treated as lasting until this time
+OPEN_END = float("inf")
+
+# ip_enrichment categories of address space that only exists behind the NAT:
+# RFC 1918 and the RFC 6598 shared space (100.64.0.0/10) CGNAT normally uses
+INSIDE_CATEGORIES = {"private", "cgnat"}
+
+
+def to_epoch(value):
+    """
+    Epoch seconds from a number, a datetime or an ISO 8601 string.
+
+    Also used by capture_filter, so filter time bounds and log times are read
+    the same way.
+
+    Returns:
+        Float, or None if the value is empty or invalid
+    """
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if isinstance(value, (int, float)):
+        return float(value)
+    value = (value or "").strip()
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+
+def ipv4_int(value):
+    """IPv4 address as an int, or None (IPv6 and garbage are not indexed)."""
+    try:
+        addr = ipaddress.ip_address((value or "").strip())
+    except ValueError:
+        return None
+    return int(addr) if addr.version == 4 else None
+
+
+def is_inside_address(ip):
+    """True for addresses that only exist behind the NAT (RFC 1918 and 100.64/10)."""
+    return default_classifier().category(ip) in INSIDE_CATEGORIES
+
+
+def _sort_order(keys, starts):
+    """Row order by (key, start)."""
+    if np is not None:
+        return np.lexsort((np.frombuffer(starts, dtype=np.float64), np.frombuffer(keys, dtype=np.uint64)))
+    # two stable passes: one key object per row, no tuples
+    order = sorted(range(len(keys)), key=starts.__getitem__)
+    order.sort(key=keys.__getitem__)
+    return order
+
+
+def _take(column, order):
+    """column reordered by order, as an array of the same type."""
+    if np is not None:
+        taken = array(column.typecode)
+        taken.frombytes(np.frombuffer(column, dtype=column.typecode)[order].tobytes())
+        return taken
+    return array(column.typecode, (column[i] for i in order))
+
+
+def _prefix_max_hi(keys, port_hi):
+    """Highest port_hi of each entry's IP up to and including the entry (keys sorted)."""
+    if np is not None and len(keys):
+        # offset every port by its IP so one running maximum never crosses IPs
+        base = (np.frombuffer(keys, dtype=np.uint64) >> np.uint64(16)) << np.uint64(16)
+        running = np.maximum.accumulate(base + np.frombuffer(port_hi, dtype=np.uint16))
+        max_hi = array("H")
+        max_hi.frombytes((running - base).astype(np.uint16).tobytes())
+        return max_hi
+    max_hi = array("H")
+    ip = None
+    for key, hi in zip(keys, port_hi):
+        if key >> 16 != ip:
+            ip, best = key >> 16, hi
+        else:
+            best = max(best, hi)
+        max_hi.append(best)
+    return max_hi
+
+
+class IntervalIndex:
+    """
+    Sorted (ip, port block, time interval) -> row index, in parallel columns.
+
+    Entries are sorted by (ip, port_lo, start). Blocks of one IP are assumed
+    not to overlap at any given time, but the block layout may change over
+    time, so a port can fall into an earlier, wider block than the last one
+    starting at or below it; max_hi (the highest port_hi of the IP so far)
+    bounds how far back a lookup has to look.
+
+    Args:
+        columns: Column arrays or memoryviews in COLUMN_FORMATS order, as
+            from columns() (None = empty, to be filled with add() + build())
+    """
+
+    # keys (ip << 16 | port_lo), port_hi, max_hi, starts, ends, rows
+    COLUMN_FORMATS = ("Q", "H", "H", "d", "d", "I")
+
+    def __init__(self, columns=None):
+        if columns is None:
+            columns = [array(fmt) for fmt in self.COLUMN_FORMATS]
+        self.keys, self.port_hi, self.max_hi, self.starts, self.ends, self.rows = columns
+
+    def columns(self):
+        return [self.keys, self.port_hi, self.max_hi, self.starts, self.ends, self.rows]
+
+    def add(self, ip, port_lo, port_hi, start, end, row):
+        self.keys.append(ip << 16 | port_lo)
+        self.port_hi.append(port_hi)
+        self.starts.append(start)
+        self.ends.append(end)
+        self.rows.append(row)
+
+    def build(self):
+        """Sort the entries by (ip, port block, start); call once after the last add()."""
+        order = _sort_order(self.keys, self.starts)
+        self.keys = _take(self.keys, order)
+        self.port_hi = _take(self.port_hi, order)
+        self.starts = _take(self.starts, order)
+        self.ends = _take(self.ends, order)
+        self.rows = _take(self.rows, order)
+        self.max_hi = _prefix_max_hi(self.keys, self.port_hi)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def lookup(self, ip, port, t):
+        """
+        Row of the translation covering ip:port at time t.
+
+        Walks back over the IP's port blocks starting at or below port, one
+        bisect on time per block, until no earlier block reaches port.
+
+        Returns:
+            Row index, or None
+        """
+        idx = bisect_right(self.keys, ip << 16 | port) - 1
+        while idx >= 0 and self.keys[idx] >> 16 == ip and self.max_hi[idx] >= port:
+            # entries of this block are contiguous and sorted by start time
+            lo = bisect_left(self.keys, self.keys[idx], 0, idx)
+            j = bisect_right(self.starts, t, lo, idx + 1) - 1
+            if j >= lo and self.ends[j] >= t and self.port_hi[j] >= port:
+                return self.rows[j]
+            idx = lo - 1
+        return None
+
+
+class CgnatIndex:
+    """
+    Public- and private-side indexes over CGNAT translation logs.
+
+    Built in memory from the logs, or opened from a file written by write()
+    (see open() and load_or_build()).
+
+    Args:
+        paths: CGNAT log files (CSV, .gz allowed)
+        columns: Column name mapping (defaults to COLUMNS)
+    """
+
+    # public and private IntervalIndex columns, then per-row public IPs,
+    # private IPs, private ports and subscriber indexes
+    COLUMN_FORMATS = IntervalIndex.COLUMN_FORMATS * 2 + ("I", "I", "i", "I")
+
+    def __init__(self, paths, columns=None):
+        self.columns = dict(COLUMNS, **(columns or {}))
+        self.public = IntervalIndex()
+        self.private = IntervalIndex()
+        # per-row details, kept as compact arrays + an interned subscriber table
+        self.public_ips = array("I")
+        self.private_ips = array("I")
+        self.private_ports = array("i")
+        self.subscriber_ids = array("I")
+        self._strings = StringTable()
+        self.skipped = 0
+        self._file = None
+
+        for path in paths:
+            self._load(path)
+        self.public.build()
+        self.private.build()
+        self._subscriber = self._strings.strings.__getitem__
+
+    @classmethod
+    def open(cls, path):
+        """Memory-map an index file written by write()."""
+        index = cls.__new__(cls)
+        index._file = ColumnFile(path, MAGIC, cls.COLUMN_FORMATS, "CGNAT")
+        columns = index._file.columns
+        n = len(IntervalIndex.COLUMN_FORMATS)
+        index.public = IntervalIndex(columns[:n])
+        index.private = IntervalIndex(columns[n:2 * n])
+        index.public_ips, index.private_ips, index.private_ports, index.subscriber_ids = columns[2 * n:]
+        index.skipped = None
+        index._subscriber = index._file.string
+        return index
+
+    def write(self, path):
+        """Write the built index to a file (column_index.py layout)."""
+        columns = (self.public.columns() + self.private.columns()
+                   + [self.public_ips, self.private_ips, self.private_ports, self.subscriber_ids])
+        write_columns(path, MAGIC, len(self), columns, self._strings.strings)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+    def _load(self, path):
+        c = self.columns
+        with open_text(path) as f:
+            for line in csv.DictReader(f):
+                public_ip = ipv4_int(line.get(c["public_ip"]))
+                private_ip = ipv4_int(line.get(c["private_ip"]))
+                start = to_epoch(line.get(c["start"]))
+                if public_ip is None or private_ip is None or start is None:
+                    self.skipped += 1
+                    continue
+                end = to_epoch(line.get(c["end"]))
+                end = OPEN_END if end is None else end
+
+                port_lo = _port(line.get(c["port_start"]))
+                if port_lo is None:
+                    port_lo = _port(line.get(c["public_port"]))
+                port_hi = _port(line.get(c["port_end"]))
+                if port_lo is None:
+                    port_lo, port_hi = 0, 65535  # whole address translated
+                elif port_hi is None:
+                    port_hi = port_lo
+                private_port = _port(line.get(c["private_port"]))
+
+                sub_idx = self._strings.intern((line.get(c["subscriber"]) or "").strip())
+
+                row = len(self.public_ips)
+                self.public_ips.append(public_ip)
+                self.private_ips.append(private_ip)
+                self.private_ports.append(-1 if private_port is None else private_port)
+                self.subscriber_ids.append(sub_idx)
+
+                self.public.add(public_ip, port_lo, port_hi, start, end, row)
+                if private_port is None:
+                    self.private.add(private_ip, 0, 65535, start, end, row)
+                else:
+                    self.private.add(private_ip, private_port, private_port, start, end, row)
+
+    def __len__(self):
+        return len(self.public_ips)
+
+    def _row(self, row):
+        private_port = self.private_ports[row]
+        return {
+            "subscriber_id": self._subscriber(self.subscriber_ids[row]) or None,
+            "public_ip": str(ipaddress.IPv4Address(self.public_ips[row])),
+            "private_ip": str(ipaddress.IPv4Address(self.private_ips[row])),
+            "private_port": None if private_port < 0 else private_port,
+        }
+
+    def lookup(self, ip, port, t):
+        """
+        Find the translation an address was part of at time t.
+
+        Inside addresses (RFC 1918, 100.64/10) are looked up on the private
+        side, anything else on the public side by IP and port.
+
+        Args:
+            ip: IPv4 address string
+            port: TCP port (may be None for private-side lookups)
+            t: Epoch seconds
+
+        Returns:
+            Translation dict (subscriber_id, public_ip, private_ip, private_port), or None
+        """
+        ip_int = ipv4_int(ip)
+        if ip_int is None or t is None:
+            return None
+        if is_inside_address(ip):
+            row = self.private.lookup(ip_int, port or 0, t)
+        elif port is None:
+            return None
+        else:
+            row = self.public.lookup(ip_int, port, t)
+        return None if row is None else self._row(row)
+
+    def correlate(self, flow):
+        """
+        The correlation.cgnat block for a flow: source endpoint first, then destination.
+
+        Args:
+            flow: Flow record (src_ip/src_port/dst_ip/dst_port/timestamp)
+
+        Returns:
+            Dict with matched=True and the translation, or {"matched": False}
+        """
+        t = flow.get("timestamp")
+        for side, ip_field, port_field in (("source", "src_ip", "src_port"), ("destination", "dst_ip", "dst_port")):
+            match = self.lookup(flow.get(ip_field), flow.get(port_field), t)
+            if match is not None:
+                return dict(matched=True, side=side, **match)
+        return {"matched": False}
+
+
+def _port(value):
+    try:
+        port = int((value or "").strip())
+    except ValueError:
+        return None
+    return port if 0 <= port <= 65535 else None
+
+
+def load_or_build(log_paths, index_path, columns=None):
+    """
+    Open the index, rebuilding it first if the set of CGNAT logs changed
+    (see column_index.build_if_stale()).
+
+    Args:
+        log_paths: CGNAT log files (CSV, .gz allowed)
+        index_path: Index file
+        columns: Column name mapping (defaults to COLUMNS)
+
+    Returns:
+        CgnatIndex
+    """
+    build_if_stale(index_path, log_paths, lambda path: CgnatIndex(log_paths, columns).write(path))
+    return CgnatIndex.open(index_path)
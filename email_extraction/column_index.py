@@ -0,0 +1,174 @@
+"""
+Memory-mapped column files shared by the lookup indexes.
+
+An index file is a fixed header (magic, byte order flag, row count, string
+count) followed by typed columns of one value per row, each 8-byte aligned
+and in host byte order, then the string offsets (uint64, count + 1) and the
+UTF-8 string blob that string columns index into. Opening a file just
+memory-maps it and casts memoryviews over the columns, so a large index is
+ready instantly and bisect / numpy work on it directly.
+
+Every index is compiled from input files; the (path, size, mtime) of those
+inputs is kept in a sidecar file (<index>.inputs), and build_if_stale()
+rebuilds the index when that set changes in any way.
+"""
+
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+# magic, byte order flag, row count, string count
+HEADER = struct.Struct("<8sBxxxxxxxQQ")
+
+INPUTS_SUFFIX = ".inputs"
+
+
+class StringTable:
+    """Interned strings for a string column; index 0 is the first string added."""
+
+    def __init__(self):
+        self.strings = []
+        self._idx = {}
+
+    def intern(self, value):
+        idx = self._idx.get(value)
+        if idx is None:
+            idx = self._idx[value] = len(self.strings)
+            self.strings.append(value)
+        return idx
+
+    def __len__(self):
+        return len(self.strings)
+
+
+def _pad8(f):
+    f.write(b"\0" * (-f.tell() % 8))
+
+
+def write_columns(path, magic, rows, columns, strings=()):
+    """
+    Write a column file (replaced atomically).
+
+    Args:
+        path: Index file path
+        magic: 8-byte file type tag
+        rows: Row count (the length of every column)
+        columns: Arrays, one value per row, in the order ColumnFile reads them
+        strings: Strings the string columns index into (StringTable.strings)
+    """
+    blob = bytearray()
+    offsets = array("Q", [0])
+    for value in strings:
+        blob += value.encode("utf-8")
+        offsets.append(len(blob))
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(magic, sys.byteorder == "little", rows, len(offsets) - 1))
+        for column in list(columns) + [offsets]:
+            _pad8(f)
+            column.tofile(f)
+        f.write(blob)
+    os.replace(tmp_path, path)
+
+
+class ColumnFile:
+    """
+    Read-only, memory-mapped column file.
+
+    Args:
+        path: File written by write_columns()
+        magic: Expected file type tag
+        formats: array/struct type codes of the columns, in write order
+        label: Index name used in error messages, e.g. "RADIUS"
+
+    Attributes:
+        columns: memoryviews over the columns, in write order
+    """
+
+    def __init__(self, path, magic, formats, label="column"):
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        found, little, n, n_strings = HEADER.unpack_from(self._mm, 0)
+        if found != magic:
+            raise ValueError(f"Not a {label} index: {path}")
+        if bool(little) != (sys.byteorder == "little"):
+            raise ValueError(f"{label} index {path} was built on a host with a different byte order")
+
+        self.rows = n
+        self._view = view = memoryview(self._mm)
+        offset = HEADER.size
+        columns = []
+        for fmt, count in [(fmt, n) for fmt in formats] + [("Q", n_strings + 1)]:
+            offset += -offset % 8
+            size = struct.calcsize(fmt) * count
+            columns.append(view[offset:offset + size].cast(fmt))
+            offset += size
+        *self.columns, self._offsets = columns
+        self._blob_offset = offset
+
+    def string(self, idx):
+        """String idx of the string table; "" comes back as None."""
+        start = self._blob_offset + self._offsets[idx]
+        end = self._blob_offset + self._offsets[idx + 1]
+        return self._mm[start:end].decode("utf-8") or None
+
+    def close(self):
+        for col in self.columns + [self._offsets]:
+            col.release()
+        self._view.release()
+        self._mm.close()
+        self._file.close()
+
+
+# ---------------------------------------------------------------------------
+# Rebuilding on input changes
+# ---------------------------------------------------------------------------
+
+def input_signature(paths):
+    """(absolute path, size, mtime_ns) of every input file, in a stable order."""
+    signature = []
+    for p in sorted(os.path.abspath(p) for p in paths):
+        st = os.stat(p)
+        signature.append([p, st.st_size, st.st_mtime_ns])
+    return signature
+
+
+def _read_signature(index_path):
+    try:
+        with open(index_path + INPUTS_SUFFIX, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def build_if_stale(index_path, input_paths, build):
+    """
+    Rebuild an index unless it was built from exactly these input files.
+
+    A file added, removed, or differing in size or mtime (also an older copy
+    put back) triggers a rebuild.
+
+    Args:
+        index_path: Index file
+        input_paths: Files the index is compiled from
+        build: Callable(index_path) writing the index
+
+    Returns:
+        True if the index was rebuilt
+    """
+    signature = input_signature(input_paths)
+    if os.path.exists(index_path) and _read_signature(index_path) == signature:
+        return False
+    # no sidecar while building, so an interrupted build is never taken as current
+    if os.path.exists(index_path + INPUTS_SUFFIX):
+        os.remove(index_path + INPUTS_SUFFIX)
+    build(index_path)
+    tmp_path = index_path + INPUTS_SUFFIX + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(signature, f)
+    os.replace(tmp_path, index_path + INPUTS_SUFFIX)
+    return True
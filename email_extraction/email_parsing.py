@@ -0,0 +1,310 @@
+"""
+MIME parsing shared by the extraction scripts.
+
+Turns one raw RFC 5322 message (bytes or a file) into the email record written
+to emails.ndjson: headers, plain/HTML bodies and attachment metadata. In
+headers-only mode parsing stops at the end of the header block and the record
+carries just the header fields; the full record can be built later from the
+same bytes with parse_email_bytes().
+"""
+
+import mimetypes
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from email import policy
+from email.parser import BytesParser, BytesHeaderParser
+from email.header import decode_header, make_header
+
+from attachment_digest import digest_part
+from attachment_store import store_part
+
+# skip extremely tiny artifacts
+MIN_MESSAGE_SIZE = 50
+
+# Digests recorded for every attachment (any hashlib name, e.g. add "sha1")
+ATTACHMENT_DIGESTS = ("md5", "sha256")
+
+
+def decode_mime(value: str) -> str:
+    if not value:
+        return value
+    try:
+        return str(make_header(decode_header(value)))
+    except Exception:
+        return value
+
+
+def guess_ext(content_type: str) -> str:
+    # best-effort extension guess
+    ext = mimetypes.guess_extension(content_type or "")
+    return ext if ext else ".bin"
+
+
+def header_block(raw: bytes) -> bytes:
+    """Return the header block of a raw message (up to and including the blank line)."""
+    end = len(raw)
+    for sep in (b"\r\n\r\n", b"\n\n"):
+        idx = raw.find(sep, 0, end)
+        if idx >= 0:
+            end = idx + len(sep)
+    return raw[:end]
+
+
+def _parse_headers(block: bytes):
+    try:
+        msg = BytesHeaderParser(policy=policy.default).parsebytes(block)
+    except Exception:
+        return None
+    return header_record(msg)
+
+
+def parse_email_bytes(raw: bytes, store_dir=None, headers_only=False):
+    """
+    Parse a raw message into an email record.
+
+    Args:
+        raw: Message bytes (headers + body)
+        store_dir: Optional attachment store directory (see attachment_store.py)
+        headers_only: Parse only the header block and return a header record
+
+    Returns:
+        Email record dict, or None if the data is too small or unparseable
+    """
+    if len(raw) < MIN_MESSAGE_SIZE:
+        return None
+    if headers_only:
+        return _parse_headers(header_block(raw))
+    try:
+        msg = BytesParser(policy=policy.default).parsebytes(raw)
+    except Exception:
+        return None
+    return email_record(msg, store_dir=store_dir)
+
+
+def _read_header_block(f) -> bytes:
+    lines = []
+    for line in f:
+        lines.append(line)
+        if line in (b"\r\n", b"\n"):
+            break
+    return b"".join(lines)
+
+
+def parse_email_file(path: str, store_dir=None, headers_only=False):
+    """
+    Parse a message file (e.g. a tshark IMF export) into an email record.
+
+    Args:
+        path: Path to the exported message
+        store_dir: Optional attachment store directory
+        headers_only: Read the file only up to the end of its headers
+
+    Returns:
+        Email record dict, or None if the file is too small or unparseable
+    """
+    try:
+        with open(path, "rb") as f:
+            if headers_only:
+                if os.fstat(f.fileno()).st_size < MIN_MESSAGE_SIZE:
+                    return None
+                return _parse_headers(_read_header_block(f))
+            return parse_email_bytes(f.read(), store_dir=store_dir)
+    except OSError:
+        return None
+
+
+def parse_smtp_message(message, store_dir=None, headers_only=False):
+    """
+    Parse a message reassembled by pcap_reader and tag it with its session.
+
+    Args:
+        message: pcap_reader.SmtpMessage
+        store_dir: Optional attachment store directory
+        headers_only: Parse only the header block and return a header record
+
+    Returns:
+        Email record dict with tcp_stream and capture_time, or None
+    """
+    record = parse_email_bytes(message.raw, store_dir=store_dir, headers_only=headers_only)
+    if record is not None:
+        record["tcp_stream"] = message.tcp_stream
+        record["capture_time"] = message.timestamp
+    return record
+
+
+def _parse_batch(parse, batch):
+    return [parse(item) for item in batch]
+
+
+def parse_parallel(parse, items, workers=None, batch_size=32):
+    """
+    Run a parse function over items in a process pool, preserving input order.
+
+    Items are sent to the workers in batches and at most a few batches per
+    worker are in flight, so a lazy input (e.g. a capture being read) is
+    never fully materialized.
+
+    Args:
+        parse: Picklable callable (parse_email_file, parse_smtp_message, a functools.partial of one, ...)
+        items: Iterable of inputs
+        workers: Number of worker processes (defaults to os.cpu_count(); 1 runs in-process)
+        batch_size: Items per task sent to a worker
+
+    Yields:
+        parse(item) for every item, in the same order as items
+    """
+    if workers == 1:
+        for item in items:
+            yield parse(item)
+        return
+
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        max_in_flight = 4 * workers
+        in_flight = deque()
+        batch = []
+
+        for item in items:
+            batch.append(item)
+            if len(batch) < batch_size:
+                continue
+            in_flight.append(pool.submit(_parse_batch, parse, batch))
+            batch = []
+            if len(in_flight) >= max_in_flight:
+                yield from in_flight.popleft().result()
+
+        if batch:
+            in_flight.append(pool.submit(_parse_batch, parse, batch))
+        while in_flight:
+            yield from in_flight.popleft().result()
+
+
+def email_record(msg, store_dir=None):
+    """
+    Build the emails.ndjson record for a parsed message.
+
+    Args:
+        msg: email.message.EmailMessage parsed with policy.default
+        store_dir: Optional attachment store directory; attachment payloads are
+            written there under their SHA-256 and referenced by store_path
+
+    Returns:
+        Email record dict
+    """
+    body_text = ""
+    body_html = ""
+    attachments = []
+    part_counter = 0
+
+    if msg.is_multipart():
+        for part in msg.walk():
+            if part.is_multipart():
+                continue
+
+            part_counter += 1
+
+            ctype = (part.get_content_type() or "").lower()
+            disposition = part.get_content_disposition()  # 'attachment' | 'inline' | None
+            filename = part.get_filename()
+
+            if filename:
+                filename = decode_mime(filename)
+
+            # Sometimes filename exists only as Content-Type "name" param
+            # policy.default supports get_param; check Content-Type header params
+            name_param = part.get_param("name", header="Content-Type")
+            if name_param and not filename:
+                filename = decode_mime(name_param)
+
+            charset = part.get_content_charset() or "utf-8"
+
+            is_text_plain = (ctype == "text/plain")
+            is_text_html = (ctype == "text/html")
+
+            # Decide if this is body or attachment
+            # Treat as body ONLY when it's text/plain or text/html AND no attachment indicators.
+            has_attachment_indicator = (
+                disposition in ("attachment", "inline") or
+                bool(filename) or
+                bool(name_param) or
+                (ctype not in ("text/plain", "text/html") and ctype != "")
+            )
+
+            # --- BODY ---
+            if not has_attachment_indicator and is_text_plain:
+                payload_bytes = part.get_payload(decode=True) or b""
+                try:
+                    body_text += payload_bytes.decode(charset, errors="replace")
+                except Exception:
+                    body_text += payload_bytes.decode("utf-8", errors="replace")
+
+            elif not has_attachment_indicator and is_text_html:
+                payload_bytes = part.get_payload(decode=True) or b""
+                try:
+                    body_html += payload_bytes.decode(charset, errors="replace")
+                except Exception:
+                    body_html += payload_bytes.decode("utf-8", errors="replace")
+
+            # --- ATTACHMENT ---
+            else:
+                # If it's text/plain/html but marked inline/attachment OR has filename, still treat as attachment.
+                if not filename:
+                    # fallback filename
+                    filename = f"part-{part_counter}{guess_ext(ctype)}"
+
+                # decode + hash (+ store) in one chunked pass; the decoded payload is never held whole
+                store_path = None
+                if store_dir:
+                    size, digests, store_path = store_part(store_dir, part, ATTACHMENT_DIGESTS)
+                else:
+                    size, digests = digest_part(part, ATTACHMENT_DIGESTS)
+
+                att = {
+                    "filename": filename,
+                    "content_type": ctype or None,
+                    "size": size,
+                    "content_disposition": disposition  # useful for debugging
+                }
+                att.update(digests)
+                if store_path:
+                    att["store_path"] = store_path
+
+                attachments.append(att)
+
+    else:
+        payload_bytes = msg.get_payload(decode=True) or b""
+        charset = msg.get_content_charset() or "utf-8"
+        try:
+            body_text = payload_bytes.decode(charset, errors="replace")
+        except Exception:
+            body_text = payload_bytes.decode("utf-8", errors="replace")
+
+    record = header_record(msg)
+    record.update({
+        "body_text": body_text.strip() or None,
+        "body_html": body_html.strip() or None,
+        "attachments": attachments
+    })
+    return record
+
+
+def header_record(msg):
+    """
+    Build the header fields of an emails.ndjson record.
+
+    Args:
+        msg: email.message.EmailMessage parsed with policy.default (headers are enough)
+
+    Returns:
+        Dict with message_id, date, from, to, cc, bcc and subject
+    """
+    return {
+        "message_id": msg.get("Message-ID"),
+        "date": msg.get("Date"),
+        "from": msg.get_all("From", []),
+        "to": msg.get_all("To", []),
+        "cc": msg.get_all("Cc", []),
+        "bcc": msg.get_all("Bcc", []),
+        "subject": decode_mime(msg.get("Subject") or ""),
+    }
@@ -0,0 +1,136 @@
+"""
+Single-pass extraction of emails AND SMTP network flows.
+
+Decodes the capture once and writes both emails.ndjson and network_flows.ndjson,
+instead of running extract_emails_1.py and extract_network_1.py back to back
+(which dissects the same PCAP twice). Every email and every flow carries the
+tcp_stream it came from, so build_final_json_1.py can join them per session;
+emails also carry capture_time, the epoch time their DATA was seen on the wire.
+"""
+
+import os
+import tempfile
+
+from email_parsing import parse_email_file, parse_smtp_message
+from flow_records import AGGREGATOR, FLOW_FIELDS, FlowTable, tshark_fields_args, parse_field_line, iter_tshark_lines
+from pcap_reader import iter_smtp_capture
+from record_io import RecordWriter
+
+TSHARK = r"C:\Program Files\Wireshark\tshark.exe"
+PCAP = r"D:\Opensearch\Open-Search-Data-Intelligence\email_extraction\smtp-July-28.pcap"
+OUT_DIR = r"D:\Opensearch\Open-Search-Data-Intelligence\email_extraction\emails"
+EMAILS_JSON = r"D:\Opensearch\Open-Search-Data-Intelligence\email_extraction\emails.ndjson"
+NETWORK_JSON = r"D:\Opensearch\Open-Search-Data-Intelligence\email_extraction\network_flows.ndjson"
+# Outputs are NDJSON; end a path in .gz to compress it, or in .json for a
+# pretty-printed array (export only, later stages read NDJSON best)
+
+# "native": built-in reader (pcap_reader.py), no tshark needed
+# "tshark": one tshark run that exports IMF objects and prints SMTP fields together
+READER = "native"
+
+
+def iter_native(pcap):
+    """
+    Decode the capture once with the built-in reader.
+
+    Args:
+        pcap: Path to the PCAP/PCAPNG file
+
+    Yields:
+        ("email", record) and ("flow", flow) tuples in capture order
+    """
+    for kind, item in iter_smtp_capture(pcap):
+        if kind == "flow":
+            yield kind, item
+            continue
+        record = parse_smtp_message(item)
+        if record is not None:
+            yield "email", record
+
+
+def iter_tshark(pcap, out_dir=OUT_DIR):
+    """
+    Decode the capture once with tshark: --export-objects runs alongside the
+    field output, and imf.message_id ties each exported message to its stream.
+
+    Args:
+        pcap: Path to the PCAP/PCAPNG file
+        out_dir: Directory the IMF objects end up in. tshark exports into a
+            fresh subdirectory, so only this run's messages are parsed and
+            joined; they are moved into out_dir afterwards.
+
+    Yields:
+        ("flow", flow) tuples while tshark runs, then ("email", record) tuples
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    with tempfile.TemporaryDirectory(prefix=".export-", dir=out_dir) as export_dir:
+        yield from _iter_tshark_export(pcap, export_dir, out_dir)
+
+
+def _iter_tshark_export(pcap, export_dir, out_dir):
+    cmd = [TSHARK, "-r", pcap, "--export-objects", f"imf,{export_dir}"]
+    cmd += tshark_fields_args(FLOW_FIELDS + ["imf.message_id"], display_filter="(smtp || imf) && ip")
+
+    seen_by_message_id = {}
+    imf_idx = len(FLOW_FIELDS)
+
+    # field output is consumed through a pipe while tshark writes the objects
+    for line in iter_tshark_lines(cmd):
+        flow = parse_field_line(line)
+        if flow is None:
+            continue
+        parts = line.strip().split("|")
+        message_id = parts[imf_idx].split(AGGREGATOR, 1)[0] if imf_idx < len(parts) else ""
+        if message_id:
+            seen_by_message_id.setdefault(message_id.strip(), (flow["tcp_stream"], flow["timestamp"]))
+        yield "flow", flow
+
+    for fname in sorted(os.listdir(export_dir)):
+        path = os.path.join(export_dir, fname)
+        if not os.path.isfile(path):
+            continue
+        record = parse_email_file(path)
+        os.replace(path, os.path.join(out_dir, fname))
+        if record is None:
+            continue
+        tcp_stream, capture_time = seen_by_message_id.get((record.get("message_id") or "").strip(), (None, None))
+        record["tcp_stream"] = tcp_stream
+        record["capture_time"] = capture_time
+        yield "email", record
+
+
+def _collect(items):
+    emails = []
+    flows = FlowTable()
+    for kind, item in items:
+        (flows if kind == "flow" else emails).append(item)
+    return emails, flows
+
+
+def extract_native(pcap):
+    """iter_native() collected into a tuple of (emails list, flows FlowTable)."""
+    return _collect(iter_native(pcap))
+
+
+def extract_tshark(pcap, out_dir=OUT_DIR):
+    """iter_tshark() collected into a tuple of (emails list, flows FlowTable)."""
+    return _collect(iter_tshark(pcap, out_dir))
+
+
+def main():
+    if READER == "native":
+        items = iter_native(PCAP)
+    else:
+        items = iter_tshark(PCAP)
+
+    # both outputs are streamed, nothing is collected in memory
+    with RecordWriter(EMAILS_JSON) as emails_out, RecordWriter(NETWORK_JSON) as flows_out:
+        for kind, item in items:
+            (flows_out if kind == "flow" else emails_out).write(item)
+
+    print(f"Extracted {emails_out.count} emails → {EMAILS_JSON}")
+    print(f"Extracted {flows_out.count} clean SMTP network flows → {NETWORK_JSON}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,158 +1,194 @@
 import subprocess
 import os
-import json
-import hashlib
-import mimetypes
-from email import policy
-from email.parser import BytesParser
-from email.header import decode_header, make_header
+from collections import deque
+from functools import partial
+from operator import attrgetter
+
+from attachment_store import AttachmentStore
+from email_parsing import ATTACHMENT_DIGESTS, parse_email_file, parse_smtp_message, parse_parallel
+from manifest import ExtractionManifest, content_sha256
+from flow_records import iter_tshark_lines
+from pcap_reader import iter_smtp_messages
+from record_io import RecordWriter
+from tshark_cache import TsharkCache
 
 TSHARK = r"C:\Program Files\Wireshark\tshark.exe"
 PCAP = r"D:\Opensearch\Open-Search-Data-Intelligence\email_extraction\smtp-July-28.pcap"
 OUT_DIR = r"D:\Opensearch\Open-Search-Data-Intelligence\email_extraction\emails"
-OUT_JSON = r"D:\Opensearch\Open-Search-Data-Intelligence\email_extraction\emails.json"
-
-os.makedirs(OUT_DIR, exist_ok=True)
-
-def decode_mime(value: str) -> str:
-    if not value:
-        return value
-    try:
-        return str(make_header(decode_header(value)))
-    except Exception:
-        return value
-
-def guess_ext(content_type: str) -> str:
-    # best-effort extension guess
-    ext = mimetypes.guess_extension(content_type or "")
-    return ext if ext else ".bin"
-
-# 1) Export IMF objects
-cmd = [TSHARK, "-r", PCAP, "--export-objects", f"imf,{OUT_DIR}"]
-subprocess.run(cmd, check=True)
-
-emails = []
-files = os.listdir(OUT_DIR)
-
-# IMPORTANT: some tshark exports do NOT end with .eml
-# so we attempt to parse everything as an email message.
-for fname in files:
-    path = os.path.join(OUT_DIR, fname)
-    if not os.path.isfile(path):
-        continue
-
-    # skip extremely tiny artifacts
-    try:
-        if os.path.getsize(path) < 50:
-            continue
-    except Exception:
-        continue
-
-    try:
-        with open(path, "rb") as f:
-            msg = BytesParser(policy=policy.default).parse(f)
-    except Exception:
-        continue
-
-    body_text = ""
-    body_html = ""
-    attachments = []
-    part_counter = 0
-
-    if msg.is_multipart():
-        for part in msg.walk():
-            if part.is_multipart():
-                continue
-
-            part_counter += 1
-
-            ctype = (part.get_content_type() or "").lower()
-            disposition = part.get_content_disposition()  # 'attachment' | 'inline' | None
-            filename = part.get_filename()
-
-            if filename:
-                filename = decode_mime(filename)
-
-            # Sometimes filename exists only as Content-Type "name" param
-            # policy.default supports get_param; check Content-Type header params
-            name_param = part.get_param("name", header="Content-Type")
-            if name_param and not filename:
-                filename = decode_mime(name_param)
-
-            payload_bytes = part.get_payload(decode=True) or b""
-            charset = part.get_content_charset() or "utf-8"
-
-            is_text_plain = (ctype == "text/plain")
-            is_text_html = (ctype == "text/html")
-
-            # Decide if this is body or attachment
-            # Treat as body ONLY when it's text/plain or text/html AND no attachment indicators.
-            has_attachment_indicator = (
-                disposition in ("attachment", "inline") or
-                bool(filename) or
-                bool(name_param) or
-                (ctype not in ("text/plain", "text/html") and ctype != "")
-            )
-
-            # --- BODY ---
-            if not has_attachment_indicator and is_text_plain:
-                try:
-                    body_text += payload_bytes.decode(charset, errors="replace")
-                except Exception:
-                    body_text += payload_bytes.decode("utf-8", errors="replace")
-
-            elif not has_attachment_indicator and is_text_html:
-                try:
-                    body_html += payload_bytes.decode(charset, errors="replace")
-                except Exception:
-                    body_html += payload_bytes.decode("utf-8", errors="replace")
-
-            # --- ATTACHMENT ---
-            else:
-                # If it's text/plain/html but marked inline/attachment OR has filename, still treat as attachment.
-                if not filename:
-                    # fallback filename
-                    filename = f"part-{part_counter}{guess_ext(ctype)}"
-
-                att = {
-                    "filename": filename,
-                    "content_type": ctype or None,
-                    "size": len(payload_bytes),
-                    "content_disposition": disposition  # useful for debugging
-                }
-
-                if payload_bytes:
-                    att["md5"] = hashlib.md5(payload_bytes).hexdigest()
-                    att["sha256"] = hashlib.sha256(payload_bytes).hexdigest()
-
-                attachments.append(att)
+# NDJSON; end in .gz to compress, or in .json for a pretty-printed array (export only)
+OUT_JSON = r"D:\Opensearch\Open-Search-Data-Intelligence\email_extraction\emails.ndjson"
+
+# Optional content-addressed attachment store (attachment_store.py): every
+# distinct payload is written once under its SHA-256 and attachments reference
+# it via store_path. None = only record hash metadata.
+ATTACHMENT_STORE = None  # e.g. r"D:\Opensearch\Open-Search-Data-Intelligence\email_extraction\attachments"
+
+# True: triage mode, only header fields (message_id, date, from/to/cc/bcc,
+# subject) are parsed; bodies and attachments are never decoded.
+HEADERS_ONLY = False
+
+# "native": stream messages straight out of the capture (pcap_reader.py)
+# "tshark": export IMF objects to OUT_DIR with tshark, then parse the files
+READER = "native"
+
+# Optional tshark output cache (tshark_cache.py) for the "tshark" reader: the
+# exported IMF objects are kept per capture digest and tshark version, so a
+# re-run on the same capture skips the export. None = always run tshark.
+TSHARK_CACHE = None  # e.g. r"D:\Opensearch\Open-Search-Data-Intelligence\email_extraction\tshark_cache"
+
+# Optional extraction filter (capture_filter.py): time range, hosts/CIDRs, ports
+# and envelope addresses. The native reader drops non-matching TCP segments
+# before reassembly; tshark gets it as a display filter. None = every message.
+FILTER = None  # e.g. CaptureFilter(start="2024-07-28T09:00:00+00:00", hosts=["203.0.113.0/24"],
+#                                  addresses=["@example.com"])
+
+# MIME parsing + attachment hashing runs in a process pool; results keep
+# capture (native) or file-name (tshark) order. 1 = parse in this process.
+WORKERS = os.cpu_count() or 1
+
+# Optional manifest (manifest.py) for incremental, resumable runs: captures
+# already extracted are skipped, and messages parsed before a crash are not
+# parsed again. None = always extract everything.
+MANIFEST = None  # e.g. r"D:\Opensearch\Open-Search-Data-Intelligence\email_extraction\emails.manifest.ndjson"
+
+
+def stage_key():
+    # settings that change the records; a different key reprocesses everything
+    mode = "headers" if HEADERS_ONLY else "full"
+    key = f"emails:{READER}:{mode}:{','.join(ATTACHMENT_DIGESTS)}:store={bool(ATTACHMENT_STORE)}"
+    return f"{key}:{FILTER!r}" if FILTER else key
+
+
+def read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def skip_done(items, read_raw, manifest, pcap_digest, keys):
+    """
+    Drop items the manifest already has; the manifest keys of the kept items
+    are queued on keys in the same order (parse_parallel preserves it).
+    """
+    seen = {}
+    for item in items:
+        digest = content_sha256(read_raw(item))
+        occurrence = seen.get(digest, 0)
+        seen[digest] = occurrence + 1
+        if not manifest.is_done(pcap_digest, digest, occurrence):
+            keys.append((digest, occurrence))
+            yield item
+
+
+def main():
+    parse_message = parse_smtp_message
+    parse_file = parse_email_file
+    if HEADERS_ONLY:
+        parse_message = partial(parse_smtp_message, headers_only=True)
+        parse_file = partial(parse_email_file, headers_only=True)
+    elif ATTACHMENT_STORE:
+        parse_message = partial(parse_smtp_message, store_dir=ATTACHMENT_STORE)
+        parse_file = partial(parse_email_file, store_dir=ATTACHMENT_STORE)
+
+    store = AttachmentStore(ATTACHMENT_STORE) if ATTACHMENT_STORE and not HEADERS_ONLY else None
+    new_payloads = 0
+
+    manifest = None
+    pcap_digest = None
+    if MANIFEST:
+        manifest = ExtractionManifest(MANIFEST, stage_key())
+        pcap_digest = manifest.capture_digest(PCAP)
+
+    complete = manifest is not None and manifest.is_complete(pcap_digest)
+    keys = deque()
+
+    if complete:
+        print(f"{PCAP} already extracted (sha256 {pcap_digest[:12]}), reusing manifest records")
+        records = []
 
     else:
-        payload_bytes = msg.get_payload(decode=True) or b""
-        charset = msg.get_content_charset() or "utf-8"
+        if READER == "native":
+            # 1) Reassemble SMTP sessions and parse each DATA payload in memory
+            prefilter = FILTER.segment_prefilter(PCAP) if FILTER else None
+            items = iter_smtp_messages(PCAP, prefilter=prefilter)
+            parse, read_raw = parse_message, attrgetter("raw")
+
+        else:
+            os.makedirs(OUT_DIR, exist_ok=True)
+
+            cache = TsharkCache(TSHARK_CACHE, TSHARK) if TSHARK_CACHE else None
+            filter_args = []
+            if FILTER:
+                if cache is not None:
+                    run_tshark = partial(cache.iter_lines, PCAP)
+                else:
+                    def run_tshark(args):
+                        return iter_tshark_lines([TSHARK, "-r", PCAP] + args)
+                filter_args = ["-Y", FILTER.tshark_display_filter(run_tshark, base=None)]
+
+            # 1) Export IMF objects
+            if cache is not None:
+                paths = cache.export_objects(PCAP, "imf", OUT_DIR, filter_args)
+            else:
+                cmd = [TSHARK, "-r", PCAP, "--export-objects", f"imf,{OUT_DIR}"] + filter_args
+                subprocess.run(cmd, check=True)
+
+                # IMPORTANT: some tshark exports do NOT end with .eml
+                # so we attempt to parse everything as an email message.
+                paths = [os.path.join(OUT_DIR, fname) for fname in sorted(os.listdir(OUT_DIR))]
+                paths = [path for path in paths if os.path.isfile(path)]
+            items, parse, read_raw = paths, parse_file, read_file
+
+        if manifest is not None:
+            items = skip_done(items, read_raw, manifest, pcap_digest, keys)
+        records = parse_parallel(parse, items, workers=WORKERS)
+
+    def parsed():
+        # manifest/store bookkeeping for freshly parsed messages
+        nonlocal new_payloads
         try:
-            body_text = payload_bytes.decode(charset, errors="replace")
-        except Exception:
-            body_text = payload_bytes.decode("utf-8", errors="replace")
-
-    emails.append({
-        "message_id": msg.get("Message-ID"),
-        "date": msg.get("Date"),
-        "from": msg.get_all("From", []),
-        "to": msg.get_all("To", []),
-        "cc": msg.get_all("Cc", []),
-        "bcc": msg.get_all("Bcc", []),
-        "subject": decode_mime(msg.get("Subject") or ""),
-        "body_text": body_text.strip() or None,
-        "body_html": body_html.strip() or None,
-        "attachments": attachments
-    })
-
-with open(OUT_JSON, "w", encoding="utf-8") as f:
-    json.dump(emails, f, indent=2, ensure_ascii=False)
-
-# quick visibility / sanity stats
-total_atts = sum(len(e.get("attachments", [])) for e in emails)
-with_atts = sum(1 for e in emails if e.get("attachments"))
-print(f"Extracted {len(emails)} emails → {OUT_JSON}")
-print(f"Attachments: total={total_atts}, emails_with_attachments={with_atts}")
+            for record in records:
+                if manifest is not None:
+                    digest, occurrence = keys.popleft()
+                    manifest.add_message(pcap_digest, digest, occurrence, record)
+                if record is None:
+                    continue
+                if store is not None:
+                    new_payloads += len(store.add_email(record))
+                yield record
+        finally:
+            # keep the store index in step with the manifest if the run is interrupted
+            if store is not None:
+                store.save()
+
+    if manifest is None:
+        emails = parsed()
+    else:
+        for _ in parsed():
+            pass
+        if not complete:
+            manifest.mark_complete(pcap_digest)
+        # resumed/skipped messages come back from the manifest, in capture order
+        emails = manifest.iter_records(pcap_digest)
+
+    # records are streamed to OUT_JSON; quick visibility / sanity stats on the way
+    total_atts = 0
+    with_atts = 0
+    with RecordWriter(OUT_JSON) as out:
+        for email in emails:
+            out.write(email)
+            total_atts += len(email.get("attachments", []))
+            with_atts += bool(email.get("attachments"))
+
+    if manifest is not None:
+        manifest.close()
+
+    print(f"Extracted {out.count} emails → {OUT_JSON}")
+    print(f"Attachments: total={total_atts}, emails_with_attachments={with_atts}")
+
+    if store is not None:
+        unique, occurrences = store.stats()
+        print(f"Attachment store: new={new_payloads}, unique={unique}, occurrences={occurrences} → {ATTACHMENT_STORE}")
+
+
+if __name__ == "__main__":
+    main()
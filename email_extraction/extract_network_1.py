@@ -1,126 +1,42 @@
-import subprocess
-import json
+from functools import partial
+
+from flow_records import DISPLAY_FILTER, tshark_fields_args, iter_flows, iter_tshark_lines
+from record_io import write_records
+from tshark_cache import TsharkCache
 
 TSHARK = r"C:\Program Files\Wireshark\tshark.exe"
 PCAP = r"D:\Opensearch\Open-Search-Data-Intelligence\email_extraction\smtp-July-28.pcap"
-OUT_JSON = r"D:\Opensearch\Open-Search-Data-Intelligence\email_extraction\network_flows.json"
-
-# We extract BOTH SMTP-layer fields AND some size + TLS indicators.
-# This helps you estimate plaintext vs encrypted (e.g., STARTTLS + subsequent TLS records).
-cmd = [
-    TSHARK,
-    "-r", PCAP,
-
-    # Only frames where tshark can decode smtp AND have IP.
-    "-Y", "smtp && ip",
-
-    "-T", "fields",
-    "-E", "separator=|",
-    "-E", "occurrence=f",
-    "-E", "quote=n",
-
-    # Core flow identity
-    "-e", "frame.time_epoch",
-    "-e", "ip.src",
-    "-e", "tcp.srcport",
-    "-e", "ip.dst",
-    "-e", "tcp.dstport",
-
-    # SMTP forensic fields
-    "-e", "smtp.command_line",
-    "-e", "smtp.req.command",
-    "-e", "smtp.req.parameter",
-    "-e", "smtp.response.code",
-    "-e", "smtp.response",
-
-    # Traffic sizing (helpful for plaintext/encrypted comparisons)
-    "-e", "tcp.len",
-    "-e", "frame.len",
-
-    # TLS hint (will usually be empty in smtp-decoded frames, but safe to include)
-    "-e", "tls.record.content_type",
-]
-
-result = subprocess.run(
-    cmd,
-    capture_output=True,
-    text=True,
-    encoding="utf-8",
-    errors="replace"
-)
-
-flows = []
 
-def to_int_or_none(x: str):
-    try:
-        x = (x or "").strip()
-        return int(x) if x != "" else None
-    except Exception:
-        return None
+# One flow per line (NDJSON, the format build_final_json_1.py reads).
+# End the path in .gz to compress it, or in .json to export the old
+# pretty-printed array instead.
+OUT_JSON = r"D:\Opensearch\Open-Search-Data-Intelligence\email_extraction\network_flows.ndjson"
 
-for line in result.stdout.splitlines():
-    parts = line.strip().split("|")
+# Optional tshark output cache (tshark_cache.py): the field output is kept per
+# capture digest, tshark version, display filter and field list, so a re-run
+# on the same capture skips the dissection. None = always run tshark.
+TSHARK_CACHE = None  # e.g. r"D:\Opensearch\Open-Search-Data-Intelligence\email_extraction\tshark_cache"
 
-    # Expect at least the first 5 fields to be meaningful
-    if len(parts) < 5:
-        continue
-    if not parts[0] or not parts[1] or not parts[3]:
-        continue
+# Optional extraction filter (capture_filter.py): time range, hosts/CIDRs, ports
+# and envelope addresses are compiled into the tshark display filter, so tshark
+# drops every other frame. None = all SMTP frames.
+FILTER = None  # e.g. CaptureFilter(start="2024-07-28T09:00:00+00:00", end="2024-07-28T10:00:00+00:00",
+#                                  hosts=["203.0.113.0/24"], ports=[25], addresses=["@example.com"])
 
-    try:
-        timestamp = float(parts[0])
-    except ValueError:
-        continue  # discard corrupted frames
+if TSHARK_CACHE:
+    run_tshark = partial(TsharkCache(TSHARK_CACHE, TSHARK).iter_lines, PCAP)
+else:
+    def run_tshark(args):
+        return iter_tshark_lines([TSHARK, "-r", PCAP] + args)
 
-    # Safe getters
-    def get(idx):
-        return parts[idx] if idx < len(parts) and parts[idx] != "" else None
-
-    smtp_command_line = get(5)
-    smtp_req_command = get(6)
-    smtp_req_parameter = get(7)
-    smtp_response_code = to_int_or_none(get(8) or "")
-    smtp_response = get(9)
-
-    tcp_len = to_int_or_none(get(10) or "")
-    frame_len = to_int_or_none(get(11) or "")
-
-    tls_content_type = get(12)
-
-    # STARTTLS inference (plaintext command that switches to encryption)
-    is_starttls = False
-    if smtp_req_command and smtp_req_command.strip().upper() == "STARTTLS":
-        is_starttls = True
-    elif smtp_command_line and smtp_command_line.strip().upper().startswith("STARTTLS"):
-        is_starttls = True
-
-    flows.append({
-        "timestamp": timestamp,
-        "src_ip": parts[1],
-        "src_port": to_int_or_none(parts[2]),
-        "dst_ip": parts[3],
-        "dst_port": to_int_or_none(parts[4]),
-        "protocol": "SMTP",
-
-        # SMTP forensic fields
-        "smtp_command_line": smtp_command_line,
-        "smtp_req_command": smtp_req_command,
-        "smtp_req_parameter": smtp_req_parameter,
-        "smtp_response_code": smtp_response_code,
-        "smtp_response": smtp_response,
-
-        # Useful sizing hints
-        "tcp_len": tcp_len,
-        "frame_len": frame_len,
-
-        # TLS hint (rarely populated in smtp-decoded frames, but kept if present)
-        "tls_record_content_type": tls_content_type,
-
-        # Derived hint for STARTTLS
-        "is_starttls": is_starttls,
-    })
+# We extract BOTH SMTP-layer fields AND some size + TLS indicators.
+# This helps you estimate plaintext vs encrypted (e.g., STARTTLS + subsequent TLS records).
+# The field list lives in flow_records.FLOW_FIELDS.
+display_filter = FILTER.tshark_display_filter(run_tshark) if FILTER else DISPLAY_FILTER
+args = tshark_fields_args(display_filter=display_filter)
 
-with open(OUT_JSON, "w", encoding="utf-8") as f:
-    json.dump(flows, f, indent=2, ensure_ascii=False)
+# tshark is read through a pipe and every flow is written as soon as it is
+# parsed, so memory stays flat however large the capture is.
+count = write_records(OUT_JSON, iter_flows(run_tshark(args)))
 
-print(f"Extracted {len(flows)} clean SMTP network flows → {OUT_JSON}")
+print(f"Extracted {count} clean SMTP network flows → {OUT_JSON}")
@@ -0,0 +1,141 @@
+"""
+Join of email records to the SMTP flows of the session that carried them.
+
+Flows are stored compactly (flow_records.FlowTable), grouped per TCP stream
+(or per connection 4-tuple when the stream id is unknown) and sorted by time
+once; each email is then matched with a bisect: inside its own stream when the
+extractor tagged it with tcp_stream, otherwise across all flows within a time
+window around the email's time.
+"""
+
+from array import array
+from bisect import bisect_left, bisect_right
+from email.utils import parsedate_to_datetime
+
+from flow_records import FlowTable, ordered_endpoints
+
+# Largest gap (seconds) between an email's time and a flow matched by time alone
+TIME_WINDOW = 300.0
+
+
+def connection_key(flow):
+    """Direction-independent 4-tuple of a flow."""
+    src = (flow.get("src_ip") or "", flow.get("src_port") or 0)
+    dst = (flow.get("dst_ip") or "", flow.get("dst_port") or 0)
+    return ordered_endpoints(src, dst)
+
+
+def email_time(email):
+    """
+    Epoch time of an email: when its DATA was seen on the wire, else its Date header.
+
+    Returns:
+        Float seconds, or None if neither is usable
+    """
+    if email.get("capture_time") is not None:
+        return float(email["capture_time"])
+    try:
+        return parsedate_to_datetime(email.get("date")).timestamp()
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+class _Timeline:
+    """Rows of one group (or of the whole capture) of a FlowTable, sorted by timestamp."""
+
+    __slots__ = ("table", "rows", "times")
+
+    def __init__(self, table, rows):
+        rows = sorted(rows, key=table.timestamps.__getitem__)
+        self.table = table
+        self.rows = array("I", rows)
+        self.times = array("d", (table.timestamps[r] for r in rows))
+
+    def session_flow(self, t):
+        """
+        Flow describing the message sent at time t: the last client command at
+        or before t (normally DATA), else the closest earlier frame, else the first.
+        """
+        idx = bisect_right(self.times, t) - 1 if t is not None else len(self.rows) - 1
+        if idx < 0:
+            return self.table.row(self.rows[0])
+        commands = self.table.req_commands
+        for i in range(idx, -1, -1):
+            if commands[self.rows[i]]:
+                return self.table.row(self.rows[i])
+        return self.table.row(self.rows[idx])
+
+    def nearest(self, t, window):
+        """Row index of the flow closest to time t within +/- window seconds, or None."""
+        lo = bisect_left(self.times, t - window)
+        hi = bisect_right(self.times, t + window)
+        if lo >= hi:
+            return None
+        idx = bisect_left(self.times, t, lo, hi)
+        best = min((i for i in (idx - 1, idx) if lo <= i < hi), key=lambda i: abs(self.times[i] - t))
+        return self.rows[best]
+
+
+class FlowIndex:
+    """
+    Index of network flows for correlating emails to their SMTP session.
+
+    Flows are held in a flow_records.FlowTable; only matched flows are
+    materialized as dicts.
+
+    Args:
+        flows: FlowTable, or iterable of network_flows.ndjson records (consumed once)
+        window: Largest time gap (seconds) for matches by time alone
+    """
+
+    def __init__(self, flows, window=TIME_WINDOW):
+        self.window = window
+        self.table = table = flows if isinstance(flows, FlowTable) else FlowTable(flows)
+        groups = {}
+        timed = []
+        for i in range(len(table)):
+            if table.timestamp(i) is None:
+                continue
+            groups.setdefault(self._group_key(i), []).append(i)
+            timed.append(i)
+
+        self.groups = {key: _Timeline(table, rows) for key, rows in groups.items()}
+        self.all = _Timeline(table, timed)
+
+    def __len__(self):
+        return len(self.all.rows)
+
+    def match(self, email):
+        """
+        Find the flow of the session an email was sent in.
+
+        Args:
+            email: emails.ndjson record
+
+        Returns:
+            Flow dict, or None if nothing matches
+        """
+        t = email_time(email)
+        stream = email.get("tcp_stream")
+        if stream is not None:
+            timeline = self.groups.get(("stream", stream))
+            if timeline is not None:
+                return timeline.session_flow(t)
+
+        if t is None or not self.all.rows:
+            return None
+        row = self.all.nearest(t, self.window)
+        if row is None:
+            return None
+        # report the session as a whole, not whichever frame happened to be closest
+        return self.groups[self._group_key(row)].session_flow(t)
+
+    def _group_key(self, i):
+        table = self.table
+        stream = table.tcp_streams[i]
+        if stream >= 0:
+            return ("stream", stream)
+        strings = table.strings
+        src = (strings[table.src_ips[i]] or "", max(table.src_ports[i], 0))
+        dst = (strings[table.dst_ips[i]] or "", max(table.dst_ports[i], 0))
+        return ("conn", ordered_endpoints(src, dst))
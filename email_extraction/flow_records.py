@@ -0,0 +1,358 @@
+"""
+SMTP flow records shared by the network extraction scripts.
+
+Defines the tshark field list used for per-frame SMTP extraction, parses the
+pipe-separated field output, and builds the flow dicts written to
+network_flows.ndjson (the native reader builds the same dicts via make_flow).
+Stages that hold many flows at once keep them in a FlowTable instead of a
+list of dicts.
+"""
+
+import math
+import subprocess
+from array import array
+
+# Fields requested from tshark, in output order
+FLOW_FIELDS = [
+    # Core flow identity
+    "frame.time_epoch",
+    "ip.src",
+    "tcp.srcport",
+    "ip.dst",
+    "tcp.dstport",
+
+    # SMTP forensic fields
+    "smtp.command_line",
+    "smtp.req.command",
+    "smtp.req.parameter",
+    "smtp.response.code",
+    "smtp.response",
+
+    # Traffic sizing (helpful for plaintext/encrypted comparisons)
+    "tcp.len",
+    "frame.len",
+
+    # TLS hint (will usually be empty in smtp-decoded frames, but safe to include)
+    "tls.record.content_type",
+
+    # Conversation the frame belongs to (joins frames to exported emails)
+    "tcp.stream",
+]
+
+# Only frames where tshark can decode smtp AND have IP.
+DISPLAY_FILTER = "smtp && ip"
+
+# Separator tshark puts between the occurrences of a field in one frame. A
+# frame with pipelined commands (several RCPT TO in one segment) or replies
+# carries one smtp.command_line / smtp.response per line; the other fields
+# use their first occurrence.
+AGGREGATOR = "\x1e"
+
+# Separator of the command / reply lines kept in smtp_command_line and smtp_response
+LINE_SEPARATOR = "\r\n"
+
+
+def tshark_fields_args(fields=None, display_filter=DISPLAY_FILTER):
+    """
+    Build the tshark arguments for pipe-separated field output.
+
+    Args:
+        fields: Field names to extract (defaults to FLOW_FIELDS)
+        display_filter: tshark display filter
+
+    Returns:
+        List of command-line arguments (without the tshark binary and -r)
+    """
+    args = [
+        "-Y", display_filter,
+
+        "-T", "fields",
+        "-E", "separator=|",
+        "-E", "occurrence=a",
+        "-E", f"aggregator={AGGREGATOR}",
+        "-E", "quote=n",
+    ]
+    for field in fields or FLOW_FIELDS:
+        args += ["-e", field]
+    return args
+
+
+def ordered_endpoints(src, dst):
+    """Direction-independent connection key from two (ip, port) endpoints."""
+    return (src, dst) if src <= dst else (dst, src)
+
+
+def to_int_or_none(x: str):
+    try:
+        x = (x or "").strip()
+        return int(x) if x != "" else None
+    except Exception:
+        return None
+
+
+def make_flow(timestamp, src_ip, src_port, dst_ip, dst_port,
+              smtp_command_line=None, smtp_req_command=None, smtp_req_parameter=None,
+              smtp_response_code=None, smtp_response=None,
+              tcp_len=None, frame_len=None, tls_content_type=None, tcp_stream=None):
+    """
+    Build one network_flows.ndjson record.
+
+    smtp_command_line and smtp_response hold every command / reply line of
+    the frame, joined by LINE_SEPARATOR; the other SMTP fields describe the
+    first one.
+
+    Returns:
+        Flow dict
+    """
+    # STARTTLS inference (plaintext command that switches to encryption)
+    is_starttls = False
+    if smtp_req_command and smtp_req_command.strip().upper() == "STARTTLS":
+        is_starttls = True
+    elif smtp_command_line and any(line.strip().upper().startswith("STARTTLS")
+                                   for line in smtp_command_line.split(LINE_SEPARATOR)):
+        is_starttls = True
+
+    return {
+        "timestamp": timestamp,
+        "src_ip": src_ip,
+        "src_port": src_port,
+        "dst_ip": dst_ip,
+        "dst_port": dst_port,
+        "protocol": "SMTP",
+
+        # SMTP forensic fields
+        "smtp_command_line": smtp_command_line,
+        "smtp_req_command": smtp_req_command,
+        "smtp_req_parameter": smtp_req_parameter,
+        "smtp_response_code": smtp_response_code,
+        "smtp_response": smtp_response,
+
+        # Useful sizing hints
+        "tcp_len": tcp_len,
+        "frame_len": frame_len,
+
+        # TLS hint (rarely populated in smtp-decoded frames, but kept if present)
+        "tls_record_content_type": tls_content_type,
+
+        # Derived hint for STARTTLS
+        "is_starttls": is_starttls,
+
+        # tcp.stream index, shared with the emails extracted from the same conversation
+        "tcp_stream": tcp_stream,
+    }
+
+
+def parse_field_line(line: str):
+    """
+    Parse one line of tshark field output (FLOW_FIELDS order).
+
+    Args:
+        line: Pipe-separated tshark output line
+
+    Returns:
+        Flow dict, or None for incomplete/corrupted frames
+    """
+    fields = line.strip().split("|")
+    parts = [field.split(AGGREGATOR, 1)[0] for field in fields]
+
+    # Expect at least the first 5 fields to be meaningful
+    if len(parts) < 5:
+        return None
+    if not parts[0] or not parts[1] or not parts[3]:
+        return None
+
+    try:
+        timestamp = float(parts[0])
+    except ValueError:
+        return None  # discard corrupted frames
+
+    # Safe getters
+    def get(idx):
+        return parts[idx] if idx < len(parts) and parts[idx] != "" else None
+
+    def get_lines(idx):
+        if idx >= len(fields):
+            return None
+        lines = [value.rstrip("\r\n") for value in fields[idx].split(AGGREGATOR)]
+        return LINE_SEPARATOR.join(value for value in lines if value) or None
+
+    return make_flow(
+        timestamp,
+        parts[1],
+        to_int_or_none(parts[2]),
+        parts[3],
+        to_int_or_none(parts[4]),
+        smtp_command_line=get_lines(5),
+        smtp_req_command=get(6),
+        smtp_req_parameter=get(7),
+        smtp_response_code=to_int_or_none(get(8) or ""),
+        smtp_response=get_lines(9),
+        tcp_len=to_int_or_none(get(10) or ""),
+        frame_len=to_int_or_none(get(11) or ""),
+        tls_content_type=get(12),
+        tcp_stream=to_int_or_none(get(13) or ""),
+    )
+
+
+def iter_tshark_lines(cmd):
+    """
+    Run tshark and yield its stdout line by line as it is produced.
+
+    Output is read through a pipe, so memory stays flat no matter how large
+    the capture is. If the consumer stops early, tshark is terminated.
+
+    Args:
+        cmd: Full tshark command line
+
+    Yields:
+        Output lines (without the trailing newline)
+    """
+    proc = subprocess.Popen(
+        cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+        encoding="utf-8",
+        errors="replace",
+        bufsize=1024 * 1024,
+    )
+    try:
+        for line in proc.stdout:
+            yield line.rstrip("\r\n")
+    finally:
+        proc.stdout.close()
+        if proc.poll() is None:
+            proc.terminate()
+        proc.wait()
+
+
+def iter_flows(lines):
+    """
+    Parse tshark field output lines (FLOW_FIELDS order) into flow dicts.
+
+    Args:
+        lines: Iterable of output lines, e.g. from tshark_cache.TsharkCache.iter_lines()
+
+    Yields:
+        Flow dicts, skipping incomplete/corrupted frames
+    """
+    for line in lines:
+        flow = parse_field_line(line)
+        if flow is not None:
+            yield flow
+
+
+class FlowTable:
+    """
+    Flow records stored column-wise in typed arrays.
+
+    A flow dict costs about 1 KB; a row here is 64 bytes. Numbers live
+    in arrays (missing values as -1, or NaN for timestamps); IP addresses and
+    SMTP strings are interned in one string table and stored as integer
+    indexes into it (0 = None). Dicts are only built when a row is read.
+
+    Args:
+        flows: Optional iterable of flow dicts to append
+    """
+
+    # (flow key, column attribute) of the interned string columns
+    STRING_COLUMNS = (
+        ("src_ip", "src_ips"),
+        ("dst_ip", "dst_ips"),
+        ("smtp_command_line", "command_lines"),
+        ("smtp_req_command", "req_commands"),
+        ("smtp_req_parameter", "req_parameters"),
+        ("smtp_response", "responses"),
+        ("tls_record_content_type", "tls_content_types"),
+    )
+
+    # (flow key, column attribute, typecode) of the integer columns
+    INT_COLUMNS = (
+        ("src_port", "src_ports", "i"),
+        ("dst_port", "dst_ports", "i"),
+        ("smtp_response_code", "response_codes", "i"),
+        ("tcp_len", "tcp_lens", "i"),
+        ("frame_len", "frame_lens", "i"),
+        ("tcp_stream", "tcp_streams", "q"),
+    )
+
+    def __init__(self, flows=()):
+        self.timestamps = array("d")
+        for _, attr in self.STRING_COLUMNS:
+            setattr(self, attr, array("I"))
+        for _, attr, typecode in self.INT_COLUMNS:
+            setattr(self, attr, array(typecode))
+        self.strings = [None]
+        self._string_idx = {None: 0}
+        for flow in flows:
+            self.append(flow)
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def _intern(self, value):
+        idx = self._string_idx.get(value)
+        if idx is None:
+            idx = self._string_idx[value] = len(self.strings)
+            self.strings.append(value)
+        return idx
+
+    def append(self, flow):
+        """Add one flow dict (as built by make_flow) as a row."""
+        timestamp = flow.get("timestamp")
+        self.timestamps.append(math.nan if timestamp is None else timestamp)
+        for key, attr in self.STRING_COLUMNS:
+            getattr(self, attr).append(self._intern(flow.get(key)))
+        for key, attr, _ in self.INT_COLUMNS:
+            value = flow.get(key)
+            getattr(self, attr).append(-1 if value is None else value)
+
+    def timestamp(self, i):
+        t = self.timestamps[i]
+        return None if math.isnan(t) else t
+
+    def row(self, i):
+        """Row i materialized as a flow dict."""
+        strings = self.strings
+
+        def number(column):
+            value = column[i]
+            return None if value < 0 else value
+
+        return make_flow(
+            self.timestamp(i),
+            strings[self.src_ips[i]],
+            number(self.src_ports),
+            strings[self.dst_ips[i]],
+            number(self.dst_ports),
+            smtp_command_line=strings[self.command_lines[i]],
+            smtp_req_command=strings[self.req_commands[i]],
+            smtp_req_parameter=strings[self.req_parameters[i]],
+            smtp_response_code=number(self.response_codes),
+            smtp_response=strings[self.responses[i]],
+            tcp_len=number(self.tcp_lens),
+            frame_len=number(self.frame_lens),
+            tls_content_type=strings[self.tls_content_types[i]],
+            tcp_stream=number(self.tcp_streams),
+        )
+
+    def time_order(self):
+        """Row indexes sorted by timestamp (rows without one last)."""
+        ts = self.timestamps
+        return sorted(range(len(ts)), key=lambda i: (math.isnan(ts[i]), 0.0 if math.isnan(ts[i]) else ts[i]))
+
+    def iter_rows(self, order=None):
+        """
+        Materialize rows as flow dicts, one at a time.
+
+        Args:
+            order: Optional iterable of row indexes (defaults to insertion order)
+
+        Yields:
+            Flow dicts
+        """
+        for i in range(len(self)) if order is None else order:
+            yield self.row(i)
+
+    def __iter__(self):
+        return self.iter_rows()
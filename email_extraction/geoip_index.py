@@ -0,0 +1,228 @@
+"""
+Offline GeoIP / ASN enrichment from a local IP range table.
+
+A local export of IPv4 ranges -> ASN, AS organisation and country (the
+iptoasn.com ip2asn-v4.tsv file, or any CSV with the columns in COLUMNS) is
+compiled once into a column-oriented binary index sorted by range start.
+Opening it just memory-maps the file; addresses are resolved by binary search
+over the mapped starts, a whole batch at once with numpy.searchsorted when
+numpy is installed, otherwise one bisect per address. No network service is
+involved.
+"""
+
+import csv
+import ipaddress
+from array import array
+from bisect import bisect_right
+from functools import lru_cache
+
+from cgnat_index import ipv4_int
+from column_index import ColumnFile, StringTable, build_if_stale, write_columns
+from record_io import open_text
+
+try:
+    import numpy as np
+except ImportError:  # lookup_many() falls back to bisect
+    np = None
+
+MAGIC = b"GEOIDX01"
+
+# CSV column names (override to match the export). Either start/end addresses
+# or a "network" CIDR column give the range.
+COLUMNS = {
+    "start": "start_ip",
+    "end": "end_ip",
+    "network": "network",
+    "asn": "asn",
+    "as_org": "as_org",
+    "country": "country",
+}
+
+# Field order of header-less *.tsv files (iptoasn.com ip2asn-v4.tsv)
+TSV_FIELDS = ("start", "end", "asn", "country", "as_org")
+
+# Values the exports use for "no data"
+EMPTY_VALUES = {"", "none", "not routed", "-", "zz"}
+
+# Memoized addresses per index
+CACHE_SIZE = 65536
+
+
+def _value(value):
+    value = (value or "").strip()
+    return "" if value.lower() in EMPTY_VALUES else value
+
+
+def _asn(value):
+    value = _value(value).upper()
+    value = value[2:] if value.startswith("AS") else value
+    try:
+        return int(value)
+    except ValueError:
+        return 0
+
+
+def _rows(path, columns):
+    name = path.lower()
+    with open_text(path) as f:
+        if name.endswith(".tsv") or name.endswith(".tsv.gz"):
+            for line in f:
+                yield dict(zip(TSV_FIELDS, line.rstrip("\r\n").split("\t")))
+        else:
+            for row in csv.DictReader(f):
+                yield {key: row.get(col) for key, col in columns.items()}
+
+
+def iter_ranges(path, columns=None):
+    """
+    Iterate over the IPv4 ranges of a range file (CSV or TSV, .gz allowed).
+
+    IPv6 rows and rows without a usable range are skipped.
+
+    Yields:
+        Tuples of (start_int, end_int, asn, country, as_org)
+    """
+    columns = dict(COLUMNS, **(columns or {}))
+    for row in _rows(path, columns):
+        if row.get("network"):
+            try:
+                net = ipaddress.ip_network(row["network"].strip(), strict=False)
+            except ValueError:
+                continue
+            if net.version != 4:
+                continue
+            start, end = int(net.network_address), int(net.broadcast_address)
+        else:
+            start, end = ipv4_int(row.get("start")), ipv4_int(row.get("end"))
+            if start is None or end is None or end < start:
+                continue
+        yield start, end, _asn(row.get("asn")), _value(row.get("country")).upper(), _value(row.get("as_org"))
+
+
+# ---------------------------------------------------------------------------
+# On-disk index
+# ---------------------------------------------------------------------------
+
+# starts, ends, ASNs, countries, AS organisations
+COLUMN_FORMATS = ("I", "I", "I", "I", "I")
+
+
+def write_index(path, ranges):
+    """
+    Write ranges to a binary index file (column_index.py layout).
+
+    Columns: starts, ends, ASNs (uint32), countries / AS organisations
+    (uint32 indexes into the string table). Ranges are assumed not to
+    overlap, as in the usual exports.
+
+    Args:
+        path: Index file path
+        ranges: Iterable from iter_ranges()
+    """
+    ranges = sorted(ranges)
+    strings = StringTable()
+    columns = [
+        array("I", (r[0] for r in ranges)),
+        array("I", (r[1] for r in ranges)),
+        array("I", (r[2] for r in ranges)),
+        array("I", (strings.intern(r[3]) for r in ranges)),
+        array("I", (strings.intern(r[4]) for r in ranges)),
+    ]
+    write_columns(path, MAGIC, len(ranges), columns, strings.strings)
+
+
+class GeoIndex:
+    """
+    Memory-mapped IPv4 range -> ASN / country index.
+
+    Args:
+        path: Index file written by write_index()
+        cache_size: Number of memoized addresses for lookup()
+    """
+
+    def __init__(self, path, cache_size=CACHE_SIZE):
+        self._columns = ColumnFile(path, MAGIC, COLUMN_FORMATS, "GeoIP")
+        self.starts, self.ends, self.asns, self.countries, self.orgs = self._columns.columns
+        self._string = self._columns.string
+
+        self.lookup = lru_cache(maxsize=cache_size)(self._lookup)
+        self._row = lru_cache(maxsize=cache_size)(self._row_dict)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def _row_dict(self, j):
+        return {
+            "asn": self.asns[j] or None,
+            "as_org": self._string(self.orgs[j]),
+            "country": self._string(self.countries[j]),
+        }
+
+    def _lookup(self, ip):
+        """
+        ASN and country of an address.
+
+        Args:
+            ip: IPv4 address string (None, IPv6 and garbage are allowed)
+
+        Returns:
+            Dict (asn, as_org, country), or None if no range holds the address
+        """
+        ip_int = ipv4_int(ip)
+        if ip_int is None:
+            return None
+        j = bisect_right(self.starts, ip_int) - 1
+        if j < 0 or self.ends[j] < ip_int:
+            return None
+        return self._row(j)
+
+    def lookup_many(self, ips):
+        """
+        Look up a batch of addresses with one vectorized binary search.
+
+        Args:
+            ips: Sequence of address strings
+
+        Returns:
+            List of lookup() results, in the same order
+        """
+        if np is None or not len(self):
+            return [self.lookup(ip) for ip in ips]
+        ints = [ipv4_int(ip) for ip in ips]
+        present = [i for i, v in enumerate(ints) if v is not None]
+        results = [None] * len(ips)
+        if not present:
+            return results
+
+        values = np.fromiter((ints[i] for i in present), dtype=np.uintc, count=len(present))
+        starts = np.frombuffer(self.starts, dtype=np.uintc)
+        ends = np.frombuffer(self.ends, dtype=np.uintc)
+        rows = np.searchsorted(starts, values, side="right") - 1
+        hit = rows >= 0
+        hit[hit] = ends[rows[hit]] >= values[hit]
+        for i, j, ok in zip(present, rows.tolist(), hit.tolist()):
+            if ok:
+                results[i] = self._row(j)
+        return results
+
+    def close(self):
+        self.lookup.cache_clear()
+        self._row.cache_clear()
+        self._columns.close()
+
+
+def load_or_build(range_paths, index_path):
+    """
+    Open the index, rebuilding it first if the set of range files changed
+    (see column_index.build_if_stale()).
+
+    Args:
+        range_paths: Range files (CSV or ip2asn TSV, .gz allowed)
+        index_path: Index file
+
+    Returns:
+        GeoIndex
+    """
+    build_if_stale(index_path, range_paths,
+                   lambda path: write_index(path, (r for p in range_paths for r in iter_ranges(p))))
+    return GeoIndex(index_path)
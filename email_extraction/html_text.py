@@ -0,0 +1,98 @@
+"""
+Streaming HTML-to-text conversion for email bodies.
+
+Text is collected straight from html.parser events; no document tree is
+built. Script/style content is skipped (the <title> is kept, as get_text()
+did), character references are decoded by the parser, block elements become
+line breaks, and conversion stops once the output reaches a size cap, so a
+huge spam body costs no more than the cap.
+"""
+
+import re
+from html.parser import HTMLParser
+
+# Output cap in characters (None = unlimited)
+MAX_TEXT_CHARS = 1_000_000
+
+# Input fed to the parser per step; the cap is checked between steps
+FEED_CHUNK = 64 * 1024
+
+SKIP_TAGS = {"script", "style", "noscript", "template"}
+
+BLOCK_TAGS = {
+    "title", "br", "p", "div", "li", "tr", "table", "ul", "ol", "blockquote", "pre",
+    "h1", "h2", "h3", "h4", "h5", "h6", "hr", "section", "article", "header", "footer",
+}
+
+BLANK_LINES_RE = re.compile(r"\n\s*\n+")
+SPACES_RE = re.compile(r"[ \t\r\f\v]+")
+
+
+class _TextExtractor(HTMLParser):
+
+    def __init__(self, max_chars):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.size = 0
+        self.max_chars = max_chars
+        self.skip_depth = 0
+
+    @property
+    def full(self):
+        return self.max_chars is not None and self.size >= self.max_chars
+
+    def _append(self, text):
+        self.parts.append(text)
+        self.size += len(text)
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "body":
+            # a skipped element left open in the head (end tags are optional) ends here
+            self.skip_depth = 0
+        if tag in SKIP_TAGS:
+            self.skip_depth += 1
+        elif tag in BLOCK_TAGS:
+            self._append("\n")
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in BLOCK_TAGS:
+            self._append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in SKIP_TAGS:
+            self.skip_depth = max(0, self.skip_depth - 1)
+        elif tag in BLOCK_TAGS:
+            self._append("\n")
+
+    def handle_data(self, data):
+        if not self.skip_depth:
+            self._append(data)
+
+
+def html_to_text(html, max_chars=MAX_TEXT_CHARS):
+    """
+    Extract the readable text of an HTML document.
+
+    Args:
+        html: HTML source
+        max_chars: Output cap in characters (None = unlimited)
+
+    Returns:
+        Text with collapsed whitespace, at most max_chars long
+    """
+    if not html:
+        return html
+    parser = _TextExtractor(max_chars)
+    for start in range(0, len(html), FEED_CHUNK):
+        parser.feed(html[start:start + FEED_CHUNK])
+        if parser.full:
+            break
+    else:
+        parser.close()
+
+    text = SPACES_RE.sub(" ", "".join(parser.parts))
+    text = BLANK_LINES_RE.sub("\n\n", text)
+    text = "\n".join(line.strip() for line in text.split("\n")).strip()
+    if max_chars is not None:
+        text = text[:max_chars]
+    return text
@@ -0,0 +1,161 @@
+"""
+Versioned indices behind a read alias.
+
+A reload writes into a new generation, <alias>-<YYYYmmddHHMMSS>, while
+dashboards keep reading the previous one through the alias. When the load is
+done the new generation is refreshed and warmed up with a few queries, the
+alias is moved to it in one atomic _aliases call, and generations beyond the
+retention count are deleted. A concrete index still carrying the alias name
+(from before indices were versioned) is dropped in that same atomic call.
+
+Every generation that goes live is also added to <alias>-published, so
+generations left behind by failed loads can be told apart from earlier
+published ones: they never count toward the retention and are deleted once a
+newer generation is live.
+"""
+
+import re
+from datetime import datetime, timezone
+
+# Generation suffix: UTC time the generation was created (sorts chronologically)
+GENERATION_FORMAT = "%Y%m%d%H%M%S"
+
+# Generations kept, the live one included
+RETENTION = 2
+
+# Queries run against a new generation before it goes live, so its segments
+# and caches are loaded before the first dashboard request
+WARM_UP_QUERIES = [
+    {"query": {"match_all": {}}, "size": 10},
+    {"query": {"match_all": {}}, "size": 0, "track_total_hits": True},
+]
+
+
+def generation_name(alias, now=None):
+    """Name of a new generation of alias, e.g. "email-data-20250728093000"."""
+    now = now or datetime.now(timezone.utc)
+    return f"{alias}-{now.strftime(GENERATION_FORMAT)}"
+
+
+def generations(client, alias):
+    """Existing generations of alias, oldest first."""
+    pattern = re.compile(re.escape(alias) + r"-\d{14}$")
+    indices = client.indices.get(index=f"{alias}-*", allow_no_indices=True, expand_wildcards="open,closed")
+    return sorted(name for name in indices if pattern.match(name))
+
+
+def aliased_indices(client, alias):
+    """Indices the alias currently points to."""
+    if not client.indices.exists_alias(name=alias):
+        return []
+    return sorted(client.indices.get_alias(name=alias))
+
+
+def published_alias(alias):
+    """Alias of every generation that has been live."""
+    return f"{alias}-published"
+
+
+def current_index(client, alias):
+    """
+    Index read through alias.
+
+    Returns:
+        The aliased generation, the legacy concrete index named alias, or
+        None if neither exists
+    """
+    aliased = aliased_indices(client, alias)
+    if aliased:
+        return aliased[-1]
+    if client.indices.exists(index=alias):
+        return alias
+    return None
+
+
+def create_generation(client, alias, body, now=None):
+    """
+    Create a new, not yet aliased generation.
+
+    Args:
+        client: opensearchpy.OpenSearch client
+        alias: Read alias
+        body: Index settings and mappings
+
+    Returns:
+        Name of the created index
+    """
+    index = generation_name(alias, now)
+    client.indices.create(index=index, body=body)
+    return index
+
+
+def warm_up(client, index, queries=WARM_UP_QUERIES):
+    """
+    Refresh an index and run the warm-up queries against it.
+
+    Returns:
+        Document count of the index
+    """
+    client.indices.refresh(index=index)
+    for query in queries:
+        client.search(index=index, body=query)
+    return client.count(index=index)["count"]
+
+
+def swap_alias(client, alias, index):
+    """
+    Point alias at index, and only at index, in one atomic request.
+
+    A legacy concrete index named alias is removed by the same request, since
+    an alias cannot share its name with an index. index is also marked as
+    published.
+    """
+    actions = [{"remove": {"index": old, "alias": alias}}
+               for old in aliased_indices(client, alias) if old != index]
+    if not client.indices.exists_alias(name=alias) and client.indices.exists(index=alias):
+        actions.append({"remove_index": {"index": alias}})
+    actions.append({"add": {"index": index, "alias": alias}})
+    actions.append({"add": {"index": index, "alias": published_alias(alias)}})
+    client.indices.update_aliases(body={"actions": actions})
+
+
+def prune(client, alias, retention=RETENTION):
+    """
+    Delete old generations; an aliased one is never deleted.
+
+    Retention counts the published generations up to the live one.
+    Unpublished generations older than the live one are left over from failed
+    loads and deleted; newer ones may still be loading and are kept.
+
+    Returns:
+        Names of the deleted indices
+    """
+    live = aliased_indices(client, alias)
+    if not live:
+        return []
+    published = set(aliased_indices(client, published_alias(alias))) | set(live)
+    older = [name for name in generations(client, alias) if name <= live[-1]]
+    kept = set([name for name in older if name in published][-max(retention, 1):]) | set(live)
+    deleted = [name for name in older if name not in kept]
+    for name in deleted:
+        client.indices.delete(index=name)
+    return deleted
+
+
+def publish(client, alias, index, retention=RETENTION, queries=WARM_UP_QUERIES):
+    """
+    Warm up a loaded generation, move alias to it and prune old generations.
+
+    Args:
+        client: opensearchpy.OpenSearch client
+        alias: Read alias
+        index: Generation to publish
+        retention: Generations kept, the new one included
+        queries: Warm-up query bodies
+
+    Returns:
+        Tuple of (document count, deleted index names)
+    """
+    count = warm_up(client, index, queries)
+    swap_alias(client, alias, index)
+    return count, prune(client, alias, retention)
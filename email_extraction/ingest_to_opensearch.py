@@ -1,26 +1,80 @@
 """
 OpenSearch Email Data Ingestion Script
 
-This script ingests email data from final_emails.json into a local OpenSearch instance.
+This script ingests email data from final_emails.ndjson into a local OpenSearch instance.
 It creates an index with proper mappings and bulk-indexes the email documents.
 """
 
+import asyncio
+import hashlib
 import json
+import os
+from contextlib import nullcontext
 from datetime import datetime
-from opensearchpy import OpenSearch, helpers
+from opensearchpy import OpenSearch
 from opensearchpy.exceptions import RequestError
 import sys
 
+from bulk_ingest import BulkIngester, bulk_load_settings
+from index_versions import create_generation, current_index, publish
+from record_io import iter_records
+
 
 # OpenSearch connection configuration
 OPENSEARCH_HOST = 'localhost'
 OPENSEARCH_PORT = 9200
-INDEX_NAME = 'email-data'
+INDEX_NAME = 'email-data'  # read alias over timestamped generations (index_versions.py)
+
+# Bulk indexing (bulk_ingest.py): concurrent requests, and request limits by
+# document count and by bytes (the byte cap adapts to bulk latency between
+# BULK_MIN_BYTES and BULK_MAX_BYTES)
+BULK_WORKERS = 4
+BULK_MAX_DOCS = 2000
+BULK_MAX_BYTES = 16 * 1024 * 1024
+BULK_MIN_BYTES = 512 * 1024
+
+# "threads": BULK_WORKERS threads over the client below
+# "async": asyncio with ASYNC_CONCURRENCY bulk requests in flight over a pooled
+#          AsyncOpenSearch client (async_ingest.py, needs opensearch-py[async])
+INGEST_MODE = "threads"
+ASYNC_CONCURRENCY = 8
+
+# Document writes. IDs are derived from the message content (document_id()),
+# so re-running on overlapping captures only adds what is new:
+# "create": write new documents, leave existing ones untouched (409 = skipped)
+# "upsert": write new documents, merge fields into existing ones
+# "index":  overwrite every document
+INGEST_OP = "create"
+
+# Full reload into a new generation (email-data-<timestamp>); the alias moves
+# to it only after the load and a warm-up, so dashboards never see an empty
+# index. Otherwise new documents are added to the live generation (and only
+# new mapping fields are added to it). The first run always creates a generation.
+NEW_GENERATION = False
+
+# Generations kept after a reload, the live one included
+INDEX_RETENTION = 2
+
+# Failed documents a new generation may have and still go live. Above this the
+# generation is left unpublished (pruned by a later reload), the alias keeps
+# pointing at the previous one and the script exits with status 1.
+MAX_FAILED_DOCS = 0
+
+# Bulk-load mode for new generations (bulk_ingest.bulk_load_settings): refresh
+# off and no replicas while loading, optionally asynchronous translog fsync;
+# the settings are restored afterwards, then the index is refreshed and, with
+# FORCE_MERGE_SEGMENTS set, force-merged. A crashed load leaves only an
+# unpublished generation behind, never a degraded live index. Incremental
+# loads into the live generation keep its settings.
+BULK_LOAD_TUNING = True
+BULK_LOAD_ASYNC_TRANSLOG = False
+FORCE_MERGE_SEGMENTS = None  # e.g. 1 for a generation that is not written again
 
 # Initialize OpenSearch client (no authentication since security is disabled)
 client = OpenSearch(
     hosts=[{'host': OPENSEARCH_HOST, 'port': OPENSEARCH_PORT}],
     http_compress=True,
+    pool_maxsize=BULK_WORKERS,  # one pooled connection per bulk worker
     use_ssl=False,
     verify_certs=False,
     ssl_assert_hostname=False,
@@ -30,7 +84,11 @@ client = OpenSearch(
 
 def create_index_with_mapping():
     """
-    Create the OpenSearch index with proper field mappings for email data.
+    Prepare the index to load into, with proper field mappings for email data.
+
+    Returns:
+        Tuple of (index name, True if it is a new generation still to be
+        published), or (None, False) on error
     """
     index_mapping = {
         "settings": {
@@ -70,14 +128,22 @@ def create_index_with_mapping():
                             "properties": {
                                 "ip": {"type": "ip"},
                                 "port": {"type": "keyword"},
-                                "is_private": {"type": "boolean"}
+                                "is_private": {"type": "boolean"},
+                                "category": {"type": "keyword"},
+                                "asn": {"type": "keyword"},
+                                "as_org": {"type": "keyword"},
+                                "country": {"type": "keyword"}
                             }
                         },
                         "destination": {
                             "properties": {
                                 "ip": {"type": "ip"},
                                 "port": {"type": "keyword"},
-                                "is_private": {"type": "boolean"}
+                                "is_private": {"type": "boolean"},
+                                "category": {"type": "keyword"},
+                                "asn": {"type": "keyword"},
+                                "as_org": {"type": "keyword"},
+                                "country": {"type": "keyword"}
                             }
                         }
                     }
@@ -87,12 +153,23 @@ def create_index_with_mapping():
                     "properties": {
                         "cgnat": {
                             "properties": {
-                                "matched": {"type": "boolean"}
+                                "matched": {"type": "boolean"},
+                                "side": {"type": "keyword"},
+                                "subscriber_id": {"type": "keyword"},
+                                "public_ip": {"type": "ip"},
+                                "private_ip": {"type": "ip"},
+                                "private_port": {"type": "keyword"}
                             }
                         },
                         "radius": {
                             "properties": {
-                                "session_found": {"type": "boolean"}
+                                "session_found": {"type": "boolean"},
+                                "framed_ip": {"type": "ip"},
+                                "username": {"type": "keyword"},
+                                "acct_session_id": {"type": "keyword"},
+                                "calling_station_id": {"type": "keyword"},
+                                "session_start": {"type": "date", "format": "epoch_second"},
+                                "session_stop": {"type": "date", "format": "epoch_second"}
                             }
                         }
                     }
@@ -102,101 +179,204 @@ def create_index_with_mapping():
     }
     
     try:
-        # Delete index if it exists
-        if client.indices.exists(index=INDEX_NAME):
-            print(f"Index '{INDEX_NAME}' already exists. Deleting...")
-            client.indices.delete(index=INDEX_NAME)
-            print(f"Index '{INDEX_NAME}' deleted.")
+        current = current_index(client, INDEX_NAME)
+        if current and not NEW_GENERATION:
+            # IDs are stable, so the existing documents stay; only add new fields
+            print(f"Index '{current}' is live. Updating mappings...")
+            client.indices.put_mapping(index=current, body=index_mapping["mappings"])
+            print(f"Index '{current}' kept; new documents will be added.")
+            return current, False
         
-        # Create new index
-        print(f"Creating index '{INDEX_NAME}'...")
-        client.indices.create(index=INDEX_NAME, body=index_mapping)
-        print(f"Index '{INDEX_NAME}' created successfully with mappings.")
-        return True
+        # Create a new generation; the alias keeps serving the old one meanwhile
+        index = create_generation(client, INDEX_NAME, index_mapping)
+        print(f"Index '{index}' created successfully with mappings.")
+        return index, True
         
     except RequestError as e:
         print(f"Error creating index: {e}")
+        return None, False
+
+
+def publish_generation(index, success_count, failed_count):
+    """
+    Warm up a loaded generation and move the read alias to it.
+
+    A generation with more than MAX_FAILED_DOCS failed documents is left
+    unpublished, and one into which nothing was indexed is deleted; in both
+    cases the alias stays where it is.
+
+    Returns:
+        False if the generation was held back because documents failed
+    """
+    if failed_count > MAX_FAILED_DOCS:
+        print(f"{failed_count} documents failed (limit {MAX_FAILED_DOCS}); "
+              f"'{index}' left unpublished, alias '{INDEX_NAME}' unchanged.")
         return False
+    if not success_count:
+        print(f"Nothing indexed into '{index}'; deleting it, alias '{INDEX_NAME}' unchanged.")
+        client.indices.delete(index=index)
+        return True
+    print(f"Warming up '{index}' and moving alias '{INDEX_NAME}' to it...")
+    count, deleted = publish(client, INDEX_NAME, index, retention=INDEX_RETENTION)
+    print(f"Alias '{INDEX_NAME}' -> '{index}' ({count} documents)")
+    if deleted:
+        print(f"Deleted old generations: {', '.join(deleted)}")
+    return True
 
 
 def load_email_data(json_file_path):
     """
-    Load email data from JSON file.
+    Stream email data from an NDJSON file (or a legacy JSON array export).
     
     Args:
-        json_file_path: Path to the JSON file containing email data
+        json_file_path: Path to the file containing email data
         
     Returns:
-        List of email documents
+        Iterator of email documents, read lazily while indexing
     """
     print(f"Loading data from {json_file_path}...")
-    try:
-        with open(json_file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        print(f"Loaded {len(data)} email records.")
-        return data
-    except FileNotFoundError:
+    if not os.path.isfile(json_file_path):
         print(f"Error: File not found - {json_file_path}")
         sys.exit(1)
+    return _iter_email_data(json_file_path)
+
+
+def _iter_email_data(json_file_path):
+    try:
+        yield from iter_records(json_file_path)
     except json.JSONDecodeError as e:
         print(f"Error: Invalid JSON format - {e}")
         sys.exit(1)
 
 
-def prepare_bulk_data(email_data):
+def _text_digest(value):
+    return hashlib.sha256(value.encode("utf-8")).hexdigest() if value else None
+
+
+def document_id(email):
+    """
+    Stable document ID derived from the message content.
+
+    The same message seen again (in an overlapping or re-processed capture)
+    gets the same ID, whatever its position in the input file.
+
+    Args:
+        email: Final email document
+
+    Returns:
+        Hex SHA-256 of the Message-ID, subject and date, the body and
+        attachment digests, and the flow key (protocol, source and destination
+        IP / port)
+    """
+    message = email.get("message") or {}
+    network = email.get("network") or {}
+    source = network.get("source") or {}
+    destination = network.get("destination") or {}
+    key = [
+        message.get("message_id"),
+        message.get("subject"),
+        email.get("timestamp"),
+        _text_digest(message.get("body_text")),
+        _text_digest(message.get("body_html")),
+        sorted(a.get("sha256") or a.get("md5") or a.get("filename") or ""
+               for a in email.get("attachments") or []),
+        [network.get("protocol"), source.get("ip"), source.get("port"),
+         destination.get("ip"), destination.get("port")],
+    ]
+    material = json.dumps(key, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def prepare_bulk_data(email_data, index):
     """
-    Prepare email data for bulk indexing.
+    Prepare email data for bulk indexing (see INGEST_OP).
     
     Args:
-        email_data: List of email documents
+        email_data: Iterable of email documents
+        index: Index to write into
         
     Yields:
         Documents formatted for bulk indexing
     """
-    for idx, email in enumerate(email_data):
-        yield {
-            "_index": INDEX_NAME,
-            "_id": idx + 1,  # Use sequential IDs
-            "_source": email
-        }
+    for email in email_data:
+        action = {"_index": index, "_id": document_id(email)}
+        if INGEST_OP == "create":
+            action.update(_op_type="create", _source=email)
+        elif INGEST_OP == "upsert":
+            action.update(_op_type="update", _source={"doc": email, "doc_as_upsert": True})
+        else:
+            action.update(_op_type="index", _source=email)
+        yield action
 
 
-def bulk_index_data(email_data):
+def bulk_index_data(email_data, index):
     """
     Bulk index email data into OpenSearch.
     
     Args:
-        email_data: List of email documents
+        email_data: Iterable of email documents (streamed, never held in memory)
+        index: Index to write into
         
     Returns:
-        Tuple of (success_count, failed_count)
+        Tuple of (success_count, skipped_count, failed_count); skipped
+        documents already existed (INGEST_OP = "create")
     """
-    print(f"Starting bulk indexing of {len(email_data)} documents...")
+    print(f"Starting bulk indexing ({INGEST_OP})...")
+    processed = 0
+
+    def counted():
+        nonlocal processed
+        for email in email_data:
+            processed += 1
+            yield email
     
+    limits = dict(max_docs=BULK_MAX_DOCS, max_bytes=BULK_MAX_BYTES, min_bytes=BULK_MIN_BYTES,
+                  skip_statuses={409} if INGEST_OP == "create" else ())
+
     try:
-        # Use the helpers.bulk function for efficient bulk indexing
-        success, failed = helpers.bulk(
-            client,
-            prepare_bulk_data(email_data),
-            chunk_size=500,
-            request_timeout=60,
-            raise_on_error=False,
-            stats_only=False
-        )
+        # Concurrent, size-capped bulk requests; 429 rejections are retried with backoff
+        if INGEST_MODE == "async":
+            success, failed, stats = asyncio.run(async_bulk_index(prepare_bulk_data(counted(), index), limits))
+        else:
+            ingester = BulkIngester(client, workers=BULK_WORKERS, **limits)
+            success, failed = ingester.bulk(prepare_bulk_data(counted(), index))
+            stats = ingester.stats()
         
         print(f"Bulk indexing completed.")
         print(f"Successfully indexed: {success} documents")
+        print(f"Already indexed (skipped): {stats['skipped_items']} documents")
+        print(f"Bulk stats: {stats}")
         
         if failed:
             print(f"Failed to index: {len(failed)} documents")
             for item in failed[:5]:  # Show first 5 failures
                 print(f"  - {item}")
         
-        return success, len(failed) if failed else 0
+        return success, stats['skipped_items'], len(failed) if failed else 0
         
     except Exception as e:
         print(f"Error during bulk indexing: {e}")
-        return 0, len(email_data)
+        return 0, 0, processed
+
+
+async def async_bulk_index(actions, limits):
+    """
+    Index actions over an AsyncOpenSearch client (INGEST_MODE = "async").
+
+    Returns:
+        Tuple of (success_count, failed items, stats dict)
+    """
+    # imported here so the default mode does not need the async extra (aiohttp)
+    from async_ingest import ingest, make_client
+
+    async_client = make_client(
+        [{'host': OPENSEARCH_HOST, 'port': OPENSEARCH_PORT}],
+        concurrency=ASYNC_CONCURRENCY,
+        use_ssl=False,
+        verify_certs=False,
+        ssl_show_warn=False
+    )
+    return await ingest(async_client, actions, ASYNC_CONCURRENCY, **limits)
 
 
 def verify_indexing():
@@ -259,16 +439,27 @@ def main():
         sys.exit(1)
     
     # Create index with mappings
-    if not create_index_with_mapping():
+    index, new_generation = create_index_with_mapping()
+    if index is None:
         print("Failed to create index. Exiting.")
         sys.exit(1)
     
     # Load email data
-    json_file_path = r"D:\Opensearch\Open-Search-Data-Intelligence\email_extraction\final_emails.json"
+    json_file_path = r"D:\Opensearch\Open-Search-Data-Intelligence\email_extraction\final_emails.ndjson"
     email_data = load_email_data(json_file_path)
     
     # Bulk index the data
-    success_count, failed_count = bulk_index_data(email_data)
+    load_mode = nullcontext()
+    if new_generation and BULK_LOAD_TUNING:
+        load_mode = bulk_load_settings(client, index, async_translog=BULK_LOAD_ASYNC_TRANSLOG,
+                                       force_merge_segments=FORCE_MERGE_SEGMENTS)
+    with load_mode:
+        success_count, skipped_count, failed_count = bulk_index_data(email_data, index)
+    
+    # Put a new generation live
+    published = True
+    if new_generation:
+        published = publish_generation(index, success_count, failed_count)
     
     # Verify the indexing
     verify_indexing()
@@ -277,14 +468,18 @@ def main():
     print("\n" + "=" * 60)
     print("SUMMARY")
     print("=" * 60)
-    print(f"Total records processed: {len(email_data)}")
+    print(f"Total records processed: {success_count + skipped_count + failed_count}")
     print(f"Successfully indexed: {success_count}")
+    print(f"Already indexed: {skipped_count}")
     print(f"Failed: {failed_count}")
-    print(f"Index name: {INDEX_NAME}")
+    print(f"Index name: {INDEX_NAME} -> {current_index(client, INDEX_NAME)}")
     print(f"\nYou can now query your data at: http://{OPENSEARCH_HOST}:{OPENSEARCH_PORT}/{INDEX_NAME}/_search")
     print(f"OpenSearch Dashboards: http://{OPENSEARCH_HOST}:5601")
     print("=" * 60)
 
+    if not published:
+        sys.exit(1)
+
 
 if __name__ == "__main__":
     main()
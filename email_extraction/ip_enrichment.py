@@ -0,0 +1,127 @@
+"""
+Compiled CIDR classification of IP addresses.
+
+Address ranges (private, CGNAT shared space, our customer ranges, known MX
+ranges, ...) are compiled once into one hash table per prefix length, keyed
+by the network address as an integer. An address is converted to an integer
+once and classified by probing the prefix lengths from the most to the least
+specific, so the most specific range wins. Results are memoized, since flow
+records repeat the same few addresses over and over.
+"""
+
+import ipaddress
+from functools import lru_cache
+
+# Built-in ranges, by category
+DEFAULT_RANGES = {
+    "private": ["10.0.0.0/8", "172.16.0.0/12", "192.168.0.0/16", "fc00::/7"],
+    "cgnat": ["100.64.0.0/10"],
+    "loopback": ["127.0.0.0/8", "::1/128"],
+    "link_local": ["169.254.0.0/16", "fe80::/10"],
+    "reserved": [
+        "0.0.0.0/8", "192.0.0.0/24", "192.0.2.0/24", "198.18.0.0/15",
+        "198.51.100.0/24", "203.0.113.0/24", "240.0.0.0/4", "2001:db8::/32",
+    ],
+    "multicast": ["224.0.0.0/4", "ff00::/8"],
+}
+
+# Category of addresses no range matches
+PUBLIC = "public"
+
+# Memoized addresses per classifier
+CACHE_SIZE = 65536
+
+
+class CidrTable:
+    """
+    Longest-prefix-match table of CIDR ranges to labels.
+
+    Args:
+        ranges: Mapping of label -> iterable of CIDR strings
+    """
+
+    def __init__(self, ranges):
+        # (version, prefix length) -> {network int: label}
+        self._tables = {}
+        for label, cidrs in ranges.items():
+            for cidr in cidrs:
+                net = ipaddress.ip_network(cidr, strict=False)
+                table = self._tables.setdefault((net.version, net.prefixlen), {})
+                table[int(net.network_address)] = label
+
+        # probe order per IP version: most specific prefix first
+        self._probes = {}
+        for version, bits in ((4, 32), (6, 128)):
+            self._probes[version] = [
+                (bits - prefixlen, self._tables[(version, prefixlen)])
+                for prefixlen in range(bits, -1, -1)
+                if (version, prefixlen) in self._tables
+            ]
+
+    def lookup_int(self, version, value):
+        """Label of the most specific range holding an integer address, or None."""
+        for shift, table in self._probes[version]:
+            label = table.get(value >> shift << shift)
+            if label is not None:
+                return label
+        return None
+
+    def lookup(self, ip):
+        """Label of the most specific range holding an address string, or None."""
+        try:
+            addr = ipaddress.ip_address(ip)
+        except ValueError:
+            return None
+        return self.lookup_int(addr.version, int(addr))
+
+
+class IpClassifier:
+    """
+    Memoized IP classification against the built-in and extra ranges.
+
+    Args:
+        extra: Mapping of label -> CIDRs added to DEFAULT_RANGES, e.g.
+            {"customer": [...], "mx": [...]}; they win over broader built-in ranges
+        cache_size: Number of memoized addresses
+    """
+
+    def __init__(self, extra=None, cache_size=CACHE_SIZE):
+        ranges = {label: list(cidrs) for label, cidrs in DEFAULT_RANGES.items()}
+        for label, cidrs in (extra or {}).items():
+            ranges.setdefault(label, []).extend(cidrs)
+        self.table = CidrTable(ranges)
+        self.classify = lru_cache(maxsize=cache_size)(self._classify)
+
+    def _classify(self, ip):
+        """
+        Classify an address.
+
+        Args:
+            ip: Address string (None and garbage are allowed)
+
+        Returns:
+            Tuple of (category, is_private); (None, None) if ip is not an address
+        """
+        try:
+            addr = ipaddress.ip_address(ip)
+        except (TypeError, ValueError):
+            return None, None
+        category = self.table.lookup_int(addr.version, int(addr)) or PUBLIC
+        return category, addr.is_private
+
+    def category(self, ip):
+        return self.classify(ip)[0]
+
+    def is_private(self, ip):
+        return self.classify(ip)[1]
+
+
+_default = None
+
+
+def default_classifier():
+    """Shared classifier over DEFAULT_RANGES only."""
+    global _default
+    if _default is None:
+        _default = IpClassifier()
+    return _default
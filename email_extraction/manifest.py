@@ -0,0 +1,198 @@
+"""
+Persistent manifest for incremental, resumable extraction.
+
+The manifest is an append-only NDJSON file. It remembers the SHA-256 of every
+capture processed and, per capture, the content hash of every message already
+parsed together with the offset of the record it produced. The records
+themselves go to a sidecar file per stage (<manifest>.<stage hash>.records).
+A re-run skips captures that were fully processed and messages already
+parsed; a run that crashed picks up after the last message it recorded.
+Entries are scoped to a stage key (the settings that shape the records), so
+changing a stage reprocesses its input; entries and record files of other
+stages are dropped when the manifest is opened.
+"""
+
+import glob
+import hashlib
+import json
+import os
+
+# Bytes read per step when hashing a capture
+HASH_CHUNK_SIZE = 4 * 1024 * 1024
+
+
+def file_sha256(path, chunk_size=HASH_CHUNK_SIZE):
+    """SHA-256 hex digest of a file, read in chunks."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def content_sha256(raw: bytes):
+    """SHA-256 hex digest of a message's raw bytes."""
+    return hashlib.sha256(raw).hexdigest()
+
+
+def truncate_torn_tail(path, block_size=64 * 1024):
+    """Cut a line-oriented file back to its last newline (a crash can leave half a line)."""
+    with open(path, "rb+") as f:
+        size = end = f.seek(0, os.SEEK_END)
+        while end > 0:
+            start = max(0, end - block_size)
+            f.seek(start)
+            newline = f.read(end - start).rfind(b"\n")
+            if newline >= 0:
+                end = start + newline + 1
+                break
+            end = start
+        if end != size:
+            f.truncate(end)
+
+
+class ExtractionManifest:
+    """
+    Append-only record of processed captures and messages for one stage.
+
+    Args:
+        path: Manifest file (created if missing)
+        stage: Stage key, e.g. "emails:native:full:md5,sha256"
+    """
+
+    def __init__(self, path, stage):
+        self.path = path
+        self.stage = stage
+        self.records_path = f"{path}.{hashlib.sha256(stage.encode('utf-8')).hexdigest()[:16]}.records"
+        self.captures = {}      # (path, size, mtime_ns) -> capture digest
+        self.completed = set()  # capture digests fully processed by this stage
+        self.done = set()       # (capture digest, message digest, occurrence)
+
+        stale = 0
+        if os.path.exists(path):
+            # new entries must not be appended to a half-written line
+            truncate_torn_tail(path)
+            for entry in self._iter_entries():
+                kind = entry.get("kind")
+                if kind == "capture":
+                    self.captures[(entry["path"], entry["size"], entry["mtime_ns"])] = entry["pcap"]
+                elif entry.get("stage") != stage:
+                    stale += 1
+                elif kind == "message":
+                    self.done.add((entry["pcap"], entry["message"], entry["occurrence"]))
+                elif kind == "complete":
+                    self.completed.add(entry["pcap"])
+            if stale:
+                self._compact()
+        if os.path.exists(self.records_path):
+            truncate_torn_tail(self.records_path)
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._out = open(path, "a", encoding="utf-8")
+        self._records = open(self.records_path, "ab")
+
+    def _iter_entries(self):
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                yield json.loads(line)
+
+    def _compact(self):
+        # keep capture digests and this stage's entries; other stages' record files go
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as out:
+            for entry in self._iter_entries():
+                if entry.get("kind") == "capture" or entry.get("stage") == self.stage:
+                    out.write(json.dumps(entry, ensure_ascii=False))
+                    out.write("\n")
+        os.replace(tmp_path, self.path)
+        for records_path in glob.glob(glob.escape(self.path) + ".*.records"):
+            if records_path != self.records_path:
+                os.remove(records_path)
+
+    def _append(self, entry):
+        self._out.write(json.dumps(entry, ensure_ascii=False))
+        self._out.write("\n")
+        self._out.flush()
+
+    def capture_digest(self, pcap):
+        """
+        SHA-256 of a capture, reused from the manifest while its size and mtime are unchanged.
+
+        Args:
+            pcap: Path to the capture file
+
+        Returns:
+            Hex digest
+        """
+        st = os.stat(pcap)
+        key = (os.path.abspath(pcap), st.st_size, st.st_mtime_ns)
+        digest = self.captures.get(key)
+        if digest is None:
+            digest = file_sha256(pcap)
+            self.captures[key] = digest
+            self._append({"kind": "capture", "path": key[0], "size": key[1], "mtime_ns": key[2], "pcap": digest})
+        return digest
+
+    def is_complete(self, pcap_digest):
+        return pcap_digest in self.completed
+
+    def is_done(self, pcap_digest, message_digest, occurrence=0):
+        return (pcap_digest, message_digest, occurrence) in self.done
+
+    def add_message(self, pcap_digest, message_digest, occurrence, record):
+        """
+        Record a parsed message; flushed immediately so a crash loses at most this entry.
+
+        The record is written to the stage's records file first, so an entry
+        in the manifest always points at a complete record.
+
+        Args:
+            pcap_digest: Capture digest
+            message_digest: content_sha256() of the message
+            occurrence: How many identical messages came before it in the capture
+            record: Email record, or None if the message was unparseable
+        """
+        offset = None
+        if record is not None:
+            offset = self._records.tell()
+            self._records.write(json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n")
+            self._records.flush()
+        self.done.add((pcap_digest, message_digest, occurrence))
+        self._append({
+            "kind": "message",
+            "stage": self.stage,
+            "pcap": pcap_digest,
+            "message": message_digest,
+            "occurrence": occurrence,
+            "offset": offset,
+        })
+
+    def mark_complete(self, pcap_digest):
+        """Record that every message of a capture has been processed."""
+        self.completed.add(pcap_digest)
+        os.fsync(self._records.fileno())
+        self._append({"kind": "complete", "stage": self.stage, "pcap": pcap_digest})
+        os.fsync(self._out.fileno())
+
+    def iter_records(self, pcap_digest):
+        """
+        Yield the email records of a capture in the order they were recorded (capture order).
+
+        Args:
+            pcap_digest: Capture digest
+
+        Yields:
+            Email record dicts (unparseable messages are left out)
+        """
+        self._out.flush()
+        self._records.flush()
+        with open(self.records_path, "rb") as records:
+            for entry in self._iter_entries():
+                if (entry.get("kind") == "message" and entry.get("stage") == self.stage
+                        and entry.get("pcap") == pcap_digest and entry.get("offset") is not None):
+                    records.seek(entry["offset"])
+                    yield json.loads(records.readline())
+
+    def close(self):
+        self._out.close()
+        self._records.close()
@@ -0,0 +1,667 @@
+"""
+Native PCAP/PCAPNG reader with SMTP TCP stream reassembly.
+
+The capture is memory-mapped and walked record by record, frames are decoded
+down to TCP, and every SMTP connection is reassembled in sequence order so the
+DATA payload of each message can be handed to the email parser as bytes.
+Nothing is exported to disk and tshark is not needed.
+"""
+
+import ipaddress
+import mmap
+import struct
+from collections import namedtuple
+
+from flow_records import LINE_SEPARATOR, make_flow, ordered_endpoints
+
+# Server ports whose TCP connections are reassembled as SMTP
+SMTP_PORTS = {25, 587, 2525}
+
+# Link-layer types we know how to strip
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LOOP = 108
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_LINUX_SLL2 = 276
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+# Raw IP under the platform-specific DLT_RAW values some old captures carry
+LINKTYPE_RAW_OPENBSD = 12
+LINKTYPE_RAW_BSDOS = 14
+
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_IPV6 = 0x86DD
+ETHERTYPE_VLAN = {0x8100, 0x88A8, 0x9100}
+
+TCP_FIN = 0x01
+TCP_SYN = 0x02
+TCP_RST = 0x04
+TCP_ACK = 0x10
+
+SEQ_MASK = 0xFFFFFFFF
+
+# Give up waiting for a missing segment once this many bytes are queued behind it
+MAX_PENDING_BYTES = 4 * 1024 * 1024
+
+TcpSegment = namedtuple(
+    "TcpSegment",
+    ["timestamp", "src_ip", "src_port", "dst_ip", "dst_port", "seq", "flags", "payload", "frame_len"],
+)
+
+SmtpMessage = namedtuple("SmtpMessage", ["tcp_stream", "timestamp", "raw"])
+
+
+# ---------------------------------------------------------------------------
+# Capture file records
+# ---------------------------------------------------------------------------
+
+def iter_packets(path):
+    """
+    Iterate over the raw frames of a PCAP or PCAPNG file.
+
+    Args:
+        path: Path to the capture file
+
+    Yields:
+        Tuples of (timestamp, linktype, frame_bytes, original_length)
+    """
+    with open(path, "rb") as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return  # empty file
+        try:
+            magic = mm[:4]
+            if magic == b"\x0a\x0d\x0d\x0a":
+                yield from _iter_pcapng(mm)
+            else:
+                yield from _iter_pcap(mm)
+        finally:
+            mm.close()
+
+
+def _iter_pcap(mm):
+    magic = mm[:4]
+    if magic in (b"\xd4\xc3\xb2\xa1", b"\x4d\x3c\xb2\xa1"):
+        endian = "<"
+    elif magic in (b"\xa1\xb2\xc3\xd4", b"\xa1\xb2\x3c\x4d"):
+        endian = ">"
+    else:
+        raise ValueError("Not a PCAP/PCAPNG file")
+
+    # nanosecond-resolution variant uses a different magic
+    ts_div = 1e9 if magic in (b"\x4d\x3c\xb2\xa1", b"\xa1\xb2\x3c\x4d") else 1e6
+    linktype = struct.unpack_from(endian + "I", mm, 20)[0] & 0x0FFFFFFF
+
+    record = struct.Struct(endian + "IIII")
+    offset = 24
+    end = len(mm)
+    while offset + 16 <= end:
+        ts_sec, ts_frac, incl_len, orig_len = record.unpack_from(mm, offset)
+        offset += 16
+        if offset + incl_len > end:
+            break  # truncated capture
+        yield ts_sec + ts_frac / ts_div, linktype, mm[offset:offset + incl_len], orig_len
+        offset += incl_len
+
+
+def _iter_pcapng(mm):
+    endian = "<"
+    interfaces = []  # (linktype, ticks_per_second) per interface id
+    offset = 0
+    end = len(mm)
+    while offset + 12 <= end:
+        if mm[offset:offset + 4] == b"\x0a\x0d\x0d\x0a":
+            # Section Header Block: byte order is given by its magic
+            bom = mm[offset + 8:offset + 12]
+            endian = "<" if bom == b"\x4d\x3c\x2b\x1a" else ">"
+            interfaces = []
+
+        block_type, block_len = struct.unpack_from(endian + "II", mm, offset)
+        if block_len < 12 or offset + block_len > end:
+            break
+        body = offset + 8
+
+        if block_type == 1:  # Interface Description Block
+            linktype = struct.unpack_from(endian + "H", mm, body)[0]
+            tsresol = _pcapng_tsresol(mm, endian, body + 8, offset + block_len - 4)
+            interfaces.append((linktype, tsresol))
+
+        elif block_type in (6, 2):  # Enhanced / obsolete Packet Block
+            if block_type == 6:
+                if_id, ts_high, ts_low, cap_len, orig_len = struct.unpack_from(endian + "IIIII", mm, body)
+            else:
+                if_id, _drops, ts_high, ts_low, cap_len, orig_len = struct.unpack_from(endian + "HHIIII", mm, body)
+            data = body + 20
+            if if_id < len(interfaces):
+                linktype, tsresol = interfaces[if_id]
+                ts = ((ts_high << 32) | ts_low) / tsresol
+                yield ts, linktype, mm[data:data + cap_len], orig_len
+
+        elif block_type == 3:  # Simple Packet Block (no timestamp)
+            if interfaces:
+                orig_len = struct.unpack_from(endian + "I", mm, body)[0]
+                cap_len = min(orig_len, block_len - 16)
+                yield 0.0, interfaces[0][0], mm[body + 4:body + 4 + cap_len], orig_len
+
+        offset += block_len
+
+
+def _pcapng_tsresol(mm, endian, offset, end):
+    # Walk IDB options looking for if_tsresol (code 9); default is microseconds
+    while offset + 4 <= end:
+        code, length = struct.unpack_from(endian + "HH", mm, offset)
+        if code == 0:
+            break
+        if code == 9 and length >= 1:
+            value = mm[offset + 4]
+            if value & 0x80:
+                return float(2 ** (value & 0x7F))
+            return float(10 ** value)
+        offset += 4 + ((length + 3) & ~3)
+    return 1e6
+
+
+# ---------------------------------------------------------------------------
+# Frame decoding
+# ---------------------------------------------------------------------------
+
+def decode_tcp(timestamp, linktype, frame, frame_len=None):
+    """
+    Decode a link-layer frame down to its TCP segment.
+
+    Args:
+        timestamp: Capture timestamp (epoch seconds)
+        linktype: Link-layer type of the frame
+        frame: Raw frame bytes
+        frame_len: Original frame length on the wire
+
+    Returns:
+        TcpSegment, or None when the frame is not IPv4/IPv6 TCP
+    """
+    ethertype, offset = _strip_link_layer(linktype, frame)
+    if ethertype is None:
+        return None
+
+    if ethertype == ETHERTYPE_IPV4:
+        if len(frame) < offset + 20:
+            return None
+        ihl = (frame[offset] & 0x0F) * 4
+        total_len = struct.unpack_from("!H", frame, offset + 2)[0]
+        frag = struct.unpack_from("!H", frame, offset + 6)[0]
+        if frame[offset + 9] != 6 or frag & 0x1FFF:
+            return None  # not TCP, or a non-first fragment
+        src_ip = _ipv4(frame[offset + 12:offset + 16])
+        dst_ip = _ipv4(frame[offset + 16:offset + 20])
+        ip_end = offset + total_len if total_len else len(frame)
+        offset += ihl
+
+    elif ethertype == ETHERTYPE_IPV6:
+        if len(frame) < offset + 40:
+            return None
+        payload_len = struct.unpack_from("!H", frame, offset + 4)[0]
+        next_header = frame[offset + 6]
+        src_ip = _ipv6(frame[offset + 8:offset + 24])
+        dst_ip = _ipv6(frame[offset + 24:offset + 40])
+        ip_end = offset + 40 + payload_len
+        offset += 40
+        # hop-by-hop, routing and destination options headers
+        while next_header in (0, 43, 60) and len(frame) >= offset + 8:
+            next_header, ext_len = frame[offset], frame[offset + 1]
+            offset += (ext_len + 1) * 8
+        if next_header != 6:
+            return None
+
+    else:
+        return None
+
+    if len(frame) < offset + 20:
+        return None
+    src_port, dst_port, seq = struct.unpack_from("!HHI", frame, offset)
+    data_offset = (frame[offset + 12] >> 4) * 4
+    flags = frame[offset + 13]
+    payload = frame[offset + data_offset:min(ip_end, len(frame))]
+
+    return TcpSegment(
+        timestamp, src_ip, src_port, dst_ip, dst_port, seq, flags, payload,
+        frame_len if frame_len is not None else len(frame),
+    )
+
+
+def _strip_link_layer(linktype, frame):
+    # Returns (ethertype, offset of the network header)
+    if linktype == LINKTYPE_ETHERNET:
+        if len(frame) < 14:
+            return None, 0
+        ethertype = struct.unpack_from("!H", frame, 12)[0]
+        offset = 14
+        while ethertype in ETHERTYPE_VLAN and len(frame) >= offset + 4:
+            ethertype = struct.unpack_from("!H", frame, offset + 2)[0]
+            offset += 4
+        return ethertype, offset
+
+    if linktype == LINKTYPE_LINUX_SLL:
+        if len(frame) < 16:
+            return None, 0
+        return struct.unpack_from("!H", frame, 14)[0], 16
+
+    if linktype == LINKTYPE_LINUX_SLL2:
+        if len(frame) < 20:
+            return None, 0
+        return struct.unpack_from("!H", frame, 0)[0], 20
+
+    if linktype in (LINKTYPE_NULL, LINKTYPE_LOOP):
+        # 4-byte address family in host (NULL) or network (LOOP) byte order
+        if len(frame) < 5:
+            return None, 0
+        return _ethertype_from_version(frame[4]), 4
+
+    if linktype in (LINKTYPE_RAW, LINKTYPE_IPV4, LINKTYPE_IPV6, LINKTYPE_RAW_OPENBSD, LINKTYPE_RAW_BSDOS):
+        if not frame:
+            return None, 0
+        return _ethertype_from_version(frame[0]), 0
+
+    return None, 0
+
+
+def _ethertype_from_version(first_byte):
+    version = first_byte >> 4
+    if version == 4:
+        return ETHERTYPE_IPV4
+    if version == 6:
+        return ETHERTYPE_IPV6
+    return None
+
+
+def _ipv4(raw):
+    return "%d.%d.%d.%d" % tuple(raw)
+
+
+def _ipv6(raw):
+    return str(ipaddress.IPv6Address(bytes(raw)))
+
+
+# ---------------------------------------------------------------------------
+# SMTP stream reassembly
+# ---------------------------------------------------------------------------
+
+class _Direction:
+    """One half of a TCP connection: in-order byte delivery from segments."""
+
+    __slots__ = ("next_seq", "pending", "pending_bytes")
+
+    def __init__(self):
+        self.next_seq = None
+        self.pending = {}
+        self.pending_bytes = 0
+
+    def push(self, seq, flags, payload):
+        """Accept a segment and return the bytes that are now in order."""
+        if flags & TCP_SYN:
+            self.next_seq = (seq + 1) & SEQ_MASK
+            seq = self.next_seq
+        if not payload:
+            return b""
+        if self.next_seq is None:
+            self.next_seq = seq  # capture started mid-connection
+
+        diff = (seq - self.next_seq) & SEQ_MASK
+        if diff >= 0x80000000:
+            # starts before what we already have: retransmission or overlap
+            overlap = (self.next_seq - seq) & SEQ_MASK
+            if overlap >= len(payload):
+                return b""
+            payload = payload[overlap:]
+            diff = 0
+
+        if diff:
+            if seq not in self.pending:
+                self.pending[seq] = payload
+                self.pending_bytes += len(payload)
+            if self.pending_bytes <= MAX_PENDING_BYTES:
+                return b""
+            # the missing segment is never coming; skip the hole
+            self.next_seq = min(self.pending, key=lambda s: (s - self.next_seq) & SEQ_MASK)
+            return self._drain(b"")
+
+        self.next_seq = (self.next_seq + len(payload)) & SEQ_MASK
+        return self._drain(payload)
+
+    def _drain(self, data):
+        if not self.pending:
+            return data
+        chunks = [data]
+        while True:
+            seg = self.pending.pop(self.next_seq, None)
+            if seg is None:
+                break
+            self.pending_bytes -= len(seg)
+            chunks.append(seg)
+            self.next_seq = (self.next_seq + len(seg)) & SEQ_MASK
+        return b"".join(chunks)
+
+
+class _SmtpClientStream:
+    """Client-to-server SMTP parser that cuts DATA/BDAT bodies out of the stream."""
+
+    __slots__ = ("buffer", "mode", "body", "scanned", "bdat_remaining", "bdat_last", "encrypted",
+                 "commands")
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.mode = "command"
+        self.body = bytearray()
+        self.scanned = 0
+        self.bdat_remaining = 0
+        self.bdat_last = False
+        self.encrypted = False
+        self.commands = []
+
+    def feed(self, data):
+        """
+        Consume in-order client bytes and return the list of finished messages.
+
+        The command lines completed by this call are kept in commands.
+        """
+        self.commands = []
+        if self.encrypted or not data:
+            return []
+        self.buffer += data
+        messages = []
+
+        while self.buffer:
+            if self.mode == "command":
+                eol = self.buffer.find(b"\n")
+                if eol < 0:
+                    break
+                line = bytes(self.buffer[:eol]).rstrip(b"\r")
+                del self.buffer[:eol + 1]
+                self.commands.append(line)
+                verb, _, arg = line.partition(b" ")
+                verb = verb.upper()
+                if verb == b"DATA":
+                    self.mode = "data"
+                    self.body = bytearray()
+                    self.scanned = 0
+                elif verb == b"BDAT":
+                    size, _, last = arg.strip().partition(b" ")
+                    try:
+                        self.bdat_remaining = int(size)
+                    except ValueError:
+                        continue
+                    self.bdat_last = last.strip().upper() == b"LAST"
+                    self.mode = "bdat"
+                elif verb == b"STARTTLS":
+                    # everything after this is TLS; nothing more to extract
+                    self.encrypted = True
+                    self.buffer.clear()
+                    break
+
+            elif self.mode == "data":
+                self.body += self.buffer
+                self.buffer.clear()
+                # the terminating "." may also be the very first line of the body
+                if self.body.startswith(b".\r\n"):
+                    end, skip = 0, 3
+                else:
+                    end = self.body.find(b"\r\n.\r\n", max(0, self.scanned - 4))
+                    skip = 5
+                if end < 0:
+                    self.scanned = len(self.body)
+                    break
+                message = bytes(self.body[:end + 2]) if end else b""
+                self.buffer = self.body[end + skip:]
+                self.body = bytearray()
+                self.mode = "command"
+                messages.append(_undo_dot_stuffing(message))
+
+            else:  # bdat
+                take = min(self.bdat_remaining, len(self.buffer))
+                self.body += self.buffer[:take]
+                del self.buffer[:take]
+                self.bdat_remaining -= take
+                if self.bdat_remaining:
+                    break
+                self.mode = "command"
+                if self.bdat_last:
+                    messages.append(bytes(self.body))
+                    self.body = bytearray()
+
+        return messages
+
+
+class _SmtpServerStream:
+    """Server-to-client line splitter that picks out reply lines."""
+
+    __slots__ = ("buffer", "encrypted", "tls_pending")
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.encrypted = False
+        self.tls_pending = False
+
+    def feed(self, data):
+        """Consume in-order server bytes and return the list of complete reply lines."""
+        if self.encrypted or not data:
+            return []
+        self.buffer += data
+        lines = []
+        while True:
+            eol = self.buffer.find(b"\n")
+            if eol < 0:
+                break
+            line = bytes(self.buffer[:eol]).rstrip(b"\r")
+            del self.buffer[:eol + 1]
+            lines.append(line)
+            if self.tls_pending and line[:3].isdigit() and line[3:4] != b"-":
+                # reply to STARTTLS; the handshake follows
+                self.encrypted = True
+                self.buffer.clear()
+                break
+        if len(self.buffer) > 65536:
+            self.buffer.clear()  # not line-oriented; don't grow forever
+        return lines
+
+
+def _undo_dot_stuffing(data):
+    if data.startswith(b".."):
+        data = data[1:]
+    return data.replace(b"\r\n..", b"\r\n.")
+
+
+class _Connection:
+    __slots__ = ("stream_id", "client", "client_dir", "server_dir", "parser", "server_parser", "fins")
+
+    def __init__(self, stream_id, client):
+        self.stream_id = stream_id
+        self.client = client
+        self.client_dir = _Direction()
+        self.server_dir = _Direction()
+        self.parser = _SmtpClientStream()
+        self.server_parser = _SmtpServerStream()
+        self.fins = 0
+
+
+class SmtpReassembler:
+    """
+    Reassemble SMTP connections from TCP segments.
+
+    Each connection gets a sequential stream number in order of first
+    appearance, like tshark's tcp.stream. Feed segments in capture order.
+    """
+
+    def __init__(self, smtp_ports=None):
+        self.smtp_ports = set(smtp_ports or SMTP_PORTS)
+        self.connections = {}
+        self.next_stream_id = 0
+
+    def _connection_for(self, seg):
+        src = (seg.src_ip, seg.src_port)
+        dst = (seg.dst_ip, seg.dst_port)
+        key = ordered_endpoints(src, dst)
+        conn = self.connections.get(key)
+
+        if conn is None:
+            if seg.src_port not in self.smtp_ports and seg.dst_port not in self.smtp_ports:
+                return key, None
+            if seg.flags & TCP_SYN:
+                # SYN without ACK comes from the client, SYN/ACK from the server
+                client = src if not seg.flags & TCP_ACK else dst
+            elif seg.dst_port in self.smtp_ports:
+                client = src
+            else:
+                client = dst
+            conn = _Connection(self.next_stream_id, client)
+            self.next_stream_id += 1
+            self.connections[key] = conn
+        return key, conn
+
+    def feed(self, seg):
+        """
+        Process one TCP segment.
+
+        Args:
+            seg: TcpSegment from decode_tcp()
+
+        Returns:
+            List of SmtpMessage completed by this segment
+        """
+        return self.feed_frame(seg, with_flow=False)[1]
+
+    def feed_frame(self, seg, with_flow=True):
+        """
+        Process one TCP segment and describe it as an SMTP frame.
+
+        Args:
+            seg: TcpSegment from decode_tcp()
+            with_flow: Build the frame's flow record (skipped by feed())
+
+        Returns:
+            Tuple of (flow, messages): the network_flows.ndjson record for the
+            frame (None when it carries no SMTP payload) and the list of
+            SmtpMessage completed by this segment
+        """
+        key, conn = self._connection_for(seg)
+        if conn is None:
+            return None, []
+
+        from_client = (seg.src_ip, seg.src_port) == conn.client
+        direction = conn.client_dir if from_client else conn.server_dir
+        was_encrypted = conn.parser.encrypted if from_client else conn.server_parser.encrypted
+        data = direction.push(seg.seq, seg.flags, seg.payload)
+
+        messages = []
+        commands = replies = ()
+        if from_client:
+            for raw in conn.parser.feed(data):
+                messages.append(SmtpMessage(conn.stream_id, seg.timestamp, raw))
+            commands = conn.parser.commands
+            if conn.parser.encrypted:
+                conn.server_parser.tls_pending = True
+        else:
+            replies = [line for line in conn.server_parser.feed(data) if line[:3].isdigit()]
+
+        flow = None
+        if with_flow and seg.payload:
+            flow = _frame_flow(seg, conn.stream_id, commands, replies, was_encrypted)
+
+        if seg.flags & TCP_RST:
+            del self.connections[key]
+        elif seg.flags & TCP_FIN:
+            conn.fins += 1
+            if conn.fins >= 2:
+                del self.connections[key]
+        return flow, messages
+
+
+def _frame_flow(seg, stream_id, commands, replies, encrypted):
+    command_line = req_command = req_parameter = None
+    response_code = response = tls_content_type = None
+
+    if commands:
+        lines = [line.decode("utf-8", errors="replace") for line in commands]
+        command_line = LINE_SEPARATOR.join(lines)
+        verb, _, param = lines[0].partition(" ")
+        req_command = verb.upper() or None
+        req_parameter = param or None
+    elif replies:
+        response_code = int(replies[0][:3])
+        response = LINE_SEPARATOR.join(line.decode("utf-8", errors="replace") for line in replies)
+    elif encrypted and seg.payload[0] in (20, 21, 22, 23):
+        tls_content_type = str(seg.payload[0])
+
+    return make_flow(
+        seg.timestamp, seg.src_ip, seg.src_port, seg.dst_ip, seg.dst_port,
+        smtp_command_line=command_line,
+        smtp_req_command=req_command,
+        smtp_req_parameter=req_parameter,
+        smtp_response_code=response_code,
+        smtp_response=response,
+        tcp_len=len(seg.payload),
+        frame_len=seg.frame_len,
+        tls_content_type=tls_content_type,
+        tcp_stream=stream_id,
+    )
+
+
+def connection_key(seg):
+    """Direction-independent 4-tuple of a TcpSegment's connection."""
+    return ordered_endpoints((seg.src_ip, seg.src_port), (seg.dst_ip, seg.dst_port))
+
+
+def iter_tcp_segments(path, prefilter=None):
+    """
+    Iterate over the TCP segments of a capture file.
+
+    Args:
+        path: Path to the PCAP/PCAPNG file
+        prefilter: Optional predicate; segments it rejects are dropped here,
+            before any reassembly (see capture_filter.CaptureFilter)
+
+    Yields:
+        TcpSegment for every IPv4/IPv6 TCP frame
+    """
+    for ts, linktype, frame, orig_len in iter_packets(path):
+        seg = decode_tcp(ts, linktype, frame, orig_len)
+        if seg is not None and (prefilter is None or prefilter(seg)):
+            yield seg
+
+
+def iter_smtp_messages(path, smtp_ports=None, prefilter=None):
+    """
+    Stream the email messages carried by SMTP in a capture file.
+
+    Args:
+        path: Path to the PCAP/PCAPNG file
+        smtp_ports: Server ports to treat as SMTP (defaults to SMTP_PORTS)
+        prefilter: Optional TcpSegment predicate applied before reassembly
+
+    Yields:
+        SmtpMessage(tcp_stream, timestamp, raw) for every DATA/BDAT payload
+    """
+    reassembler = SmtpReassembler(smtp_ports)
+    for seg in iter_tcp_segments(path, prefilter):
+        yield from reassembler.feed(seg)
+
+
+def iter_smtp_capture(path, smtp_ports=None, prefilter=None):
+    """
+    Decode a capture once and stream both SMTP frames and email messages.
+
+    Args:
+        path: Path to the PCAP/PCAPNG file
+        smtp_ports: Server ports to treat as SMTP (defaults to SMTP_PORTS)
+        prefilter: Optional TcpSegment predicate applied before reassembly
+
+    Yields:
+        ("flow", flow_dict) for every SMTP frame and ("email", SmtpMessage)
+        for every message, in capture order
+    """
+    reassembler = SmtpReassembler(smtp_ports)
+    for seg in iter_tcp_segments(path, prefilter):
+        flow, messages = reassembler.feed_frame(seg)
+        if flow is not None:
+            yield "flow", flow
+        for message in messages:
+            yield "email", message
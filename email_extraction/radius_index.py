@@ -0,0 +1,295 @@
+"""
+RADIUS accounting session index for subscriber attribution.
+
+Accounting Start/Interim-Update/Stop records from local files (FreeRADIUS
+"detail" files, or CSV) are paired per Acct-Session-Id into sessions: a
+Framed-IP-Address held by a user between two times. The sessions are written
+once into a column-oriented binary index sorted by (IP, start). Opening it
+just memory-maps the file, so it is ready instantly on every later run, and a
+lookup of (IP, time) is a pair of bisects over the mapped columns. Any change
+to the set of accounting files it was built from rebuilds it.
+"""
+
+import csv
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+
+from cgnat_index import ipv4_int, to_epoch
+from column_index import ColumnFile, StringTable, build_if_stale, write_columns
+from record_io import open_text
+
+MAGIC = b"RADIDX01"
+
+# Sessions with no Stop record are treated as lasting until this time
+OPEN_END = float("inf")
+
+# CSV column names (override to match the accounting export)
+CSV_COLUMNS = {
+    "timestamp": "timestamp",
+    "status_type": "acct_status_type",
+    "framed_ip": "framed_ip_address",
+    "session_id": "acct_session_id",
+    "username": "user_name",
+    "calling_station_id": "calling_station_id",
+    "session_time": "acct_session_time",
+}
+
+# detail-file attribute -> CSV column key
+DETAIL_ATTRIBUTES = {
+    "Acct-Status-Type": "status_type",
+    "Framed-IP-Address": "framed_ip",
+    "Acct-Session-Id": "session_id",
+    "User-Name": "username",
+    "Calling-Station-Id": "calling_station_id",
+    "Acct-Session-Time": "session_time",
+    "Event-Timestamp": "event_timestamp",
+    "Timestamp": "timestamp",
+}
+
+
+# ---------------------------------------------------------------------------
+# Accounting records
+# ---------------------------------------------------------------------------
+
+def iter_detail_records(path):
+    """
+    Iterate over the records of a FreeRADIUS detail file.
+
+    Yields:
+        Dicts keyed like CSV_COLUMNS (plus "event_timestamp" and "header_time")
+    """
+    record = {}
+    with open_text(path) as f:
+        for line in f:
+            if not line.strip():
+                if record:
+                    yield record
+                record = {}
+            elif not line[0].isspace():
+                # record header, e.g. "Mon Jan  1 00:00:00 2024" (local time)
+                if record:
+                    yield record
+                try:
+                    record = {"header_time": time.mktime(time.strptime(line.strip(), "%a %b %d %H:%M:%S %Y"))}
+                except ValueError:
+                    record = {}
+            else:
+                name, sep, value = line.strip().partition(" = ")
+                key = DETAIL_ATTRIBUTES.get(name)
+                if sep and key:
+                    record[key] = value.strip().strip('"')
+    if record:
+        yield record
+
+
+def iter_csv_records(path, columns=None):
+    """
+    Iterate over the records of a CSV accounting export.
+
+    Yields:
+        Dicts keyed like CSV_COLUMNS
+    """
+    columns = dict(CSV_COLUMNS, **(columns or {}))
+    with open_text(path) as f:
+        for row in csv.DictReader(f):
+            yield {key: row.get(name) for key, name in columns.items()}
+
+
+def iter_accounting_records(path):
+    """Records of a detail or CSV (*.csv, *.csv.gz) accounting file."""
+    name = path.lower()
+    if name.endswith(".csv") or name.endswith(".csv.gz"):
+        return iter_csv_records(path)
+    return iter_detail_records(path)
+
+
+def record_time(record):
+    """Epoch time an accounting record describes."""
+    for key in ("event_timestamp", "timestamp"):
+        t = to_epoch(record.get(key))
+        if t is not None:
+            return t
+    return record.get("header_time")
+
+
+def pair_sessions(records):
+    """
+    Pair Start/Interim-Update/Stop records into sessions.
+
+    Records are paired by (Acct-Session-Id, IP). Records without a session id
+    are paired by IP in the order they come: a Stop ends the IP's session and
+    the next Start begins a new one (a Start while a session is still open
+    ends that one), so a reassigned address is not credited to its first user.
+
+    Args:
+        records: Iterable of accounting record dicts, oldest first
+
+    Returns:
+        List of (ip_int, start, end, username, session_id, calling_station_id)
+    """
+    sessions = {}
+    sequence = {}  # ip -> number of its current session without a session id
+    for record in records:
+        ip = ipv4_int(record.get("framed_ip"))
+        t = record_time(record)
+        if ip is None or t is None:
+            continue
+        status = (record.get("status_type") or "").strip().lower()
+        session_id = record.get("session_id") or ""
+        if session_id:
+            key = (session_id, ip, 0)
+        else:
+            key = ("", ip, sequence.get(ip, 0))
+            if status == "start" and key in sessions:
+                if sessions[key][1] == OPEN_END:
+                    sessions[key][1] = t
+                key = ("", ip, sequence.setdefault(ip, 0) + 1)
+                sequence[ip] = key[2]
+
+        session = sessions.get(key)
+        if session is None:
+            start = t
+            if status == "stop" or status.startswith("interim"):
+                # no Start seen: derive it from the session time if we have it
+                elapsed = to_epoch(record.get("session_time"))
+                if elapsed is not None:
+                    start = t - elapsed
+            session = sessions[key] = [start, OPEN_END, record.get("username") or "",
+                                       record.get("calling_station_id") or ""]
+        else:
+            session[0] = min(session[0], t)
+        if status == "stop":
+            session[1] = t
+            if not session_id:
+                sequence[ip] = key[2] + 1
+
+    return [(ip, s[0], s[1], s[2], sid, s[3]) for (sid, ip, _), s in sessions.items()]
+
+
+# ---------------------------------------------------------------------------
+# On-disk index
+# ---------------------------------------------------------------------------
+
+# ips, starts, ends, usernames, session ids, calling station ids
+COLUMN_FORMATS = ("I", "d", "d", "I", "I", "I")
+
+
+def write_index(path, sessions):
+    """
+    Write sessions to a binary index file (column_index.py layout).
+
+    Columns: ips (uint32), starts (double), ends (double), usernames /
+    session ids / calling station ids (uint32 indexes into the string table).
+
+    Args:
+        path: Index file path
+        sessions: List from pair_sessions()
+    """
+    sessions = sorted(sessions, key=lambda s: (s[0], s[1]))
+    strings = StringTable()
+    columns = [
+        array("I", (s[0] for s in sessions)),
+        array("d", (s[1] for s in sessions)),
+        array("d", (s[2] for s in sessions)),
+        array("I", (strings.intern(s[3]) for s in sessions)),
+        array("I", (strings.intern(s[4]) for s in sessions)),
+        array("I", (strings.intern(s[5]) for s in sessions)),
+    ]
+    write_columns(path, MAGIC, len(sessions), columns, strings.strings)
+
+
+class RadiusIndex:
+    """
+    Memory-mapped RADIUS session index.
+
+    Args:
+        path: Index file written by write_index()
+    """
+
+    def __init__(self, path):
+        self._columns = ColumnFile(path, MAGIC, COLUMN_FORMATS, "RADIUS")
+        (self.ips, self.starts, self.ends, self.usernames,
+         self.session_ids, self.calling_station_ids) = self._columns.columns
+        self._string = self._columns.string
+
+    def __len__(self):
+        return len(self.ips)
+
+    def lookup(self, ip, t):
+        """
+        Session that held a Framed-IP-Address at time t.
+
+        Args:
+            ip: IPv4 address string
+            t: Epoch seconds
+
+        Returns:
+            Session dict (username, acct_session_id, calling_station_id,
+            session_start, session_stop), or None
+        """
+        ip_int = ipv4_int(ip)
+        if ip_int is None or t is None:
+            return None
+        lo = bisect_left(self.ips, ip_int)
+        hi = bisect_right(self.ips, ip_int, lo)
+        j = bisect_right(self.starts, t, lo, hi) - 1
+        if j < lo or self.ends[j] < t:
+            return None
+        end = self.ends[j]
+        return {
+            "framed_ip": ip,
+            "username": self._string(self.usernames[j]),
+            "acct_session_id": self._string(self.session_ids[j]),
+            "calling_station_id": self._string(self.calling_station_ids[j]),
+            "session_start": self.starts[j],
+            "session_stop": None if end == OPEN_END else end,
+        }
+
+    def correlate(self, flow, cgnat=None):
+        """
+        The correlation.radius block for a flow.
+
+        The subscriber's inside address from a CGNAT match is tried first,
+        then the flow's source and destination addresses.
+
+        Args:
+            flow: Flow record
+            cgnat: correlation.cgnat block for the same flow, if any
+
+        Returns:
+            Dict with session_found=True and the session, or {"session_found": False}
+        """
+        t = flow.get("timestamp")
+        candidates = []
+        if cgnat and cgnat.get("matched"):
+            candidates.append(cgnat.get("private_ip"))
+        candidates += [flow.get("src_ip"), flow.get("dst_ip")]
+        for ip in candidates:
+            session = self.lookup(ip, t)
+            if session is not None:
+                return dict(session_found=True, **session)
+        return {"session_found": False}
+
+    def close(self):
+        self._columns.close()
+
+
+def load_or_build(log_paths, index_path):
+    """
+    Open the index, rebuilding it first if the set of accounting files changed
+    (see column_index.build_if_stale()).
+
+    Args:
+        log_paths: RADIUS accounting files (detail or CSV, .gz allowed)
+        index_path: Index file
+
+    Returns:
+        RadiusIndex
+    """
+    def build(path):
+        records = (r for p in log_paths for r in iter_accounting_records(p))
+        write_index(path, pair_sessions(records))
+
+    build_if_stale(index_path, log_paths, build)
+    return RadiusIndex(index_path)
@@ -0,0 +1,110 @@
+"""
+Record files exchanged between pipeline stages.
+
+Stages stream their records as newline-delimited JSON (one record per line),
+so no stage ever holds a whole dataset in memory. The format follows the file
+name:
+
+    *.ndjson / *.jsonl          NDJSON
+    *.ndjson.gz / *.jsonl.gz    gzip-compressed NDJSON
+    *.json (or *.json.gz)       pretty-printed JSON array, for export only
+
+Readers accept all of them; a JSON array input is loaded whole (it is only
+supported for files written by older versions of the pipeline).
+"""
+
+import gzip
+import json
+
+
+def is_gzip(path):
+    return str(path).lower().endswith(".gz")
+
+
+def is_json_array(path):
+    name = str(path).lower()
+    if name.endswith(".gz"):
+        name = name[:-3]
+    return name.endswith(".json")
+
+
+def open_text(path, mode="r"):
+    """Open a text file for "r", "w" or "a", transparently gzip-compressed for *.gz."""
+    if is_gzip(path):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+class RecordWriter:
+    """
+    Write records one at a time to an NDJSON (or JSON array) file.
+
+    Use as a context manager; count holds the number of records written.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self.array = is_json_array(path)
+        self._f = open_text(path, "w")
+        if self.array:
+            self._f.write("[")
+
+    def write(self, record):
+        if self.array:
+            self._f.write(",\n" if self.count else "\n")
+            self._f.write(json.dumps(record, indent=2, ensure_ascii=False))
+        else:
+            self._f.write(json.dumps(record, ensure_ascii=False))
+            self._f.write("\n")
+        self.count += 1
+
+    def close(self):
+        if self._f.closed:
+            return
+        if self.array:
+            self._f.write("\n]" if self.count else "]")
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_records(path, records):
+    """
+    Stream an iterable of records to a file (format chosen by the file name).
+
+    Args:
+        path: Output file path
+        records: Iterable of JSON-serializable dicts
+
+    Returns:
+        Number of records written
+    """
+    with RecordWriter(path) as out:
+        for record in records:
+            out.write(record)
+    return out.count
+
+
+def iter_records(path):
+    """
+    Iterate over the records of an NDJSON file (or a legacy JSON array).
+
+    Args:
+        path: Input file path
+
+    Yields:
+        Record dicts
+    """
+    with open_text(path) as f:
+        if is_json_array(path):
+            # legacy/export format; not streamable
+            yield from json.load(f)
+            return
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
@@ -0,0 +1,219 @@
+"""
+SMTP session reconstruction from per-frame flow records.
+
+Flow records (network_flows.ndjson, in capture order) are folded into one
+compact document per SMTP conversation, keyed by tcp_stream (or connection
+4-tuple when the stream id is unknown). A small command/response state
+machine follows EHLO/HELO, MAIL FROM, RCPT TO, DATA, STARTTLS and QUIT and
+records the envelope, reply codes, byte counts and timings. It steps once per
+command or reply line, so a frame with pipelined commands (several RCPT TO in
+one segment, and their replies) counts every one of them. Sessions are
+emitted as soon as they end (QUIT answered, or idle for too long), so only
+open conversations are held in memory.
+"""
+
+import re
+
+from flow_join import connection_key
+from flow_records import LINE_SEPARATOR
+
+# Sessions with no frame for this long (seconds, capture time) are closed
+IDLE_TIMEOUT = 600.0
+
+# Check for idle sessions every this many frames
+SWEEP_EVERY = 10000
+
+ADDRESS_RE = re.compile(r"<([^>]*)>")
+
+
+def frame_commands(flow):
+    """(command, parameter) of every command line of a flow record, in order."""
+    lines = (flow.get("smtp_command_line") or "").split(LINE_SEPARATOR)
+    commands = []
+    for line in lines:
+        verb, _, parameter = line.strip().partition(" ")
+        if verb:
+            commands.append((verb.upper(), parameter or None))
+    if not commands and flow.get("smtp_req_command"):
+        commands.append((flow["smtp_req_command"].upper(), flow.get("smtp_req_parameter")))
+    return commands
+
+
+def frame_reply_codes(flow):
+    """Codes of the final reply lines of a flow record (multiline continuations are skipped)."""
+    codes = []
+    for line in (flow.get("smtp_response") or "").split(LINE_SEPARATOR):
+        line = line.strip()
+        if line[:3].isdigit() and line[3:4] != "-":
+            codes.append(int(line[:3]))
+    if not codes and flow.get("smtp_response_code") is not None:
+        codes.append(flow["smtp_response_code"])
+    return codes
+
+
+def envelope_address(parameter):
+    """Address from a MAIL FROM / RCPT TO parameter ("FROM:<a@b.c> SIZE=1" -> "a@b.c")."""
+    if not parameter:
+        return None
+    match = ADDRESS_RE.search(parameter)
+    if match:
+        return match.group(1)
+    _, _, value = parameter.partition(":")
+    return value.strip().split(" ")[0] or None
+
+
+class SmtpSession:
+    """State of one SMTP conversation while its frames are folded in."""
+
+    def __init__(self, key, flow):
+        self.key = key
+        self.tcp_stream = flow.get("tcp_stream")
+        self.client = None
+        self.server = None
+        self.start = flow["timestamp"]
+        self.end = flow["timestamp"]
+        self.frames = 0
+        self.client_bytes = 0
+        self.server_bytes = 0
+        self.helo = None
+        self.mail_from = []
+        self.rcpt_to = []
+        self.messages = 0
+        self.commands = {}
+        self.response_codes = {}
+        self.starttls = False
+        self.quit = False
+        self.closed = False
+        self.state = "connected"
+
+    def _orient(self, flow, from_client):
+        src = (flow.get("src_ip"), flow.get("src_port"))
+        dst = (flow.get("dst_ip"), flow.get("dst_port"))
+        self.client, self.server = (src, dst) if from_client else (dst, src)
+
+    def add(self, flow):
+        """Fold one flow record into the session."""
+        self.end = max(self.end, flow["timestamp"])
+        self.frames += 1
+
+        commands = frame_commands(flow)
+        codes = frame_reply_codes(flow)
+
+        if self.client is None:
+            if commands:
+                self._orient(flow, from_client=True)
+            elif codes:
+                self._orient(flow, from_client=False)
+
+        from_client = self.client is not None and (flow.get("src_ip"), flow.get("src_port")) == self.client
+        if from_client:
+            self.client_bytes += flow.get("tcp_len") or 0
+        else:
+            self.server_bytes += flow.get("tcp_len") or 0
+
+        for command, parameter in commands:
+            self._command(command, parameter)
+        for code in codes:
+            self._reply(code)
+
+    def _command(self, command, parameter):
+        self.commands[command] = self.commands.get(command, 0) + 1
+        if command in ("EHLO", "HELO"):
+            self.helo = parameter
+            self.state = "greeted"
+        elif command == "MAIL":
+            address = envelope_address(parameter)
+            if address is not None and address not in self.mail_from:
+                self.mail_from.append(address)
+            self.state = "mail"
+        elif command == "RCPT":
+            address = envelope_address(parameter)
+            if address is not None and address not in self.rcpt_to:
+                self.rcpt_to.append(address)
+            self.state = "rcpt"
+        elif command == "DATA":
+            self.state = "data"
+        elif command == "STARTTLS":
+            self.starttls = True
+            self.state = "starttls"
+        elif command == "QUIT":
+            self.quit = True
+            self.state = "quit"
+
+    def _reply(self, code):
+        key = str(code)
+        self.response_codes[key] = self.response_codes.get(key, 0) + 1
+        if self.state == "data" and code == 354:
+            self.state = "message"
+        elif self.state == "message" and 200 <= code < 300:
+            self.messages += 1  # message accepted after the final "."
+            self.state = "greeted"
+        elif self.state == "starttls" and code == 220:
+            self.state = "tls"  # nothing after this is readable
+        elif self.state == "quit" and code == 221:
+            self.closed = True
+
+    def document(self):
+        """The compact session document."""
+        def endpoint(side):
+            return {"ip": side[0], "port": side[1]} if side else {"ip": None, "port": None}
+
+        return {
+            "tcp_stream": self.tcp_stream,
+            "client": endpoint(self.client),
+            "server": endpoint(self.server),
+            "start": self.start,
+            "end": self.end,
+            "duration": round(self.end - self.start, 6),
+            "frames": self.frames,
+            "client_bytes": self.client_bytes,
+            "server_bytes": self.server_bytes,
+            "helo": self.helo,
+            "mail_from": self.mail_from,
+            "rcpt_to": self.rcpt_to,
+            "messages": self.messages,
+            "commands": self.commands,
+            "response_codes": self.response_codes,
+            "starttls": self.starttls,
+            "quit": self.quit,
+            "final_state": self.state,
+        }
+
+
+def _session_key(flow):
+    stream = flow.get("tcp_stream")
+    return ("stream", stream) if stream is not None else ("conn", connection_key(flow))
+
+
+def iter_sessions(flows, idle_timeout=IDLE_TIMEOUT):
+    """
+    Fold a stream of flow records into SMTP session documents.
+
+    Args:
+        flows: Iterable of flow records in capture (time) order
+        idle_timeout: Close sessions idle for this many seconds of capture time
+
+    Yields:
+        Session documents, each as soon as its conversation has ended
+    """
+    active = {}
+    seen = 0
+    for flow in flows:
+        if flow.get("timestamp") is None:
+            continue
+        key = _session_key(flow)
+        session = active.get(key)
+        if session is None:
+            session = active[key] = SmtpSession(key, flow)
+        session.add(flow)
+        if session.closed:
+            yield active.pop(key).document()
+
+        seen += 1
+        if seen % SWEEP_EVERY == 0:
+            cutoff = flow["timestamp"] - idle_timeout
+            for key in [k for k, s in active.items() if s.end < cutoff]:
+                yield active.pop(key).document()
+
+    for session in sorted(active.values(), key=lambda s: s.start):
+        yield session.document()
@@ -0,0 +1,207 @@
+"""
+Local cache of raw tshark output.
+
+Dissecting a large capture is the slowest step of the pipeline, yet its output
+only depends on the capture, the tshark version and the arguments (display
+filter, field list, export protocol). Field output is stored gzip-compressed
+and exported objects as a .tar.gz, under a key hashed from exactly those
+inputs, so re-running an extraction script after changing only the downstream
+layout replays the cached output instead of running tshark again. The cache is
+kept under a size cap by evicting the least recently used entries.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import tarfile
+import tempfile
+
+from flow_records import iter_tshark_lines
+from manifest import file_sha256
+from record_io import open_text
+
+# Total size of cached entries; least recently used entries are evicted beyond it
+MAX_CACHE_BYTES = 4 * 1024 ** 3
+
+# gzip level for cached output (speed matters more than ratio here)
+COMPRESS_LEVEL = 6
+
+CAPTURES_FILE = "captures.json"
+
+
+def tshark_version(tshark):
+    """First line of `tshark --version`, e.g. "TShark (Wireshark) 4.2.5"."""
+    out = subprocess.run([tshark, "--version"], capture_output=True, text=True, check=True).stdout
+    return out.splitlines()[0].strip() if out else ""
+
+
+class TsharkCache:
+    """
+    tshark output cache in a local directory.
+
+    Args:
+        root: Cache directory (created if missing)
+        tshark: Path to the tshark binary (its version is part of every key)
+        max_bytes: Size cap of all entries together
+    """
+
+    def __init__(self, root, tshark, max_bytes=MAX_CACHE_BYTES):
+        self.root = root
+        self.tshark = tshark
+        self.max_bytes = max_bytes
+        self.version = tshark_version(tshark)
+        os.makedirs(root, exist_ok=True)
+
+        # capture digests by (path, size, mtime), so unchanged captures are not re-hashed
+        self._captures_path = os.path.join(root, CAPTURES_FILE)
+        try:
+            with open(self._captures_path, encoding="utf-8") as f:
+                self._captures = json.load(f)
+        except (OSError, ValueError):
+            self._captures = {}
+
+    def capture_digest(self, pcap):
+        """SHA-256 of a capture, remembered while its size and mtime are unchanged."""
+        st = os.stat(pcap)
+        stat_key = f"{os.path.abspath(pcap)}|{st.st_size}|{st.st_mtime_ns}"
+        digest = self._captures.get(stat_key)
+        if digest is None:
+            digest = self._captures[stat_key] = file_sha256(pcap)
+            tmp_path = self._captures_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._captures, f)
+            os.replace(tmp_path, self._captures_path)
+        return digest
+
+    def key(self, pcap, args):
+        """
+        Cache key of one tshark run.
+
+        Args:
+            pcap: Capture file
+            args: tshark arguments other than the binary and -r (filter, fields, ...)
+
+        Returns:
+            Hex digest
+        """
+        material = json.dumps([self.capture_digest(pcap), self.version, list(args)])
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def _entry(self, key, suffix):
+        return os.path.join(self.root, key[:2], key + suffix)
+
+    def _hit(self, path):
+        if not os.path.exists(path):
+            return False
+        os.utime(path)  # mark as recently used
+        return True
+
+    def _store(self, tmp_path, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp_path, path)
+        self.evict(keep=path)
+
+    def iter_lines(self, pcap, args):
+        """
+        tshark text output for a capture, from the cache or from a fresh run.
+
+        On a miss tshark runs through a pipe as usual and its output is written
+        to the cache while it is consumed; the entry is only kept if the
+        consumer reads it to the end.
+
+        Args:
+            pcap: Capture file
+            args: tshark arguments other than the binary and -r
+
+        Yields:
+            Output lines (without the trailing newline)
+        """
+        path = self._entry(self.key(pcap, args), ".txt.gz")
+        if self._hit(path):
+            with open_text(path) as f:
+                for line in f:
+                    yield line.rstrip("\n")
+            return
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        os.close(fd)
+        try:
+            with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=COMPRESS_LEVEL) as out:
+                for line in iter_tshark_lines([self.tshark, "-r", pcap] + list(args)):
+                    out.write(line)
+                    out.write("\n")
+                    yield line
+            self._store(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def export_objects(self, pcap, protocol, out_dir, args=()):
+        """
+        Export protocol objects (tshark --export-objects) into out_dir, from the
+        cache or from a fresh run.
+
+        Args:
+            pcap: Capture file
+            protocol: Export protocol, e.g. "imf"
+            out_dir: Directory the objects are written into
+            args: Extra tshark arguments, e.g. ["-Y", display_filter]
+
+        Returns:
+            Sorted list of exported file paths
+        """
+        path = self._entry(self.key(pcap, ["--export-objects", protocol] + list(args)), ".tar.gz")
+        if not self._hit(path):
+            with tempfile.TemporaryDirectory(dir=self.root) as tmp_dir:
+                export_dir = os.path.join(tmp_dir, "objects")
+                os.makedirs(export_dir)
+                cmd = [self.tshark, "-r", pcap, "--export-objects", f"{protocol},{export_dir}"] + list(args)
+                subprocess.run(cmd, check=True)
+                tmp_path = os.path.join(tmp_dir, "objects.tar.gz")
+                with tarfile.open(tmp_path, "w:gz", compresslevel=COMPRESS_LEVEL) as tar:
+                    for fname in sorted(os.listdir(export_dir)):
+                        tar.add(os.path.join(export_dir, fname), arcname=fname)
+                self._store(tmp_path, path)
+
+        os.makedirs(out_dir, exist_ok=True)
+        paths = []
+        with tarfile.open(path, "r:gz") as tar:
+            for member in tar:
+                if not member.isfile() or os.path.basename(member.name) != member.name:
+                    continue
+                target = os.path.join(out_dir, member.name)
+                with tar.extractfile(member) as src, open(target, "wb") as dst:
+                    shutil.copyfileobj(src, dst)
+                paths.append(target)
+        return sorted(paths)
+
+    def entries(self):
+        """List of (mtime, size, path) of all cached entries."""
+        found = []
+        for dirpath, _, fnames in os.walk(self.root):
+            for fname in fnames:
+                if fname.endswith(".txt.gz") or fname.endswith(".tar.gz"):
+                    p = os.path.join(dirpath, fname)
+                    st = os.stat(p)
+                    found.append((st.st_mtime, st.st_size, p))
+        return found
+
+    def evict(self, keep=None):
+        """
+        Delete least recently used entries until the cache fits max_bytes.
+
+        Args:
+            keep: Entry never to evict (the one just stored)
+        """
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, p in entries:
+            if total <= self.max_bytes:
+                break
+            if p == keep:
+                continue
+            os.remove(p)
+            total -= size